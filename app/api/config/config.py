@@ -14,7 +14,20 @@ class Settings(BaseSettings):
     cosmos_key: str = ""
     database_name: str = "state"
     issues_container: str = "issues"
+    cosmos_max_concurrent_batches: int = 8
     feedback_container: str = "feedback"
+    leases_container: str = "leases"
+    review_lease_ttl_seconds: int = 60
+    review_follow_interval_seconds: float = 2
+    reviews_container: str = "reviews"
+    review_queue_backend: str = "none"
+    review_queue_path: str = "review_jobs.sqlite"
+    review_queue_max_size: int = 100
+    review_queue_poll_interval_seconds: float = 1
+    review_workers: int = 4
+    review_job_max_attempts: int = 3
+    review_job_retry_delay_seconds: float = 10
+    review_job_visibility_timeout_seconds: float = 120
     storage_account_url: str = ""
     storage_container_name: str = "documents"
     subscription_id: str = ""
@@ -24,6 +37,12 @@ class Settings(BaseSettings):
     flow_endpoint_name: str = ""
     flow_app_name: str = ""
     flow_streaming_batch_size: int = 100
+    flow_connect_timeout_seconds: float = 10
+    flow_read_timeout_seconds: float = 600
+    flow_max_connections: int = 100
+    issues_page_size: int = 100
+    token_refresh_margin_seconds: int = 300
+    warm_up_on_startup: bool = True
     appinsights_instrumentation_key: str = "00000000-0000-0000-0000-000000000000"
     log_level: str = "INFO"
     model_config = SettingsConfigDict(env_file=".env")
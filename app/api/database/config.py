@@ -1,18 +1,23 @@
-from azure.cosmos import CosmosClient
-from azure.identity import DefaultAzureCredential
+from typing import Optional
+from azure.cosmos.aio import CosmosClient
 from config.config import settings
+from security.credentials import AsyncCachedTokenCredential, get_default_credential
+
+
+def create_cosmos_client(cosmos_url: str) -> CosmosClient:
+    """Create an async Cosmos client. Share one client per worker, so its connection pool is reused between requests."""
+    return CosmosClient(cosmos_url, AsyncCachedTokenCredential(get_default_credential()))
 
 
 class CosmosDBConfig:
-    def __init__(self, container_name) -> None:
-        """Initialize Cosmos DB configuration using settings."""
+    def __init__(self, container_name, client: Optional[CosmosClient] = None) -> None:
+        """Initialize Cosmos DB configuration using settings, and the shared Cosmos client if given."""
         self.cosmos_url = settings.cosmos_url
         self.database_name = settings.database_name
         self.container_name = container_name
 
         # Initialize the Cosmos client
-        default_credential = DefaultAzureCredential()
-        self.client = CosmosClient(self.cosmos_url, default_credential)
+        self.client = client or create_cosmos_client(self.cosmos_url)
 
     def get_client(self) -> CosmosClient:
         """Return the initialized Cosmos client."""
@@ -1,20 +1,51 @@
+import asyncio
+from collections import defaultdict
 from common.logger import get_logger
-from azure.cosmos.exceptions import CosmosHttpResponseError
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError
+from config.config import settings
 from database.config import CosmosDBConfig
-from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from azure.core import MatchConditions
+from azure.cosmos.aio import CosmosClient
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 
 logging = get_logger(__name__)
 
+# Cosmos DB limits a transactional batch to 100 operations
+# https://learn.microsoft.com/en-us/azure/cosmos-db/nosql/transactional-batch#limitations
+MAX_BATCH_OPERATIONS = 100
+
+
+class QueryPage(BaseModel):
+    items: List[Dict[str, Any]]
+    continuation_token: Optional[str] = None
+    request_charge: float = 0.0
+
+
+class BatchPatchResult(BaseModel):
+    items: List[Dict[str, Any]]
+    failed_ids: List[str] = []
+
+
 class CosmosDBClient:
-    def __init__(self, container_name: str) -> None:
-        """Initialize the CosmosDBClient, setting up the database and container."""
-        config = CosmosDBConfig(container_name)
+    def __init__(self, container_name: str, client: Optional[CosmosClient] = None) -> None:
+        """Initialize the CosmosDBClient, setting up the database and container on the shared client if given."""
+        config = CosmosDBConfig(container_name, client)
         self.client = config.get_client()
         self.database = self.client.get_database_client(config.get_database_name())
         self.container = self.database.get_container_client(container_name)
 
 
+    async def warm_up(self) -> None:
+        """
+        Read the container properties, which opens a connection to the account and caches its routing metadata
+        so the first request does not pay for it.
+        """
+        await self.container.read()
+        logging.info(f"Cosmos DB container {self.container.id} is ready.")
+
+
     async def store_item(self, item: Dict[str, any]) -> None:
         """
         Store an item in the Cosmos DB container.
@@ -22,13 +53,227 @@ class CosmosDBClient:
         :param item: A dictionary representing the item to store. Must contain an 'id' field.
         """
         try:
-            self.container.upsert_item(body=item)
+            await self.container.upsert_item(body=item)
             logging.info("Item stored successfully.")
         except CosmosHttpResponseError as e:
             logging.error(f"An error occurred while storing the item: {e}")
             raise e
 
 
+    async def store_items(self, items: List[Dict[str, Any]], partition_key_field: str) -> None:
+        """
+        Store items in the Cosmos DB container using transactional batches.
+
+        Items are grouped by partition key and upserted in batches of up to 100, with at most
+        `cosmos_max_concurrent_batches` batches in flight at once. Each batch succeeds or fails as a whole.
+
+        :param items: The items to store. Each must contain an 'id' field and the partition key field.
+        :param partition_key_field: The name of the field holding the partition key value.
+        """
+        partitions = defaultdict(list)
+        for item in items:
+            partitions[item[partition_key_field]].append(("upsert", (item,)))
+
+        try:
+            batch_count = len(await self._execute_batches(partitions))
+            logging.info(f"Stored {len(items)} items in {batch_count} batches.")
+        except CosmosBatchOperationError as e:
+            logging.error(f"Batch operation {e.error_index} failed while storing items: {e}")
+            raise e
+        except CosmosHttpResponseError as e:
+            logging.error(f"An error occurred while storing items: {e}")
+            raise e
+
+
+    async def patch_items(self, partition_key: str, item_ids: List[str], fields: Dict[str, Any]) -> BatchPatchResult:
+        """
+        Set the same fields on many items in one partition, using transactional batches.
+
+        Items are patched in batches of up to 100, with at most `cosmos_max_concurrent_batches` batches in flight
+        at once. Each batch succeeds or fails as a whole, independently of the others, so when some batches fail
+        the items of the other batches are still updated.
+
+        :param partition_key: The partition key of the items.
+        :param item_ids: The IDs of the items to update.
+        :param fields: A dictionary where keys are the top level fields to set and values are their new values.
+        :return: The updated items, and the IDs of the items in batches that failed.
+        :raises CosmosBatchOperationError: If every batch fails (e.g. with status 404 if an item does not exist),
+            in which case no item is updated.
+        """
+        patch_operations = [{"op": "set", "path": f"/{field}", "value": value} for field, value in fields.items()]
+        operations = [("patch", (item_id, patch_operations)) for item_id in item_ids]
+
+        results = await self._execute_batches({partition_key: operations}, return_exceptions=True)
+        items, failed_ids, errors = [], [], []
+        for i, batch_results in enumerate(results):
+            batch_ids = item_ids[i * MAX_BATCH_OPERATIONS:(i + 1) * MAX_BATCH_OPERATIONS]
+            if isinstance(batch_results, CosmosBatchOperationError):
+                logging.error(
+                    f"Batch operation {batch_results.error_index} failed while patching items: {batch_results}"
+                )
+            elif isinstance(batch_results, CosmosHttpResponseError):
+                logging.error(f"An error occurred while patching items: {batch_results}")
+            elif isinstance(batch_results, BaseException):
+                raise batch_results
+            else:
+                items += [operation["resourceBody"] for operation in batch_results]
+                continue
+            failed_ids += batch_ids
+            errors.append(batch_results)
+
+        if errors and not items:
+            raise errors[0]
+        logging.info(f"Patched {len(items)} items in {len(results) - len(errors)} batches, {len(failed_ids)} failed.")
+        return BatchPatchResult(items=items, failed_ids=failed_ids)
+
+
+    async def delete_items(self, partition_key: str, item_ids: List[str]) -> None:
+        """
+        Delete many items in one partition, using transactional batches of up to 100 items.
+
+        :param partition_key: The partition key of the items.
+        :param item_ids: The IDs of the items to delete.
+        """
+        try:
+            results = await self._execute_batches({partition_key: [("delete", (item_id,)) for item_id in item_ids]})
+            logging.info(f"Deleted {len(item_ids)} items in {len(results)} batches.")
+        except CosmosBatchOperationError as e:
+            logging.error(f"Batch operation {e.error_index} failed while deleting items: {e}")
+            raise e
+        except CosmosHttpResponseError as e:
+            logging.error(f"An error occurred while deleting items: {e}")
+            raise e
+
+
+    async def _execute_batches(
+        self, partitions: Dict[Any, List[Tuple]], return_exceptions: bool = False
+    ) -> List[Union[List[Dict[str, Any]], BaseException]]:
+        """
+        Execute operations as transactional batches of up to 100 per partition, with bounded concurrency.
+
+        :param partitions: A dictionary where keys are partition keys and values are the operations on that partition.
+        :param return_exceptions: optional - return the error of each batch that fails in place of its results,
+            instead of raising the first error.
+        :return: The operation results of each batch, in order.
+        """
+        batches = [
+            (partition_key, operations[i:i + MAX_BATCH_OPERATIONS])
+            for partition_key, operations in partitions.items()
+            for i in range(0, len(operations), MAX_BATCH_OPERATIONS)
+        ]
+        semaphore = asyncio.Semaphore(settings.cosmos_max_concurrent_batches)
+
+        async def execute_batch(partition_key: Any, batch_operations: List[Tuple]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.container.execute_item_batch(
+                    batch_operations=batch_operations,
+                    partition_key=partition_key
+                )
+
+        return await asyncio.gather(
+            *(execute_batch(partition_key, operations) for partition_key, operations in batches),
+            return_exceptions=return_exceptions
+        )
+
+
+    async def create_item(self, item: Dict[str, Any]) -> None:
+        """
+        Create an item in the Cosmos DB container, failing if an item with the same ID already exists.
+
+        :param item: A dictionary representing the item to create. Must contain an 'id' field.
+        :raises CosmosResourceExistsError: If the item already exists.
+        """
+        try:
+            await self.container.create_item(body=item)
+            logging.info("Item created successfully.")
+        except CosmosHttpResponseError as e:
+            if e.status_code != 409:
+                logging.error(f"An error occurred while creating the item: {e}")
+            raise e
+
+
+    async def replace_item(self, item: Dict[str, Any], etag: str) -> Dict[str, Any]:
+        """
+        Replace an item in the Cosmos DB container, only if it has not changed since the ETag was read.
+
+        :param item: A dictionary representing the new item. Must contain the 'id' of the item to replace.
+        :param etag: The ETag of the item when it was read.
+        :return: The replaced item.
+        :raises CosmosHttpResponseError: With status 404 if the item does not exist,
+            or 412 if the item has changed since the ETag was read.
+        """
+        try:
+            replaced = await self.container.replace_item(
+                item=item["id"], body=item, etag=etag, match_condition=MatchConditions.IfNotModified
+            )
+            logging.info("Item replaced successfully.")
+            return replaced
+        except CosmosHttpResponseError as e:
+            if e.status_code not in (404, 412):
+                logging.error(f"An error occurred while replacing the item: {e}")
+            raise e
+
+
+    async def delete_item(self, item_id: str, partition_key: str, etag: Optional[str] = None) -> None:
+        """
+        Delete an item from the Cosmos DB container, if it exists.
+
+        :param item_id: The ID of the item to delete.
+        :param partition_key: The partition key of the item.
+        :param etag: optional - only delete the item if it has not changed since this ETag was read.
+        :raises CosmosHttpResponseError: With status 412 if the item has changed since the ETag was read.
+        """
+        try:
+            await self.container.delete_item(
+                item=item_id,
+                partition_key=partition_key,
+                etag=etag,
+                match_condition=MatchConditions.IfNotModified if etag else None,
+            )
+            logging.info("Item deleted successfully.")
+        except CosmosHttpResponseError as e:
+            if e.status_code == 404:
+                return
+            if e.status_code == 412:
+                raise e
+            logging.error(f"An error occurred while deleting the item: {e}")
+            raise e
+
+
+    async def patch_item(
+        self,
+        item_id: str,
+        partition_key: str,
+        fields: Dict[str, Any],
+        etag: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Set fields of an item in the Cosmos DB container in a single round trip, without reading it first.
+
+        :param item_id: The ID of the item to update.
+        :param partition_key: The partition key of the item.
+        :param fields: A dictionary where keys are the top level fields to set and values are their new values.
+        :param etag: optional - only update the item if it has not changed since this ETag was read.
+        :return: The updated item.
+        :raises CosmosHttpResponseError: With status 404 if the item does not exist,
+            or 412 if the item has changed since the ETag was read.
+        """
+        try:
+            item = await self.container.patch_item(
+                item=item_id,
+                partition_key=partition_key,
+                patch_operations=[{"op": "set", "path": f"/{field}", "value": value} for field, value in fields.items()],
+                etag=etag,
+                match_condition=MatchConditions.IfNotModified if etag else None,
+            )
+            logging.info("Item patched successfully.")
+            return item
+        except CosmosHttpResponseError as e:
+            if e.status_code not in (404, 412):
+                logging.error(f"An error occurred while patching the item: {e}")
+            raise e
+
+
     async def retrieve_item_by_id(self, item_id: str, partition_key: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve an item from the Cosmos DB container by its ID.
@@ -37,7 +282,7 @@ class CosmosDBClient:
         :return: The item if found, or None if not found or an error occurs.
         """
         try:
-            item = self.container.read_item(item=item_id, partition_key=partition_key)
+            item = await self.container.read_item(item=item_id, partition_key=partition_key)
             return item
         except CosmosHttpResponseError as e:
             if e.status_code == 404:
@@ -61,18 +306,91 @@ class CosmosDBClient:
             query = f"SELECT * FROM c WHERE " + " AND ".join(filter_clauses)
             parameters = [{"name": f"@{column}", "value": value} for column, value in filters.items()]
             
-            # Execute the query
+            # Execute the query (the async client queries across partitions when no partition key is given)
             items = self.container.query_items(
                 query=query,
                 parameters=parameters,
-                enable_cross_partition_query=True,
             )
             
             # Convert the iterator to a list
-            items_list = list(items)
+            items_list = [item async for item in items]
             
             return items_list
         
         except CosmosHttpResponseError as e:
             logging.error(f"An error occurred while retrieving items: {e}")
             return None
+
+
+    async def query_partition(
+        self,
+        partition_key: str,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None,
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        greater_than: Optional[Dict[str, Any]] = None,
+        order_by: Optional[str] = None
+    ) -> QueryPage:
+        """
+        Query items within a single partition, optionally projecting fields and reading one page at a time.
+
+        Targeting the partition key means the query is served by one partition, so its latency and RU cost
+        do not grow with the number of partitions (documents) in the container.
+
+        :param partition_key: The partition key value to query.
+        :param filters: optional - a dictionary where keys are column names and values are the values to match.
+        :param fields: optional - the fields to return for each item. All fields are returned if not given.
+        :param page_size: optional - the maximum number of items to return. All items are returned if not given.
+        :param continuation_token: optional - the continuation token from a previous page, to read the next page.
+        :param greater_than: optional - a dictionary where keys are column names and values are exclusive lower bounds.
+        :param order_by: optional - the column to sort the items by, in ascending order.
+        :return: The page of items, the continuation token for the next page (if any) and the request charge.
+        """
+        filters = filters or {}
+        greater_than = greater_than or {}
+        projection = ", ".join(f"c.{field}" for field in fields) if fields else "*"
+        filter_clauses = [f"c.{column}=@{column}" for column in filters.keys()]
+        filter_clauses += [f"c.{column}>@min_{column}" for column in greater_than.keys()]
+        query = f"SELECT {projection} FROM c" + (" WHERE " + " AND ".join(filter_clauses) if filter_clauses else "")
+        if order_by:
+            query += f" ORDER BY c.{order_by}"
+        parameters = [{"name": f"@{column}", "value": value} for column, value in filters.items()]
+        parameters += [{"name": f"@min_{column}", "value": value} for column, value in greater_than.items()]
+
+        # Record the request charge of every page fetched by the query. The hook is also called once when the query
+        # is created, before any request is made, with the headers of the last request on the shared client (which
+        # may belong to another query), so only calls made while fetching pages are counted.
+        request_charges = []
+        fetching = False
+        def record_request_charge(headers: Dict[str, Any], _) -> None:
+            if fetching:
+                request_charges.append(float(headers.get("x-ms-request-charge", 0)))
+
+        try:
+            pages = self.container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=partition_key,
+                max_item_count=page_size,
+                response_hook=record_request_charge,
+            ).by_page(continuation_token)
+            fetching = True
+
+            items = []
+            async for page in pages:
+                items += [item async for item in page]
+                if page_size:
+                    break
+
+            request_charge = sum(request_charges)
+            logging.info(f"Query on partition {partition_key} returned {len(items)} items for {request_charge} RUs.")
+            return QueryPage(
+                items=items,
+                continuation_token=pages.continuation_token if page_size else None,
+                request_charge=request_charge
+            )
+
+        except CosmosHttpResponseError as e:
+            logging.error(f"An error occurred while querying partition {partition_key}: {e}")
+            raise e
@@ -1,15 +1,22 @@
 from common.logger import get_logger
-from typing import Any, Dict, List
-from common.models import Issue
+from http import HTTPStatus
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError
+from typing import Any, Dict, List, Optional, Tuple
+from common.models import BatchIssueActionResult, Issue
 from config.config import settings
 from database.db_client import CosmosDBClient
 
 logging = get_logger(__name__)
 
+
+class IssueModifiedError(Exception):
+    """Raised when an issue is updated with an ETag, and the issue has changed since that ETag was read."""
+
+
 class IssuesRepository:
-    def __init__(self) -> None:
-        """Initialize the IssuesRepository with a CosmosDBClient."""
-        self.db_client = CosmosDBClient(settings.issues_container)
+    def __init__(self, db_client: Optional[CosmosDBClient] = None) -> None:
+        """Initialize the IssuesRepository with a CosmosDBClient (a new one for the issues container if not given)."""
+        self.db_client = db_client or CosmosDBClient(settings.issues_container)
 
 
     async def get_issues(self, doc_id: str) -> List[Issue]:
@@ -22,10 +29,45 @@ class IssuesRepository:
             doc_minor_version (int): The document minor version.
         """
         logging.info(f"Retrieving issues for document {doc_id}.")
-        filter = { "doc_id": doc_id }
-        issues = await self.db_client.retrieve_items_by_values(filter)
-        logging.info(f"Retrieved {len(issues)} issues for document {doc_id}.")
-        return [Issue(**issue) for issue in issues]
+        page = await self.db_client.query_partition(doc_id)
+        logging.info(f"Retrieved {len(page.items)} issues for document {doc_id} ({page.request_charge} RUs).")
+        return [Issue(**issue) for issue in page.items]
+
+
+    async def get_issues_page(
+        self, doc_id: str, page_size: int, continuation_token: Optional[str] = None
+    ) -> Tuple[List[Issue], Optional[str]]:
+        """
+        Retrieve a page of issues for given document id.
+
+        Args:
+            doc_id (str): The document id.
+            page_size (int): The maximum number of issues to return.
+            continuation_token (str): optional - the continuation token returned with the previous page.
+
+        Returns:
+            The page of issues, and the continuation token for the next page (None if this is the last page).
+        """
+        logging.info(f"Retrieving page of {page_size} issues for document {doc_id}.")
+        page = await self.db_client.query_partition(doc_id, page_size=page_size, continuation_token=continuation_token)
+        logging.info(f"Retrieved {len(page.items)} issues for document {doc_id} ({page.request_charge} RUs).")
+        return [Issue(**issue) for issue in page.items], page.continuation_token
+
+
+    async def get_issues_after(self, doc_id: str, review_seq: int) -> List[Issue]:
+        """
+        Retrieve the issues sent after a given review event, in the order they were sent.
+
+        Args:
+            doc_id (str): The document id.
+            review_seq (int): The sequence number of the last review event received.
+        """
+        logging.info(f"Retrieving issues for document {doc_id} after review event {review_seq}.")
+        page = await self.db_client.query_partition(
+            doc_id, greater_than={"review_seq": review_seq}, order_by="review_seq"
+        )
+        logging.info(f"Retrieved {len(page.items)} issues for document {doc_id} ({page.request_charge} RUs).")
+        return [Issue(**issue) for issue in page.items]
 
 
     async def get_issue(self, doc_id: str, issue_id: str) -> Issue:
@@ -48,12 +90,15 @@ class IssuesRepository:
             issues (List[IssueDBModel]): List of IssueDBModel objects.
         """
         logging.info(f"Storing {len(issues)} issues in the database.")
-        for issue in issues:
-            await self.db_client.store_item(issue.model_dump())
+        await self.db_client.store_items(
+            [issue.model_dump(exclude={"etag"}) for issue in issues], partition_key_field="doc_id"
+        )
         logging.info("Issues stored successfully.")
 
 
-    async def update_issue(self, doc_id: str, issue_id: str, fields: Dict[str, Any]) -> Issue:
+    async def update_issue(
+        self, doc_id: str, issue_id: str, fields: Dict[str, Any], etag: Optional[str] = None
+    ) -> Issue:
         """
         Updates issue fields
 
@@ -61,15 +106,63 @@ class IssuesRepository:
             doc_id (str): The ID of the document.
             issue_id (str): The ID of the issue.
             fields (Dict[str, Any]): The fields to update.
+            etag (str): optional - only update the issue if it has not changed since this ETag was read.
+
+        Raises:
+            IssueModifiedError: If the issue has changed since the ETag was read.
         """
         logging.info(f"Updating issue {issue_id}")
-        issue = await self.db_client.retrieve_item_by_id(issue_id, doc_id)
-        if issue:
-            for field, value in fields.items():
-                issue[field] = value
-
-            await self.db_client.store_item(issue)
-            logging.info(f"Issue {issue_id} updated.")
-            return Issue(**issue)
-        else:
-            raise ValueError(f"Issue {issue_id} not found.")
+        try:
+            issue = await self.db_client.patch_item(issue_id, doc_id, fields, etag)
+        except CosmosHttpResponseError as e:
+            if e.status_code == HTTPStatus.NOT_FOUND:
+                raise ValueError(f"Issue {issue_id} not found.")
+            if e.status_code == HTTPStatus.PRECONDITION_FAILED:
+                raise IssueModifiedError(f"Issue {issue_id} has been modified since it was retrieved.")
+            raise
+
+        logging.info(f"Issue {issue_id} updated.")
+        return Issue(**issue)
+
+
+    async def update_issues(
+        self, doc_id: str, issue_ids: List[str], fields: Dict[str, Any]
+    ) -> BatchIssueActionResult:
+        """
+        Updates the same fields on many issues of a document, in transactional batches of up to 100 issues.
+
+        Each batch is applied or left unchanged as a whole, so if some batches fail the issues of the others are still
+        updated.
+
+        Args:
+            doc_id (str): The ID of the document.
+            issue_ids (List[str]): The IDs of the issues.
+            fields (Dict[str, Any]): The fields to update.
+
+        Returns:
+            The updated issues, and the IDs of the issues in batches that failed.
+        """
+        logging.info(f"Updating {len(issue_ids)} issues on document {doc_id}")
+        try:
+            result = await self.db_client.patch_items(doc_id, issue_ids, fields)
+        except CosmosBatchOperationError as e:
+            if e.status_code == HTTPStatus.NOT_FOUND:
+                raise ValueError(f"One or more issues not found on document {doc_id}.")
+            raise
+
+        logging.info(f"{len(result.items)} issues updated, {len(result.failed_ids)} failed.")
+        return BatchIssueActionResult(
+            issues=[Issue(**issue) for issue in result.items], failed_issue_ids=result.failed_ids
+        )
+
+
+    async def delete_issues(self, doc_id: str, issue_ids: List[str]) -> None:
+        """
+        Deletes issues of a document, in transactional batches of up to 100 issues.
+
+        Args:
+            doc_id (str): The ID of the document.
+            issue_ids (List[str]): The IDs of the issues.
+        """
+        logging.info(f"Deleting {len(issue_ids)} issues on document {doc_id}")
+        await self.db_client.delete_items(doc_id, issue_ids)
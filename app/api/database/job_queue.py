@@ -0,0 +1,325 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from common.logger import get_logger
+from common.models import ReviewJob, ReviewJobStatusEnum
+from config.config import settings
+
+logging = get_logger(__name__)
+
+ACTIVE_STATUSES = (ReviewJobStatusEnum.queued, ReviewJobStatusEnum.running)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is enqueued while the queue already holds the maximum number of waiting jobs."""
+
+
+class ReviewJobQueue(ABC):
+    """
+    Queue of document review jobs, with at most one active (queued or running) job per document.
+
+    A claimed job is only held while its worker sends heartbeats. If the worker stops (e.g. the process restarts),
+    the job can be claimed again once `review_job_visibility_timeout_seconds` has passed without a heartbeat, unless
+    it has already been attempted `review_job_max_attempts` times, in which case it fails. Each claim gets a new
+    `claim_id`, and a job is only updated by the worker holding its current claim, so a worker that stalled and
+    lost its claim cannot overwrite the state of the worker that claimed the job after it.
+    Backends implement the storage; `_can_enqueue`, `_claim_from` and `_holds_claim` hold the rules shared by all
+    of them.
+    """
+
+    def __init__(
+        self,
+        max_queued: int = settings.review_queue_max_size,
+        visibility_timeout_seconds: float = settings.review_job_visibility_timeout_seconds,
+        max_attempts: int = settings.review_job_max_attempts
+    ) -> None:
+        self.max_queued = max_queued
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self.max_attempts = max_attempts
+
+
+    @abstractmethod
+    async def enqueue(self, job: ReviewJob) -> bool:
+        """
+        Add a job to the queue, unless the document already has an active job.
+
+        Args:
+            job (ReviewJob): The job to add.
+
+        Returns:
+            True if the job was added, False if the document already has an active job.
+
+        Raises:
+            QueueFullError: If the queue already holds the maximum number of waiting jobs.
+        """
+
+
+    @abstractmethod
+    async def claim(self) -> Optional[ReviewJob]:
+        """Claim the next job that is ready to run, or return None if there is none."""
+
+
+    async def heartbeat(self, job: ReviewJob) -> bool:
+        """Report that a claimed job is still running. Returns False if the claim has been lost."""
+        return await self._update(job, heartbeat_at=time.time())
+
+
+    async def complete(self, job: ReviewJob) -> bool:
+        """Mark a claimed job as complete. Returns False if the claim has been lost."""
+        return await self._update(job, status=ReviewJobStatusEnum.complete)
+
+
+    async def retry(self, job: ReviewJob, delay_seconds: float, error: str) -> bool:
+        """
+        Put a claimed job back in the queue, to be claimed again after a delay. Returns False if the claim has been
+        lost.
+        """
+        return await self._update(
+            job, status=ReviewJobStatusEnum.queued, available_at=time.time() + delay_seconds, error=error
+        )
+
+
+    async def fail(self, job: ReviewJob, error: str) -> bool:
+        """Mark a claimed job as failed. Returns False if the claim has been lost."""
+        return await self._update(job, status=ReviewJobStatusEnum.failed, error=error)
+
+
+    @abstractmethod
+    async def get(self, doc_id: str) -> Optional[ReviewJob]:
+        """Get the latest job of a document, or None if it has never been queued."""
+
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, int]:
+        """Count the jobs in each status."""
+
+
+    @abstractmethod
+    async def _update(self, job: ReviewJob, **fields) -> bool:
+        """Update fields of a job if it is still held by the given claim, and return whether it was."""
+
+
+    def _can_enqueue(self, existing: Optional[ReviewJob], queued_count: int) -> bool:
+        if existing is not None and existing.status in ACTIVE_STATUSES:
+            return False
+        if queued_count >= self.max_queued:
+            raise QueueFullError(f"The review queue is full ({queued_count} jobs waiting).")
+        return True
+
+
+    def _claim_from(self, jobs: List[ReviewJob]) -> Tuple[Optional[ReviewJob], List[ReviewJob]]:
+        """
+        Picks the next job to claim from the active jobs.
+
+        Returns:
+            The claimed job (or None if no job is ready), and the stalled jobs that have no attempts left and are
+            failed instead of claimed again. Backends store both.
+        """
+        # Jobs are ready once their retry delay has passed, or once a running job's worker stops sending heartbeats
+        now = time.time()
+        stalled = [
+            job for job in jobs
+            if job.status == ReviewJobStatusEnum.running
+            and (job.heartbeat_at or 0) < now - self.visibility_timeout_seconds
+        ]
+        # A job whose worker keeps stopping (e.g. a document that crashes the process) is not run forever
+        failed = [
+            job.model_copy(update={
+                "status": ReviewJobStatusEnum.failed,
+                "claim_id": None,
+                "error": f"The review stopped sending heartbeats on each of its {job.attempts} attempts."
+            })
+            for job in stalled if job.attempts >= self.max_attempts
+        ]
+        for job in failed:
+            logging.error(
+                f"Review job for document {job.doc_id} stopped sending heartbeats after {job.attempts} attempts."
+            )
+
+        ready = [
+            job for job in jobs
+            if job.status == ReviewJobStatusEnum.queued and job.available_at <= now
+        ] + [job for job in stalled if job.attempts < self.max_attempts]
+        if not ready:
+            return None, failed
+
+        job = min(ready, key=lambda job: job.available_at)
+        if job.status == ReviewJobStatusEnum.running:
+            logging.warning(f"Review job for document {job.doc_id} stopped sending heartbeats. Running it again...")
+        return job.model_copy(update={
+            "status": ReviewJobStatusEnum.running,
+            "attempts": job.attempts + 1,
+            "heartbeat_at": now,
+            "claim_id": uuid.uuid4().hex
+        }), failed
+
+
+    @staticmethod
+    def _holds_claim(stored: Optional[ReviewJob], job: ReviewJob) -> bool:
+        holds_claim = (
+            stored is not None and stored.status == ReviewJobStatusEnum.running and stored.claim_id == job.claim_id
+        )
+        if not holds_claim:
+            logging.warning(f"Review job for document {job.doc_id} (attempt {job.attempts}) no longer holds its claim.")
+        return holds_claim
+
+
+class InMemoryJobQueue(ReviewJobQueue):
+    """Keeps jobs in a dictionary for the lifetime of the process. Jobs are lost when the process stops."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._jobs: Dict[str, ReviewJob] = {}
+        self._lock = asyncio.Lock()
+
+
+    async def enqueue(self, job: ReviewJob) -> bool:
+        async with self._lock:
+            queued_count = sum(1 for queued in self._jobs.values() if queued.status == ReviewJobStatusEnum.queued)
+            if not self._can_enqueue(self._jobs.get(job.doc_id), queued_count):
+                return False
+            self._jobs[job.doc_id] = job.model_copy()
+            return True
+
+
+    async def claim(self) -> Optional[ReviewJob]:
+        async with self._lock:
+            job, failed = self._claim_from(list(self._jobs.values()))
+            for updated in failed + ([job] if job is not None else []):
+                self._jobs[updated.doc_id] = updated
+            return job
+
+
+    async def get(self, doc_id: str) -> Optional[ReviewJob]:
+        return self._jobs.get(doc_id)
+
+
+    async def stats(self) -> Dict[str, int]:
+        return {
+            status.value: sum(1 for job in self._jobs.values() if job.status == status) for status in ReviewJobStatusEnum
+        }
+
+
+    async def _update(self, job: ReviewJob, **fields) -> bool:
+        async with self._lock:
+            if not self._holds_claim(self._jobs.get(job.doc_id), job):
+                return False
+            self._jobs[job.doc_id] = self._jobs[job.doc_id].model_copy(update=fields)
+            return True
+
+
+class SQLiteJobQueue(ReviewJobQueue):
+    """
+    Persists jobs in a SQLite database on disk, so they survive restarts and can be shared by the worker processes
+    on one host. Claims take a write lock on the database, so each job is claimed by one worker only.
+    """
+
+    def __init__(self, path: str = settings.review_queue_path, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._db_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        with self._db_lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS review_jobs (doc_id TEXT PRIMARY KEY, status TEXT, job TEXT)"
+            )
+
+
+    async def enqueue(self, job: ReviewJob) -> bool:
+        def enqueue() -> bool:
+            with self._transaction() as connection:
+                existing = self._read(connection, job.doc_id)
+                queued_count = connection.execute(
+                    "SELECT COUNT(*) FROM review_jobs WHERE status = ?", (ReviewJobStatusEnum.queued.value,)
+                ).fetchone()[0]
+                if not self._can_enqueue(existing, queued_count):
+                    return False
+                self._write(connection, job)
+                return True
+
+        return await asyncio.to_thread(enqueue)
+
+
+    async def claim(self) -> Optional[ReviewJob]:
+        def claim() -> Optional[ReviewJob]:
+            with self._transaction() as connection:
+                rows = connection.execute(
+                    "SELECT job FROM review_jobs WHERE status IN (?, ?)", tuple(status.value for status in ACTIVE_STATUSES)
+                ).fetchall()
+                job, failed = self._claim_from([ReviewJob.model_validate_json(row[0]) for row in rows])
+                for updated in failed + ([job] if job is not None else []):
+                    self._write(connection, updated)
+                return job
+
+        return await asyncio.to_thread(claim)
+
+
+    async def get(self, doc_id: str) -> Optional[ReviewJob]:
+        def get() -> Optional[ReviewJob]:
+            with self._db_lock:
+                return self._read(self._connection, doc_id)
+
+        return await asyncio.to_thread(get)
+
+
+    async def stats(self) -> Dict[str, int]:
+        def stats() -> Dict[str, int]:
+            with self._db_lock:
+                counts = dict(self._connection.execute("SELECT status, COUNT(*) FROM review_jobs GROUP BY status"))
+            return {status.value: counts.get(status.value, 0) for status in ReviewJobStatusEnum}
+
+        return await asyncio.to_thread(stats)
+
+
+    async def _update(self, job: ReviewJob, **fields) -> bool:
+        def update() -> bool:
+            with self._transaction() as connection:
+                stored = self._read(connection, job.doc_id)
+                if not self._holds_claim(stored, job):
+                    return False
+                self._write(connection, stored.model_copy(update=fields))
+                return True
+
+        return await asyncio.to_thread(update)
+
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Serialize threads in this process, and take the database write lock so other processes wait for the commit
+        with self._db_lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+
+    @staticmethod
+    def _read(connection: sqlite3.Connection, doc_id: str) -> Optional[ReviewJob]:
+        row = connection.execute("SELECT job FROM review_jobs WHERE doc_id = ?", (doc_id,)).fetchone()
+        return ReviewJob.model_validate_json(row[0]) if row else None
+
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, job: ReviewJob) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO review_jobs (doc_id, status, job) VALUES (?, ?, ?)",
+            (job.doc_id, ReviewJobStatusEnum(job.status).value, job.model_dump_json()),
+        )
+
+
+def create_job_queue() -> Optional[ReviewJobQueue]:
+    """Returns the configured review job queue backend, or None if reviews run within the request."""
+    if settings.review_queue_backend == "memory":
+        return InMemoryJobQueue()
+    if settings.review_queue_backend == "sqlite":
+        return SQLiteJobQueue()
+    if settings.review_queue_backend != "none":
+        logging.warning(f"Unknown review queue backend '{settings.review_queue_backend}'. Reviews run within the request.")
+    return None
@@ -0,0 +1,113 @@
+from common.logger import get_logger
+from http import HTTPStatus
+from typing import Optional
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceExistsError
+from config.config import settings
+from database.db_client import CosmosDBClient
+
+logging = get_logger(__name__)
+
+class LeasesRepository:
+    """
+    Leases held by one API worker at a time, stored as documents in the leases container.
+
+    Each lease has a time-to-live, so a lease held by a worker that stops without releasing it expires. The holder
+    renews the lease while it is working. Renewing and releasing only apply to a lease still held by the same owner
+    (checked with the lease's ETag), so a holder that stalled past the time-to-live cannot take over or delete the
+    lease another worker acquired since.
+    """
+
+    def __init__(self, db_client: Optional[CosmosDBClient] = None) -> None:
+        """Initialize the LeasesRepository with a CosmosDBClient (a new one for the leases container if not given)."""
+        self.db_client = db_client or CosmosDBClient(settings.leases_container)
+
+
+    async def acquire(self, lease_id: str, owner: str) -> bool:
+        """
+        Acquire a lease, unless another owner holds it.
+
+        Args:
+            lease_id (str): The ID of the lease.
+            owner (str): The ID of the worker acquiring the lease.
+
+        Returns:
+            True if the lease was acquired, False if it is held by someone else.
+        """
+        try:
+            await self.db_client.create_item(self._lease(lease_id, owner))
+            logging.info(f"Lease {lease_id} acquired by {owner}.")
+            return True
+        except CosmosResourceExistsError:
+            return False
+
+
+    async def renew(self, lease_id: str, owner: str) -> bool:
+        """
+        Renew a lease, restarting its time-to-live.
+
+        Args:
+            lease_id (str): The ID of the lease.
+            owner (str): The ID of the worker holding the lease.
+
+        Returns:
+            True if the lease was renewed, False if it has expired or is now held by someone else.
+        """
+        lease = await self._get_owned(lease_id, owner)
+        if lease is None:
+            return False
+        try:
+            await self.db_client.replace_item(self._lease(lease_id, owner), lease["_etag"])
+            return True
+        except CosmosHttpResponseError as e:
+            if e.status_code in (HTTPStatus.NOT_FOUND, HTTPStatus.PRECONDITION_FAILED):
+                logging.warning(f"Lease {lease_id} was lost by {owner} while renewing it.")
+                return False
+            raise
+
+
+    async def release(self, lease_id: str, owner: str) -> bool:
+        """
+        Release a lease.
+
+        Args:
+            lease_id (str): The ID of the lease.
+            owner (str): The ID of the worker holding the lease.
+
+        Returns:
+            True if the lease was released, False if it had expired or is now held by someone else.
+        """
+        lease = await self._get_owned(lease_id, owner)
+        if lease is None:
+            return False
+        try:
+            await self.db_client.delete_item(lease_id, lease_id, lease["_etag"])
+        except CosmosHttpResponseError as e:
+            if e.status_code == HTTPStatus.PRECONDITION_FAILED:
+                logging.warning(f"Lease {lease_id} was lost by {owner} while releasing it.")
+                return False
+            raise
+        logging.info(f"Lease {lease_id} released.")
+        return True
+
+
+    async def is_held(self, lease_id: str) -> bool:
+        """
+        Check whether a lease is held.
+
+        Args:
+            lease_id (str): The ID of the lease.
+        """
+        return await self.db_client.retrieve_item_by_id(lease_id, lease_id) is not None
+
+
+    async def _get_owned(self, lease_id: str, owner: str) -> Optional[dict]:
+        lease = await self.db_client.retrieve_item_by_id(lease_id, lease_id)
+        if lease is None or lease.get("owner") != owner:
+            logging.warning(f"Lease {lease_id} is no longer held by {owner}.")
+            return None
+        return lease
+
+
+    @staticmethod
+    def _lease(lease_id: str, owner: str) -> dict:
+        return {"id": lease_id, "owner": owner, "ttl": settings.review_lease_ttl_seconds}
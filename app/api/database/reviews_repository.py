@@ -0,0 +1,44 @@
+from common.logger import get_logger
+from typing import Optional
+from common.models import ReviewProgress
+from config.config import settings
+from database.db_client import CosmosDBClient
+
+logging = get_logger(__name__)
+
+class ReviewsRepository:
+    """The progress of the review of each document, stored as one document per reviewed document."""
+
+    def __init__(self, db_client: Optional[CosmosDBClient] = None) -> None:
+        """Initialize the ReviewsRepository with a CosmosDBClient (a new one for the reviews container if not given)."""
+        self.db_client = db_client or CosmosDBClient(settings.reviews_container)
+
+
+    async def get_progress(self, doc_id: str) -> Optional[ReviewProgress]:
+        """
+        Retrieve the progress of the review of a document.
+
+        Args:
+            doc_id (str): The document id.
+
+        Returns:
+            The review progress, or None if the document has no recorded review.
+        """
+        item = await self.db_client.retrieve_item_by_id(doc_id, doc_id)
+        if item is None:
+            return None
+        return ReviewProgress(**item)
+
+
+    async def store_progress(self, progress: ReviewProgress) -> None:
+        """
+        Store the progress of the review of a document, replacing the previous progress.
+
+        Args:
+            progress (ReviewProgress): The review progress.
+        """
+        await self.db_client.store_item({"id": progress.doc_id, **progress.model_dump()})
+        logging.info(
+            f"Review of document {progress.doc_id} is {progress.status}: "
+            f"{progress.chunks_done} of {progress.chunks_total} chunks done."
+        )
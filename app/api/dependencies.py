@@ -1,22 +1,169 @@
-import os
-from services.aml_client import AMLClient
+import asyncio
+import httpx
+from functools import cached_property
+from typing import Any, Dict, Optional
+from azure.cosmos.aio import CosmosClient
+from fastapi import Request
+from common.logger import get_logger
+from config.config import settings
+from database.config import create_cosmos_client
+from database.db_client import CosmosDBClient
+from services.aml_client import AMLClient, create_http_client
 from database.issues_repository import IssuesRepository
+from database.leases_repository import LeasesRepository
+from database.reviews_repository import ReviewsRepository
+from database.job_queue import ReviewJobQueue, create_job_queue
+from services.review_coordinator import ReviewCoordinator
 from services.issues_service import IssuesService
-from azure.identity import DefaultAzureCredential, ClientAssertionCredential, AzureCliCredential
-from config.config import settings
+from services.review_workers import ReviewWorkerPool
+from security.credentials import get_flow_credential
+
+logging = get_logger(__name__)
+
+
+class ServiceContainer:
+    """
+    Holds the clients and services shared by every request in a worker.
+
+    Created and closed by the app lifespan, so connection pools and cached tokens live as long as the worker
+    instead of being rebuilt per request.
+    """
+
+    def __init__(self) -> None:
+        self._warm_up_task: Optional[asyncio.Task] = None
+
+
+    # Clients are created on first use, so a missing setting only fails the requests that need it (as before)
+    @cached_property
+    def cosmos_client(self) -> CosmosClient:
+        return create_cosmos_client(settings.cosmos_url)
+
+
+    @cached_property
+    def http_client(self) -> httpx.AsyncClient:
+        return create_http_client()
+
+
+    @cached_property
+    def issues_db_client(self) -> CosmosDBClient:
+        return CosmosDBClient(settings.issues_container, self.cosmos_client)
+
+
+    @cached_property
+    def issues_repository(self) -> IssuesRepository:
+        return IssuesRepository(self.issues_db_client)
+
+
+    @cached_property
+    def review_coordinator(self) -> ReviewCoordinator:
+        leases_repository = LeasesRepository(CosmosDBClient(settings.leases_container, self.cosmos_client))
+        return ReviewCoordinator(self.issues_repository, leases_repository)
+
+
+    @cached_property
+    def reviews_repository(self) -> ReviewsRepository:
+        return ReviewsRepository(CosmosDBClient(settings.reviews_container, self.cosmos_client))
+
 
+    @cached_property
+    def job_queue(self) -> Optional[ReviewJobQueue]:
+        return create_job_queue()
 
-def get_issues_service() -> IssuesService:
-    return IssuesService(IssuesRepository(), get_aml_client())
 
-def get_aml_client():
-    if "WEBSITE_INSTANCE_ID" in os.environ:
-        credential = ClientAssertionCredential(
-            settings.aad_tenant_id,
-            os.environ.get('FLOW_CLIENT_ID'),
-            lambda: DefaultAzureCredential().get_token("api://AzureADTokenExchange/.default").token
+    @cached_property
+    def review_workers(self) -> ReviewWorkerPool:
+        return ReviewWorkerPool(self.job_queue, self.issues_service.run_review_job)
+
+
+    @cached_property
+    def issues_service(self) -> IssuesService:
+        return IssuesService(
+            self.issues_repository, self.aml_client, self.review_coordinator, self.reviews_repository, self.job_queue
         )
-    else:
-        credential = AzureCliCredential()
 
-    return AMLClient(credential)
+
+    @cached_property
+    def aml_client(self) -> AMLClient:
+        return AMLClient(get_flow_credential(), self.http_client)
+
+
+    def start(self) -> None:
+        """
+        Starts warming up connections and tokens in the background, so startup is not held up by them, and starts
+        the review workers if reviews are queued.
+        """
+        if settings.warm_up_on_startup and settings.cosmos_url:
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+        if self.job_queue is not None and settings.review_workers > 0:
+            self.review_workers.start()
+
+
+    async def warm_up(self) -> None:
+        """Opens the Cosmos DB connection and acquires the flow endpoint token ahead of the first request."""
+        try:
+            await self.issues_db_client.warm_up()
+            await self.aml_client.credential.get_token(f"api://{settings.flow_app_name}/.default")
+            logging.info(f"Warm up complete. Connection pools: {self.pool_stats()}")
+        except Exception as e:
+            logging.warning(f"Warm up failed, connections will be opened on first use: {e}")
+
+
+    async def close(self) -> None:
+        """Closes the connection pools that were opened."""
+        if self._warm_up_task:
+            self._warm_up_task.cancel()
+        if "review_workers" in self.__dict__:
+            await self.review_workers.close()
+        if "review_coordinator" in self.__dict__:
+            await self.review_coordinator.close()
+        logging.info(f"Closing connection pools: {self.pool_stats()}")
+        if "http_client" in self.__dict__:
+            await self.http_client.aclose()
+        if "cosmos_client" in self.__dict__:
+            await self.cosmos_client.close()
+
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Reports the number of active and idle connections in each connection pool that was opened."""
+        return {
+            "flow": _connection_pool_stats(self.__dict__.get("http_client"), settings.flow_max_connections),
+            "cosmos": _connection_pool_stats(self.__dict__.get("cosmos_client")),
+        }
+
+
+def _connection_pool_stats(client, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Counts the active and idle connections in the pool of an httpx or Cosmos client.
+
+    Neither library exposes its pool publicly, so this reads their internals as of httpx 0.28 (httpcore 1.0) and
+    azure-cosmos 4.9 over the azure-core aiohttp transport (aiohttp 3.11); `tests/api/test_dependencies.py` checks
+    them against the installed versions. If an upgrade moves them, only the configured limit is reported and a
+    warning is logged.
+    """
+    if client is None:
+        return {}
+    stats = {"limit": limit} if limit else {}
+    try:
+        if isinstance(client, httpx.AsyncClient):
+            connections = client._transport._pool.connections
+            idle = sum(1 for connection in connections if connection.is_idle())
+            return {"active": len(connections) - idle, "idle": idle, **stats}
+
+        # The aiohttp session is created on the first request
+        session = client.client_connection.pipeline_client._pipeline._transport.session
+        if session is None:
+            return stats
+        connector = session.connector
+        idle = sum(len(connections) for connections in connector._conns.values())
+        return {"active": len(connector._acquired), "idle": idle, "limit": connector.limit}
+    except AttributeError as e:
+        logging.warning(f"Connection pool stats are not available for {type(client).__name__}: {e}")
+        return stats
+
+
+def get_services(request: Request) -> ServiceContainer:
+    return request.app.state.services
+
+
+def get_issues_service(request: Request) -> IssuesService:
+    return get_services(request).issues_service
@@ -1,10 +1,13 @@
+from contextlib import asynccontextmanager
 from common.logger import get_logger
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from config.config import settings
+from dependencies import ServiceContainer, get_services
 from fastapi.staticfiles import StaticFiles
 from middleware.logging import LoggingMiddleware, setup_logging
+from security.auth import validate_authenticated
 from routers import issues
 
 
@@ -12,8 +15,18 @@ from routers import issues
 setup_logging()
 logging = get_logger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the shared clients once per worker, and close their connections on shutdown
+    app.state.services = ServiceContainer()
+    app.state.services.start()
+    yield
+    await app.state.services.close()
+
+
 # Initialize FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     swagger_ui_oauth2_redirect_url="/oauth2-redirect",
     swagger_ui_init_oauth={
         "usePkceWithAuthorizationCodeGrant": True,
@@ -46,6 +59,28 @@ def health_check():
     return Response(status_code=204)
 
 
+# Connection pool usage
+@app.get(
+    "/api/health/pools",
+    summary="Connection Pool Stats",
+    response_description="Active and idle connections in each connection pool of this worker",
+)
+def pool_stats(services: ServiceContainer = Depends(get_services), user=Depends(validate_authenticated)):
+    return services.pool_stats()
+
+
+# Review job queue usage
+@app.get(
+    "/api/health/queue",
+    summary="Review Queue Stats",
+    response_description="Number of review jobs in each status",
+)
+async def queue_stats(services: ServiceContainer = Depends(get_services), user=Depends(validate_authenticated)):
+    if services.job_queue is None:
+        return {}
+    return await services.job_queue.stats()
+
+
 # Mount the UI at the root path (should come last so it doesn't interfere with /api routes)
 if settings.serve_static:
     app.mount("/", StaticFiles(directory="www", html=True))
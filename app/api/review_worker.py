@@ -0,0 +1,28 @@
+import asyncio
+from common.logger import get_logger
+from config.config import settings
+from dependencies import ServiceContainer
+from middleware.logging import setup_logging
+
+
+# Runs review workers without serving the API, so they can be scaled separately from it.
+# Set `review_workers` to 0 on the API to only queue reviews there.
+setup_logging()
+logging = get_logger(__name__)
+
+
+async def main() -> None:
+    services = ServiceContainer()
+    if services.job_queue is None:
+        raise RuntimeError("No review queue backend is configured (set REVIEW_QUEUE_BACKEND).")
+
+    services.review_workers.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await services.close()
+
+
+if __name__ == "__main__":
+    logging.info(f"Starting {settings.review_workers} review workers on the {settings.review_queue_backend} queue.")
+    asyncio.run(main())
@@ -3,21 +3,66 @@ from http import HTTPStatus
 from dependencies import get_issues_service
 from common.logger import get_logger
 import json
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Header
+from typing import AsyncGenerator, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from services.issues_service import IssuesService
+from database.issues_repository import IssueModifiedError
 from fastapi.responses import StreamingResponse
 from security.auth import validate_authenticated
-from common.models import Issue, ModifiedFieldsModel, DismissalFeedbackModel
+from config.config import settings
+from common.models import (
+    BatchIssueActionModel, BatchIssueActionResult, Issue, ModifiedFieldsModel, DismissalFeedbackModel, ReviewProgress
+)
 
 
 router = APIRouter()
 logging = get_logger(__name__)
 
 
-def issues_event(issues: list[Issue]) -> str:
+def issues_event(issues: list[Issue], event_id: Optional[str] = None) -> str:
     issue_objs = [issue.model_dump() for issue in issues]
-    return f"event: issues\n" + (f"data: {json.dumps(issue_objs)}\n" if issues else "") + "\n"
+    return (
+        f"event: issues\n"
+        + (f"id: {event_id}\n" if event_id else "")
+        + f"data: {json.dumps(issue_objs)}\n\n"
+    )
+
+
+# Event ids are prefixed with their kind, so a continuation token can never be mistaken for a sequence number
+REVIEW_EVENT_ID_PREFIX = "seq:"
+PAGE_EVENT_ID_PREFIX = "page:"
+
+
+def review_event_id(issues: list[Issue]) -> Optional[str]:
+    """The id of a review event: the sequence number of the latest review chunk its issues were sent in."""
+    review_seqs = [issue.review_seq for issue in issues if issue.review_seq is not None]
+    return f"{REVIEW_EVENT_ID_PREFIX}{max(review_seqs)}" if review_seqs else None
+
+
+def page_event_id(continuation: Optional[str]) -> Optional[str]:
+    """The id of a stored issues event: the continuation token of the next page."""
+    return f"{PAGE_EVENT_ID_PREFIX}{continuation}" if continuation else None
+
+
+def parse_event_id(event_id: str) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Parses the id of an event.
+
+    Args:
+        event_id (str): The id of a review event or a stored issues event.
+
+    Returns:
+        The review sequence number and the continuation token the event id stands for, one of which is None.
+
+    Raises:
+        ValueError: If the event id is not one that was sent.
+    """
+    if event_id.startswith(REVIEW_EVENT_ID_PREFIX):
+        return int(event_id.removeprefix(REVIEW_EVENT_ID_PREFIX)), None
+    if event_id.startswith(PAGE_EVENT_ID_PREFIX):
+        return None, event_id.removeprefix(PAGE_EVENT_ID_PREFIX)
+    raise ValueError(f"Unknown event id {event_id}.")
+
 
 @router.get(
     "/api/v1/review/{doc_id}/issues",
@@ -30,6 +75,10 @@ def issues_event(issues: list[Issue]) -> str:
 )
 async def get_pdf_issues(
     doc_id: str,
+    previous_doc_id: Optional[str] = None,
+    page_size: int = Query(default=settings.issues_page_size, ge=1, le=1000),
+    continuation: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
     user=Depends(validate_authenticated),
     issues_service=Depends(get_issues_service)
 ) -> StreamingResponse:
@@ -38,42 +87,69 @@ async def get_pdf_issues(
 
     Args:
         doc_id (str): The filename of the document
+        previous_doc_id (str): optional - The filename of the previous version of the document.
+            When set, a new review only checks the paragraphs that changed since that version.
+        page_size (int): The maximum number of stored issues sent in each event.
+        continuation (str): optional - The id of the last stored issues event received, to resume the stream after it.
+        last_event_id (str): optional - The id of the last event received, sent by the client when it reconnects.
+            The stream resumes after that event, with only the events the client missed.
         user (Depends): The authenticated user.
 
     Returns:
-        StreamingResponse: A text events stream containing identified issues.
+        StreamingResponse: A text events stream containing identified issues. Stored issues are sent one page per
+            event, with the continuation token for the next page as the event id (`page:<token>`). Issues from a
+            review are sent one chunk per event, with the chunk's sequence number as the event id (`seq:<n>`).
     """
     logging.info(f"Received initiate review request for document {doc_id}")
 
     try:
-        stored_issues = await issues_service.get_issues_data(doc_id)
+        # Review events are numbered, stored pages are identified by their continuation token
+        review_seq = None
+        if continuation:
+            _, continuation = parse_event_id(continuation)
+        if last_event_id:
+            review_seq, last_continuation = parse_event_id(last_event_id)
+            continuation = continuation or last_continuation
 
-        if stored_issues:
-            logging.info(f"Found stored issues for document {doc_id}. Streaming issues...")
+        if review_seq is not None:
+            logging.info(f"Resuming issues stream for document {doc_id} after event {last_event_id}...")
+            date_time = datetime.now(timezone.utc).isoformat()
+            issues_stream = issues_service.resume_review(doc_id, user, date_time, review_seq)
+            return StreamingResponse(review_events(issues_stream), media_type="text/event-stream")
 
-            def issues_events():
-                yield issues_event(stored_issues)
-                yield "event: complete\n\n"
+        stored_pages = issues_service.get_issues_pages(doc_id, page_size, continuation)
+        first_page, next_continuation = await anext(stored_pages)
 
-            issues = issues_events()
+        # A review still in progress (on this or another worker) is attached to rather than read page by page
+        review_in_progress = bool(first_page) and not continuation and await issues_service.is_review_in_progress(doc_id)
 
-        else:
-            logging.info(f"No issues found for document {doc_id}. Initiating review...")
-            date_time = datetime.now(timezone.utc).isoformat()
-            issues_stream = issues_service.initiate_review(doc_id, user, date_time)
+        if (first_page or next_continuation or continuation) and not review_in_progress:
+            logging.info(f"Found stored issues for document {doc_id}. Streaming issues...")
 
             async def issues_events():
                 try:
-                    async for issues in issues_stream:
-                        yield issues_event(issues)
+                    if first_page:
+                        yield issues_event(first_page, page_event_id(next_continuation))
+                    async for issues, page_continuation in stored_pages:
+                        if issues:
+                            yield issues_event(issues, page_event_id(page_continuation))
                     yield "event: complete\n\n"
                 except Exception as e:
-                    logging.error(f"Error occurred while streaming issues: {str(e)}")
+                    logging.error(f"Error occurred while streaming stored issues: {str(e)}")
                     yield "event: error\n"
                     yield f"data: {str(e)}\n\n"
 
             issues = issues_events()
 
+        else:
+            if review_in_progress:
+                logging.info(f"Review of document {doc_id} in progress. Attaching to it...")
+            else:
+                logging.info(f"No issues found for document {doc_id}. Initiating review...")
+            date_time = datetime.now(timezone.utc).isoformat()
+            issues_stream = await issues_service.review_document(doc_id, user, date_time, previous_doc_id)
+            issues = review_events(issues_stream)
+
         return StreamingResponse(issues, media_type="text/event-stream")
 
     except ValueError as e:
@@ -87,6 +163,51 @@ async def get_pdf_issues(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+async def review_events(issues_stream: AsyncGenerator[List[Issue], None]) -> AsyncGenerator[str, None]:
+    try:
+        async for issues in issues_stream:
+            yield issues_event(issues, review_event_id(issues))
+        yield "event: complete\n\n"
+    except Exception as e:
+        logging.error(f"Error occurred while streaming issues: {str(e)}")
+        yield "event: error\n"
+        yield f"data: {str(e)}\n\n"
+
+
+@router.get(
+    "/api/v1/review/{doc_id}/progress",
+    summary="Get the progress of the review of a PDF document",
+    responses={
+        HTTPStatus.OK: {"description": "Review progress retrieved successfully"},
+        HTTPStatus.UNAUTHORIZED: {"description": "Unauthorized"},
+        HTTPStatus.NOT_FOUND: {"description": "No review recorded for the document"},
+        HTTPStatus.INTERNAL_SERVER_ERROR: {"description": "Internal server error"},
+    },
+    response_model=ReviewProgress
+)
+async def get_review_progress(
+    doc_id: str,
+    user=Depends(validate_authenticated),
+    issues_service: IssuesService = Depends(get_issues_service),
+) -> ReviewProgress:
+    """
+    Retrieve the progress of the review of the document.
+
+    Args:
+        doc_id (str): The filename of the document
+        user: The authenticated user object.
+        issues_service (IssuesService): The issues service instance.
+
+    Returns:
+        ReviewProgress: The status of the review, the number of chunks reviewed out of the total, and the id of the
+            last event sent.
+    """
+    progress = await issues_service.get_review_progress(doc_id)
+    if progress is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=f"No review recorded for document {doc_id}")
+    return progress
+
+
 @router.patch(
     "/api/v1/review/{doc_id}/issues/{issue_id}/accept",
     summary="Accept issue and optionally provide feedback",
@@ -94,6 +215,7 @@ async def get_pdf_issues(
         HTTPStatus.OK: {"description": "Feedback updated successfully"},
         HTTPStatus.UNAUTHORIZED: {"description": "Unauthorized"},
         HTTPStatus.BAD_REQUEST: {"description": "Invalid data provided"},
+        HTTPStatus.PRECONDITION_FAILED: {"description": "Issue has been modified since it was retrieved"},
         HTTPStatus.UNPROCESSABLE_ENTITY: {"description": "Validation error"},
         HTTPStatus.INTERNAL_SERVER_ERROR: {"description": "Internal server error"},
     },
@@ -103,6 +225,7 @@ async def accept_issue(
     doc_id: str,
     issue_id: str,
     modified_fields: Optional[ModifiedFieldsModel] = None,
+    if_match: Optional[str] = Header(default=None),
     user=Depends(validate_authenticated),
     issues_service: IssuesService = Depends(get_issues_service),
 ) -> Issue:
@@ -115,6 +238,7 @@ async def accept_issue(
         doc_minor_version (str): The minor version of the document.
         issue_id (str): The ID of the issue.
         modified_fields (ModifiedFieldsModel): The modified fields data to be updated.
+        if_match (str): optional - The issue's ETag. The update is rejected with 412 if the issue has changed since.
         user: The authenticated user object.
         issues_service (IssuesService): The issues service instance.
 
@@ -123,7 +247,10 @@ async def accept_issue(
     """
     logging.info(f"Request received to accept issue {issue_id} on document {doc_id}.")
 
-    updated_issue = await issues_service.accept_issue(issue_id, doc_id, user, modified_fields)
+    try:
+        updated_issue = await issues_service.accept_issue(issue_id, doc_id, user, modified_fields, if_match)
+    except IssueModifiedError as e:
+        raise HTTPException(status_code=HTTPStatus.PRECONDITION_FAILED, detail=str(e))
 
     logging.info(f"Issue {issue_id} updated successfully.")
     return updated_issue
@@ -136,6 +263,7 @@ async def accept_issue(
         HTTPStatus.OK: {"description": "Issue updated successfully"},
         HTTPStatus.UNAUTHORIZED: {"description": "Unauthorized"},
         HTTPStatus.BAD_REQUEST: {"description": "Invalid data provided"},
+        HTTPStatus.PRECONDITION_FAILED: {"description": "Issue has been modified since it was retrieved"},
         HTTPStatus.UNPROCESSABLE_ENTITY: {"description": "Validation error"},
         HTTPStatus.INTERNAL_SERVER_ERROR: {"description": "Internal server error"},
     },
@@ -145,6 +273,7 @@ async def dismiss_issue(
     doc_id: str,
     issue_id: str,
     dismissal_feedback: Optional[DismissalFeedbackModel] = None,
+    if_match: Optional[str] = Header(default=None),
     user=Depends(validate_authenticated),
     issues_service: IssuesService = Depends(get_issues_service),
 ) -> Issue:
@@ -157,6 +286,7 @@ async def dismiss_issue(
         doc_minor_version (str): The minor version of the document.
         issue_id (str): The ID of the issue.
         dismissal_feedback (DismissalFeedbackModel): The feedback data to be updated.
+        if_match (str): optional - The issue's ETag. The update is rejected with 412 if the issue has changed since.
         user: The authenticated user object.
         issues_service (IssuesService): The issues service instance.
 
@@ -165,12 +295,75 @@ async def dismiss_issue(
     """
     logging.info(f"Request received to dismiss issue {issue_id} on document {doc_id}.")
 
-    updated_issue = await issues_service.dismiss_issue(issue_id, doc_id, user, dismissal_feedback)
+    try:
+        updated_issue = await issues_service.dismiss_issue(issue_id, doc_id, user, dismissal_feedback, if_match)
+    except IssueModifiedError as e:
+        raise HTTPException(status_code=HTTPStatus.PRECONDITION_FAILED, detail=str(e))
 
     logging.info(f"Issue {issue_id} updated successfully.")
     return updated_issue
 
 
+@router.patch(
+    "/api/v1/review/{doc_id}/issues:batch",
+    summary="Accept or dismiss many issues at once",
+    responses={
+        HTTPStatus.OK: {"description": "Issues updated, except those listed in failed_issue_ids"},
+        HTTPStatus.UNAUTHORIZED: {"description": "Unauthorized"},
+        HTTPStatus.BAD_REQUEST: {"description": "Invalid data provided"},
+        HTTPStatus.UNPROCESSABLE_ENTITY: {"description": "Validation error"},
+        HTTPStatus.INTERNAL_SERVER_ERROR: {"description": "Internal server error"},
+    },
+    response_model=BatchIssueActionResult
+)
+async def update_issues(
+    doc_id: str,
+    batch_action: BatchIssueActionModel,
+    user=Depends(validate_authenticated),
+    issues_service: IssuesService = Depends(get_issues_service),
+) -> BatchIssueActionResult:
+    """
+    Accepts or dismisses many issues within a document, in transactional batches of up to 100 issues.
+
+    Each batch is applied or left unchanged as a whole. If some batches fail, the issues of the other batches are
+    still updated, and the IDs of the issues left unchanged are returned so they can be retried. If every batch
+    fails, no issue is updated and an error is returned.
+
+    Args:
+        doc_id (str): The ID of the document.
+        batch_action (BatchIssueActionModel): The action, the IDs of the issues, and the optional modified fields
+            (when accepting) or dismissal feedback (when dismissing).
+        user: The authenticated user object.
+        issues_service (IssuesService): The issues service instance.
+
+    Returns:
+        BatchIssueActionResult: The updated issues, and the IDs of the issues that could not be updated.
+    """
+    logging.info(
+        f"Request received to {batch_action.action.value} {len(batch_action.issue_ids)} issues on document {doc_id}."
+    )
+
+    try:
+        result = await issues_service.update_issues(
+            doc_id,
+            batch_action.issue_ids,
+            batch_action.action,
+            user,
+            batch_action.modified_fields,
+            batch_action.dismissal_feedback
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+
+    if result.failed_issue_ids:
+        logging.warning(
+            f"{len(result.issues)} issues updated, {len(result.failed_issue_ids)} issues failed to update."
+        )
+    else:
+        logging.info(f"{len(result.issues)} issues updated successfully.")
+    return result
+
+
 @router.patch(
     "/api/v1/review/{doc_id}/issues/{issue_id}/feedback",
     summary="Provide feedback on a dismissed issue",
@@ -178,6 +371,7 @@ async def dismiss_issue(
         HTTPStatus.OK: {"description": "Issue updated successfully"},
         HTTPStatus.UNAUTHORIZED: {"description": "Unauthorized"},
         HTTPStatus.BAD_REQUEST: {"description": "Invalid data provided"},
+        HTTPStatus.PRECONDITION_FAILED: {"description": "Issue has been modified since it was retrieved"},
         HTTPStatus.UNPROCESSABLE_ENTITY: {"description": "Validation error"},
         HTTPStatus.INTERNAL_SERVER_ERROR: {"description": "Internal server error"},
     },
@@ -187,6 +381,7 @@ async def provide_feedback(
     doc_id: str,
     issue_id: str,
     dismissal_feedback: DismissalFeedbackModel,
+    if_match: Optional[str] = Header(default=None),
     user=Depends(validate_authenticated),
     issues_service: IssuesService = Depends(get_issues_service),
 ) -> Issue:
@@ -198,12 +393,16 @@ async def provide_feedback(
         doc_minor_version (str): The minor version of the document.
         issue_id (str): The ID of the issue.
         dismissal_feedback (DismissalFeedbackModel): The feedback data to be updated.
+        if_match (str): optional - The issue's ETag. The update is rejected with 412 if the issue has changed since.
         user: The authenticated user object.
         issues_service (IssuesService): The issues service instance.
     Returns:
         IssueModel: The updated issue.
     """
     logging.info(f"Request received to provide feedback on issue {issue_id} on document {doc_id}.")
-    updated_issue = await issues_service.add_feedback(issue_id, doc_id, dismissal_feedback)
+    try:
+        updated_issue = await issues_service.add_feedback(issue_id, doc_id, dismissal_feedback, if_match)
+    except IssueModifiedError as e:
+        raise HTTPException(status_code=HTTPStatus.PRECONDITION_FAILED, detail=str(e))
     logging.info(f"Issue {issue_id} updated successfully.")
     return updated_issue
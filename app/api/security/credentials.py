@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+from azure.core.credentials import AccessToken, TokenCredential
+from azure.identity import AzureCliCredential, ClientAssertionCredential, DefaultAzureCredential
+from common.logger import get_logger
+from config.config import settings
+
+logging = get_logger(__name__)
+
+# Tokens this close to expiry are not handed out, even while a background refresh is in progress
+MIN_TOKEN_VALIDITY_SECONDS = 30
+
+
+class CachedTokenCredential:
+    """
+    Wraps a credential to cache its tokens per scope, and refresh them in the background before they expire.
+
+    Callers only wait on the wrapped credential when there is no usable token cached (e.g. the first request for a
+    scope). Once a token is within `refresh_margin_seconds` of expiry it is still returned, and a single background
+    thread fetches its replacement.
+    """
+
+    def __init__(self, credential: TokenCredential, refresh_margin_seconds: int = settings.token_refresh_margin_seconds):
+        self.credential = credential
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._tokens: Dict[Tuple, AccessToken] = {}
+        self._refresh_locks: Dict[Tuple, threading.Lock] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        """Returns a cached token for the scopes, fetching one if none is cached or it is about to expire."""
+        return self.get_cached_token(*scopes, **kwargs) or self.refresh_token(*scopes, **kwargs)
+
+
+    def get_cached_token(self, *scopes: str, **kwargs: Any) -> Optional[AccessToken]:
+        """
+        Returns the cached token for the scopes without blocking, or None if there is no usable token cached.
+
+        Starts a background refresh if the token is due to be refreshed.
+        """
+        if kwargs.get("claims"):
+            # Claims challenges need a new token
+            return None
+
+        key = self._key(scopes, kwargs)
+        token = self._tokens.get(key)
+        if token is None:
+            return None
+
+        remaining_seconds = token.expires_on - time.time()
+        if remaining_seconds <= MIN_TOKEN_VALIDITY_SECONDS:
+            return None
+        if remaining_seconds <= self.refresh_margin_seconds:
+            self._refresh_in_background(scopes, kwargs)
+        return token
+
+
+    def refresh_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        """Fetches a new token from the wrapped credential, unless another thread has just done so."""
+        key = self._key(scopes, kwargs)
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(key, threading.Lock())
+
+        with refresh_lock:
+            token = self._tokens.get(key)
+            if token and token.expires_on - time.time() > self.refresh_margin_seconds and not kwargs.get("claims"):
+                return token
+
+            start = time.perf_counter()
+            token = self.credential.get_token(*scopes, **kwargs)
+            self._tokens[key] = token
+            logging.info(f"Acquired token for {', '.join(scopes)} in {(time.perf_counter() - start) * 1000:.0f} ms.")
+            return token
+
+
+    def _refresh_in_background(self, scopes: Tuple[str, ...], kwargs: Dict[str, Any]) -> None:
+        key = self._key(scopes, kwargs)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.refresh_token(*scopes, **kwargs)
+            except Exception as e:
+                logging.warning(f"Background token refresh for {', '.join(scopes)} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+    @staticmethod
+    def _key(scopes: Tuple[str, ...], kwargs: Dict[str, Any]) -> Tuple:
+        return scopes, tuple(sorted((name, str(value)) for name, value in kwargs.items()))
+
+
+class AsyncCachedTokenCredential:
+    """
+    Async adapter for a `CachedTokenCredential`, for async clients (e.g. the Cosmos DB client) and async code.
+
+    Cached tokens are returned directly. When a token has to be fetched, the wrapped credential runs in a worker
+    thread so the event loop is not blocked.
+    """
+
+    def __init__(self, credential: CachedTokenCredential):
+        self.credential = credential
+
+
+    async def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        token = self.credential.get_cached_token(*scopes, **kwargs)
+        if token is None:
+            token = await asyncio.to_thread(self.credential.refresh_token, *scopes, **kwargs)
+        return token
+
+
+    async def close(self) -> None:
+        # The wrapped credential is shared by the whole process, so it is not closed with any one client
+        pass
+
+
+    async def __aenter__(self) -> "AsyncCachedTokenCredential":
+        return self
+
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_default_credential() -> CachedTokenCredential:
+    """Returns the process-wide cached `DefaultAzureCredential`, used for Cosmos DB and workload identity federation."""
+    return CachedTokenCredential(DefaultAzureCredential())
+
+
+@lru_cache(maxsize=None)
+def get_flow_credential() -> AsyncCachedTokenCredential:
+    """Returns the process-wide cached credential used to call the flow endpoint."""
+    if "WEBSITE_INSTANCE_ID" in os.environ:
+        default_credential = get_default_credential()
+        credential = ClientAssertionCredential(
+            settings.aad_tenant_id,
+            os.environ.get('FLOW_CLIENT_ID'),
+            lambda: default_credential.get_token("api://AzureADTokenExchange/.default").token
+        )
+    else:
+        credential = AzureCliCredential()
+
+    return AsyncCachedTokenCredential(CachedTokenCredential(credential))
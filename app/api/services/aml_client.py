@@ -1,33 +1,55 @@
 import json
-from typing import Any, AsyncGenerator
-import requests
+from typing import Any, AsyncGenerator, Dict, List, Optional
+import httpx
 from http import HTTPStatus
 from fastapi import HTTPException
-from sseclient import SSEClient
 from config.config import settings
 from common.logger import get_logger
-from requests.exceptions import HTTPError, RequestException
+from services.sse import parse_sse_events
 
 logging = get_logger(__name__)
 
+
+def create_http_client() -> httpx.AsyncClient:
+    """Creates an HTTP client for the flow endpoint. Share one client per worker, so connections are pooled and reused."""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(settings.flow_read_timeout_seconds, connect=settings.flow_connect_timeout_seconds),
+        limits=httpx.Limits(
+            max_connections=settings.flow_max_connections,
+            max_keepalive_connections=settings.flow_max_connections
+        ),
+    )
+
+
 class AMLClient:
-    def __init__(self, credential):
+    def __init__(self, credential, http_client: Optional[httpx.AsyncClient] = None):
         self.credential = credential
+        self.http_client = http_client or create_http_client()
 
-    async def call_aml_endpoint(self, endpoint_name: str, pdf_name: str) -> AsyncGenerator[Any, Any]:
+    async def call_aml_endpoint(
+        self,
+        endpoint_name: str,
+        pdf_name: str,
+        previous_pdf_name: Optional[str] = None,
+        previous_issues: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncGenerator[Any, Any]:
         """
         Calls the flow endpoint with the name and data.
 
         Args:
             endpoint_name (str): The name of the flow endpoint.
             pdf_name (str): The filename of the PDF in storage.
+            previous_pdf_name (str): optional - the filename of the previous version of the PDF,
+                so only changed paragraphs are reviewed.
+            previous_issues (List[Dict[str, Any]]): optional - the issues of the previous version to carry over.
         """
 
         # Get the scoring URI and API key
         scoring_uri = f"https://{endpoint_name}.azurewebsites.net/score"
 
-        # Get access token from local endpoint
-        keys = self.credential.get_token(f"api://{settings.flow_app_name}/.default")
+        # Get access token for the flow endpoint (cached and refreshed in the background by the credential)
+        keys = await self.credential.get_token(f"api://{settings.flow_app_name}/.default")
 
         if not hasattr(keys, 'token'):
             raise Exception(f"Unable to retrieve token for the flow endpoint: {endpoint_name}. It may not have Entra Auth enabled.")
@@ -38,37 +60,41 @@ class AMLClient:
             "stream": True,
             "pagination": settings.flow_streaming_batch_size
         }
+        if previous_pdf_name:
+            data["previous_pdf_name"] = previous_pdf_name
+            data["previous_issues"] = previous_issues or []
 
         try:
             logging.info("Sending POST request to the flow endpoint...")
-            response = requests.post(scoring_uri, json=data, headers=headers, stream=True)
-            response.raise_for_status()
-
-            content_type = response.headers.get('Content-Type', '')
-            if "text/event-stream" in content_type:
-                logging.info("Streaming response received, processing events...")
-                client = SSEClient(response)
-
-                for event in client.events():
-                    logging.info(f"Received event: {event.data}")
-                    event_data = json.loads(event.data)
-                    if "flow_output_streaming" in event_data:
-                        yield event_data["flow_output_streaming"]
-                    elif "flow_output" in event_data:
-                        logging.debug("Ignoring non-streaming response event.")
-                    else:
-                        raise RequestException("Unexpected event payload from flow endpoint. Missing 'flow_output_streaming' property.")
-
-            else:
-                raise RequestException("Unexpected non-streaming response received from flow endpoint.")
-
-        except HTTPError as http_err:
+            async with self.http_client.stream("POST", scoring_uri, json=data, headers=headers) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+
+                content_type = response.headers.get('Content-Type', '')
+                if "text/event-stream" in content_type:
+                    logging.info("Streaming response received, processing events...")
+
+                    async for event in parse_sse_events(response.aiter_lines()):
+                        logging.info(f"Received event: {event.data}")
+                        event_data = json.loads(event.data)
+                        if "flow_output_streaming" in event_data:
+                            yield event_data["flow_output_streaming"]
+                        elif "flow_output" in event_data:
+                            logging.debug("Ignoring non-streaming response event.")
+                        else:
+                            raise httpx.RequestError("Unexpected event payload from flow endpoint. Missing 'flow_output_streaming' property.")
+
+                else:
+                    raise httpx.RequestError("Unexpected non-streaming response received from flow endpoint.")
+
+        except httpx.HTTPStatusError as http_err:
             logging.error(f"HTTP error occurred: {http_err}")
             raise HTTPException(
-                status_code=response.status_code,
+                status_code=http_err.response.status_code,
                 detail=f"Error from flow: {http_err.response.text}"
             )
-        except RequestException as req_err:
+        except httpx.RequestError as req_err:
             logging.error(f"Request error occurred: {req_err}")
             raise HTTPException(
                 status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
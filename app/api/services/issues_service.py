@@ -1,19 +1,38 @@
+import asyncio
 from common.logger import get_logger
 import uuid
 from datetime import datetime, timezone
-from typing import AsyncGenerator, List
+from itertools import groupby
+from typing import AsyncGenerator, List, Optional, Tuple
 from services.aml_client import AMLClient
 from database.issues_repository import IssuesRepository
+from database.reviews_repository import ReviewsRepository
+from database.job_queue import QueueFullError, ReviewJobQueue
+from services.review_coordinator import ReviewCoordinator
+from fastapi import HTTPException
 from fastapi_azure_auth.user import User
 from config.config import settings
-from common.models import FlowOutputChunk, Issue, IssueStatusEnum, ModifiedFieldsModel, DismissalFeedbackModel
+from common.models import (
+    BatchIssueActionResult, FlowOutputChunk, Issue, IssueActionEnum, IssueStatusEnum, ModifiedFieldsModel, DismissalFeedbackModel,
+    ReviewJob, ReviewJobStatusEnum, ReviewProgress, ReviewStatusEnum
+)
 
 logging = get_logger(__name__)
 
 class IssuesService:
-    def __init__(self, issues_repository: IssuesRepository, aml_client: AMLClient) -> None:
+    def __init__(
+        self,
+        issues_repository: IssuesRepository,
+        aml_client: AMLClient,
+        review_coordinator: Optional[ReviewCoordinator] = None,
+        reviews_repository: Optional[ReviewsRepository] = None,
+        job_queue: Optional[ReviewJobQueue] = None
+    ) -> None:
         self.aml_client = aml_client
         self.issues_repository = issues_repository
+        self.review_coordinator = review_coordinator
+        self.reviews_repository = reviews_repository
+        self.job_queue = job_queue
 
 
     async def get_issues_data(self, doc_id: str) -> List[Issue]:
@@ -36,7 +55,204 @@ class IssuesService:
             raise e
 
 
-    async def initiate_review(self, pdf_name: str, user: User, time_stamp: datetime) -> AsyncGenerator:
+    async def get_issues_pages(
+        self, doc_id: str, page_size: int, continuation_token: Optional[str] = None
+    ) -> AsyncGenerator[Tuple[List[Issue], Optional[str]], None]:
+        """
+        Retrieves document issues for a given document ID, one page at a time.
+
+        Args:
+            doc_id (str): Document ID
+            page_size (int): The maximum number of issues in each page
+            continuation_token (str): optional - the continuation token of a previous page, to resume from
+
+        Returns:
+            Generator: Stream of (issues, continuation token for the next page) tuples. The continuation token is
+                None for the last page.
+        """
+        try:
+            logging.debug(f"Retrieving document issues for {doc_id} in pages of {page_size}")
+            while True:
+                issues, continuation_token = await self.issues_repository.get_issues_page(
+                    doc_id, page_size, continuation_token
+                )
+                yield issues, continuation_token
+                if not continuation_token:
+                    break
+
+        except Exception as e:
+            logging.error(f"Error retrieving PDF issues for doc_id={doc_id}: {str(e)}")
+            raise e
+
+
+    async def get_review_progress(self, doc_id: str) -> Optional[ReviewProgress]:
+        """
+        Retrieves the progress of the review of a document.
+
+        Args:
+            doc_id (str): Document ID
+
+        Returns:
+            ReviewProgress: The review progress, or None if it is not recorded
+        """
+        if self.reviews_repository is None:
+            return None
+        return await self.reviews_repository.get_progress(doc_id)
+
+
+    async def is_review_in_progress(self, doc_id: str) -> bool:
+        """
+        Checks whether a review of a document is queued or running, on this or another worker.
+
+        Args:
+            doc_id (str): Document ID
+        """
+        if self.job_queue is not None:
+            job = await self.job_queue.get(doc_id)
+            return job is not None and job.status in (ReviewJobStatusEnum.queued, ReviewJobStatusEnum.running)
+
+        return await self._is_live_review(await self.get_review_progress(doc_id))
+
+
+    async def resume_review(
+        self, pdf_name: str, user: User, time_stamp: datetime, last_event_id: int
+    ) -> AsyncGenerator[List[Issue], None]:
+        """
+        Resumes a review stream after the last event the client received.
+
+        The issues stored since that event are sent first, one chunk per review event. If the review is still in
+        progress, the stream then attaches to it and continues with the events the client has not received.
+
+        Args:
+            pdf_name (str): file name of the PDF
+            user (dict): User initiating the review
+            time_stamp (datetime): Time stamp of the review initiation
+            last_event_id (int): The sequence number of the last review event received
+
+        Returns:
+            Generator: Stream of issues for the document
+        """
+        if self.job_queue is not None:
+            async for issues in self.tail_review(pdf_name, last_event_id):
+                yield issues
+            return
+
+        # Read the progress before the stored issues, so a review that completes in between is not missed
+        progress = await self.get_review_progress(pdf_name)
+        missed_issues = await self.issues_repository.get_issues_after(pdf_name, last_event_id)
+        logging.info(f"Resuming review of document {pdf_name} after event {last_event_id}")
+
+        for review_seq, issues in groupby(missed_issues, key=lambda issue: issue.review_seq):
+            last_event_id = review_seq
+            yield list(issues)
+
+        if progress and progress.status == ReviewStatusEnum.in_progress:
+            if not await self._is_live_review(progress):
+                raise RuntimeError(f"Review of document {pdf_name} stopped before it completed.")
+            async for issues in await self.review_document(pdf_name, user, time_stamp):
+                issues = [issue for issue in issues if issue.review_seq is None or issue.review_seq > last_event_id]
+                if issues:
+                    yield issues
+
+
+    async def review_document(
+        self, pdf_name: str, user: User, time_stamp: datetime, previous_doc_id: Optional[str] = None
+    ) -> AsyncGenerator:
+        """
+        Reviews a document, or attaches to the review already in progress for it.
+
+        When a job queue is configured, the review is queued to run on a review worker and the stream follows its
+        progress, so the review carries on if the request is cancelled.
+
+        Args:
+            pdf_name (str): file name of the PDF
+            user (dict): User initiating the review
+            time_stamp (datetime): Time stamp of the review initiation
+            previous_doc_id (str): optional - ID of the previous version of the document (see `initiate_review`).
+
+        Returns:
+            Generator: Stream of issues for the document
+
+        Raises:
+            HTTPException: With status 503 if the job queue is full.
+        """
+        if self.job_queue is not None:
+            job = ReviewJob(
+                doc_id=pdf_name, user_oid=user.oid, time_stamp=time_stamp, previous_doc_id=previous_doc_id
+            )
+            try:
+                if await self.job_queue.enqueue(job):
+                    logging.info(f"Queued review of document {pdf_name}")
+                else:
+                    logging.info(f"Review of document {pdf_name} already queued. Following its progress...")
+            except QueueFullError as e:
+                logging.warning(f"Unable to queue review of document {pdf_name}: {e}")
+                raise HTTPException(status_code=503, detail=str(e))
+            return self.tail_review(pdf_name)
+
+        if self.review_coordinator is None:
+            return self.initiate_review(pdf_name, user, time_stamp, previous_doc_id)
+
+        return self.review_coordinator.review(
+            pdf_name, lambda: self.initiate_review(pdf_name, user, time_stamp, previous_doc_id)
+        )
+
+
+    async def tail_review(self, pdf_name: str, last_event_id: int = 0) -> AsyncGenerator[List[Issue], None]:
+        """
+        Follows the queued review of a document, sending its issues one chunk per review event as they are stored.
+
+        Args:
+            pdf_name (str): file name of the PDF
+            last_event_id (int): optional - the sequence number of the last review event already received
+
+        Returns:
+            Generator: Stream of issues for the document
+        """
+        while True:
+            # Read the job before the stored issues, so the last read happens after the review stored all its issues
+            job = await self.job_queue.get(pdf_name)
+            stored_issues = await self.issues_repository.get_issues_after(pdf_name, last_event_id)
+            for review_seq, issues in groupby(stored_issues, key=lambda issue: issue.review_seq):
+                last_event_id = review_seq
+                yield list(issues)
+
+            if job is None or job.status == ReviewJobStatusEnum.complete:
+                return
+            if job.status == ReviewJobStatusEnum.failed:
+                raise RuntimeError(f"Review of document {pdf_name} failed: {job.error}")
+            await asyncio.sleep(settings.review_follow_interval_seconds)
+
+
+    async def run_review_job(self, job: ReviewJob) -> None:
+        """
+        Runs a queued review, storing its issues and progress as each chunk arrives.
+
+        Args:
+            job (ReviewJob): The review job.
+        """
+        stored_issues = await self.issues_repository.get_issues(job.doc_id)
+        last_event_id = 0
+        if stored_issues and job.attempts == 1:
+            logging.info(f"Document {job.doc_id} already has stored issues. Skipping review...")
+            return
+        if stored_issues:
+            # An earlier attempt stopped part way through: start over, numbering events after the ones already sent
+            progress = await self.get_review_progress(job.doc_id)
+            last_event_id = max(
+                [progress.last_event_id if progress else 0] + [issue.review_seq or 0 for issue in stored_issues]
+            )
+            await self.issues_repository.delete_issues(job.doc_id, [issue.id for issue in stored_issues])
+
+        async for _ in self._initiate_review(
+            job.doc_id, job.user_oid, job.time_stamp, job.previous_doc_id, last_event_id
+        ):
+            pass
+
+
+    def initiate_review(
+        self, pdf_name: str, user: User, time_stamp: datetime, previous_doc_id: Optional[str] = None
+    ) -> AsyncGenerator:
         """
         Initiates a review for a given document ID.
 
@@ -44,33 +260,98 @@ class IssuesService:
             pdf_name (str): file name of the PDF
             user (dict): User initiating the review
             time_stamp (datetime): Time stamp of the review initiation
+            previous_doc_id (str): optional - ID of the previous version of the document. Only changed paragraphs
+                are reviewed, and issues in unchanged paragraphs are carried over from the previous version.
 
         Returns:
             Generator: Stream of issues for the document
         """
+        return self._initiate_review(pdf_name, user.oid, time_stamp, previous_doc_id)
+
+
+    async def _initiate_review(
+        self,
+        pdf_name: str,
+        user_oid: str,
+        time_stamp: datetime,
+        previous_doc_id: Optional[str] = None,
+        last_event_id: int = 0
+    ) -> AsyncGenerator:
+        progress = None
         try:
             logging.info(f"Initiating review for document {pdf_name}")
 
+            review_options = {}
+            previous_issues = {}
+            if previous_doc_id:
+                logging.info(f"Reviewing changes to {pdf_name} since previous version {previous_doc_id}")
+                previous_issues = {
+                    issue.id: issue for issue in await self.issues_repository.get_issues(previous_doc_id)
+                    if issue.location
+                }
+                review_options = {
+                    "previous_pdf_name": previous_doc_id,
+                    "previous_issues": [
+                        issue.model_dump(include={"id", "text", "location"}) for issue in previous_issues.values()
+                    ]
+                }
+
+            progress = ReviewProgress(
+                doc_id=pdf_name,
+                status=ReviewStatusEnum.in_progress,
+                last_event_id=last_event_id,
+                updated_at_UTC=datetime.now(timezone.utc).isoformat()
+            )
+            await self._store_progress(progress)
+
             # Initiate review to get a stream of issues
-            stream_data = self.aml_client.call_aml_endpoint(settings.flow_endpoint_name, pdf_name)
+            stream_data = self.aml_client.call_aml_endpoint(settings.flow_endpoint_name, pdf_name, **review_options)
             async for chunk in stream_data:
                 flow_output = FlowOutputChunk.model_validate_json(chunk)
+
+                # Number each chunk, so a client that reconnects can resume after the last chunk it received
+                review_seq = progress.last_event_id + 1
                 issues = [
                     Issue(
                         **i.model_dump(),
                         id=str(uuid.uuid4()),
                         doc_id=pdf_name,
                         status=IssueStatusEnum.not_reviewed,
-                        review_initiated_by=user.oid,
-                        review_initiated_at_UTC=time_stamp
+                        review_initiated_by=user_oid,
+                        review_initiated_at_UTC=time_stamp,
+                        review_seq=review_seq
                     ) for i in flow_output.issues
                 ]
 
+                # Copy issues (and their review status) from unchanged paragraphs of the previous version
+                issues += [
+                    previous_issues[carried.id].model_copy(update={
+                        "id": str(uuid.uuid4()),
+                        "doc_id": pdf_name,
+                        "location": carried.location,
+                        "review_seq": review_seq
+                    }) for carried in flow_output.carried_over if carried.id in previous_issues
+                ]
+
                 logging.info(f"Storing issues for document {pdf_name}")
                 await self.issues_repository.store_issues(issues)
+
+                # Record progress once the chunk is stored, so the progress never runs ahead of the stored issues
+                progress.last_event_id = review_seq
+                progress.chunks_done = (
+                    flow_output.chunks_done if flow_output.chunks_done is not None else progress.chunks_done + 1
+                )
+                progress.chunks_total = flow_output.chunks_total
+                await self._store_progress(progress)
                 yield issues
 
+            progress.status = ReviewStatusEnum.complete
+            await self._store_progress(progress)
+
         except Exception as e:
+            if progress:
+                progress.status = ReviewStatusEnum.failed
+                await self._store_progress(progress)
             if hasattr(e, "errors"):
                 error_details = e.errors()
                 logging.error("Error validating JSON chunk: %s", error_details)
@@ -79,8 +360,41 @@ class IssuesService:
             raise e
 
 
+    async def _is_live_review(self, progress: Optional[ReviewProgress]) -> bool:
+        """
+        Checks whether recorded progress belongs to a review that is still running. A worker that crashed leaves its
+        review in progress, so the review also needs to be running on this worker or to hold its lease. A stale
+        review is recorded as failed.
+        """
+        if progress is None or progress.status != ReviewStatusEnum.in_progress:
+            return False
+        if self.review_coordinator is None or await self.review_coordinator.is_reviewing(progress.doc_id):
+            return True
+
+        logging.warning(f"Review of document {progress.doc_id} is recorded in progress, but is not running.")
+        progress.status = ReviewStatusEnum.failed
+        await self._store_progress(progress)
+        return False
+
+
+    async def _store_progress(self, progress: ReviewProgress) -> None:
+        # Progress is only needed to resume a stream, so failing to record it does not fail the review
+        if self.reviews_repository is None:
+            return
+        try:
+            progress.updated_at_UTC = datetime.now(timezone.utc).isoformat()
+            await self.reviews_repository.store_progress(progress)
+        except Exception as e:
+            logging.warning(f"Unable to store review progress for document {progress.doc_id}: {e}")
+
+
     async def accept_issue(
-        self, issue_id: str, doc_id: str, user: User, modified_fields: ModifiedFieldsModel = None
+        self,
+        issue_id: str,
+        doc_id: str,
+        user: User,
+        modified_fields: ModifiedFieldsModel = None,
+        etag: Optional[str] = None
     ) -> Issue:
         """
         Accepts an issue and optionally record modified fields.
@@ -90,22 +404,15 @@ class IssuesService:
             doc_id: The ID of the document.
             user: The user object.
             modified_fields: optional - fields modified by user.
+            etag: optional - only accept the issue if it has not changed since this ETag was read.
         """
         try:
-            issue = await self.issues_repository.get_issue(doc_id, issue_id)
-            update_fields = {
-                "status": IssueStatusEnum.accepted,
-                "resolved_by": user.oid,
-                "resolved_at_UTC": datetime.now(timezone.utc).isoformat()
-            }
-
-            if modified_fields:
-                update_fields["modified_fields"] = modified_fields.model_dump(exclude_none=True)
-
-            #  Store and return issue
-            updated_issue = issue.model_copy(update=update_fields)
-            await self.issues_repository.store_issues([updated_issue])
-            return updated_issue
+            return await self.issues_repository.update_issue(
+                doc_id,
+                issue_id,
+                accept_fields(user, modified_fields),
+                etag
+            )
 
         except ValueError as e:
             logging.error(
@@ -120,7 +427,12 @@ class IssuesService:
 
 
     async def dismiss_issue(
-        self, issue_id: str, doc_id: str, user: User, dismissal_feedback: DismissalFeedbackModel = None
+        self,
+        issue_id: str,
+        doc_id: str,
+        user: User,
+        dismissal_feedback: DismissalFeedbackModel = None,
+        etag: Optional[str] = None
     ) -> Issue:
         """
         Dismisses an issue and provides optional feedback.
@@ -130,21 +442,14 @@ class IssuesService:
             doc_id: The ID of the document.
             user: The user object.
             dismissal_feedback: optional - feedback provided by user.
+            etag: optional - only dismiss the issue if it has not changed since this ETag was read.
         """
         try:
-            update_fields = {
-                "status": IssueStatusEnum.dismissed,
-                "resolved_by": user.oid,
-                "resolved_at_UTC": datetime.now(timezone.utc).isoformat()
-            }
-
-            if dismissal_feedback:
-                update_fields["dismissal_feedback"] = dismissal_feedback.model_dump()
-
             return await self.issues_repository.update_issue(
                 doc_id,
                 issue_id,
-                update_fields
+                dismiss_fields(user, dismissal_feedback),
+                etag
             )
 
         except ValueError as e:
@@ -159,8 +464,49 @@ class IssuesService:
             raise
 
 
+    async def update_issues(
+        self,
+        doc_id: str,
+        issue_ids: List[str],
+        action: IssueActionEnum,
+        user: User,
+        modified_fields: ModifiedFieldsModel = None,
+        dismissal_feedback: DismissalFeedbackModel = None
+    ) -> BatchIssueActionResult:
+        """
+        Accepts or dismisses many issues of a document at once, returning the updated issues and the IDs of the
+        issues that could not be updated.
+
+        Args:
+            doc_id: The ID of the document.
+            issue_ids: The IDs of the issues.
+            action: Whether to accept or dismiss the issues.
+            user: The user object.
+            modified_fields: optional - fields modified by user, when accepting.
+            dismissal_feedback: optional - feedback provided by user, when dismissing.
+        """
+        try:
+            if action == IssueActionEnum.accept:
+                update_fields = accept_fields(user, modified_fields)
+            else:
+                update_fields = dismiss_fields(user, dismissal_feedback)
+
+            return await self.issues_repository.update_issues(doc_id, issue_ids, update_fields)
+
+        except ValueError as e:
+            logging.error(
+                f"Validation error while updating {len(issue_ids)} issues on document {doc_id}: {e}"
+            )
+            raise
+        except Exception as e:
+            logging.error(
+                f"Failed to update {len(issue_ids)} issues on document {doc_id}: {e}"
+            )
+            raise
+
+
     async def add_feedback(
-        self, issue_id: str, doc_id: str, feedback: DismissalFeedbackModel
+        self, issue_id: str, doc_id: str, feedback: DismissalFeedbackModel, etag: Optional[str] = None
     ) -> Issue:
         """
         Adds feedback to an issue.
@@ -168,13 +514,14 @@ class IssuesService:
             issue_id: The ID of the issue.
             doc_id: The ID of the document.
             feedback: Feedback provided by user.
+            etag: optional - only add the feedback if the issue has not changed since this ETag was read.
         """
         try:
             return await self.issues_repository.update_issue(
                 doc_id,
                 issue_id, {
                 "feedback": feedback.model_dump(exclude_none=True)
-            })
+            }, etag)
         except ValueError as e:
             logging.error(
                 f"Validation error while providing feedback on issue {issue_id}: {e}"
@@ -185,3 +532,29 @@ class IssuesService:
                 f"Failed to provide feedback on issue {issue_id}: {e}"
             )
             raise
+
+
+def accept_fields(user: User, modified_fields: Optional[ModifiedFieldsModel] = None) -> dict:
+    """Fields to set when a user accepts an issue."""
+    update_fields = {
+        "status": IssueStatusEnum.accepted,
+        "resolved_by": user.oid,
+        "resolved_at_UTC": datetime.now(timezone.utc).isoformat()
+    }
+
+    if modified_fields:
+        update_fields["modified_fields"] = modified_fields.model_dump(exclude_none=True)
+    return update_fields
+
+
+def dismiss_fields(user: User, dismissal_feedback: Optional[DismissalFeedbackModel] = None) -> dict:
+    """Fields to set when a user dismisses an issue."""
+    update_fields = {
+        "status": IssueStatusEnum.dismissed,
+        "resolved_by": user.oid,
+        "resolved_at_UTC": datetime.now(timezone.utc).isoformat()
+    }
+
+    if dismissal_feedback:
+        update_fields["dismissal_feedback"] = dismissal_feedback.model_dump()
+    return update_fields
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import socket
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Set
+from common.logger import get_logger
+from common.models import Issue
+from config.config import settings
+from database.issues_repository import IssuesRepository
+from database.leases_repository import LeasesRepository
+
+logging = get_logger(__name__)
+
+
+class ReviewRun:
+    """The chunks of issues produced so far by a review, which any number of subscribers can replay and tail."""
+
+    def __init__(self) -> None:
+        self.chunks: List[List[Issue]] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._changed = asyncio.Condition()
+
+
+    async def publish(self, issues: List[Issue]) -> None:
+        async with self._changed:
+            self.chunks.append(issues)
+            self._changed.notify_all()
+
+
+    async def finish(self, error: Optional[Exception] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+
+    async def subscribe(self) -> AsyncGenerator[List[Issue], None]:
+        """Yields every chunk produced so far, then each new chunk as it is produced, until the review finishes."""
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                chunks = self.chunks[index:]
+                finished = self.done and index + len(chunks) == len(self.chunks)
+
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+
+            if finished:
+                if self.error:
+                    raise self.error
+                return
+
+
+class ReviewCoordinator:
+    """
+    Makes sure each document is only reviewed once at a time (single-flight).
+
+    Within a worker, requests to review a document that is already being reviewed attach to the running review,
+    replaying the issues produced so far and then receiving new ones as they arrive. Across workers, the review holds
+    a lease for the document; a worker that cannot acquire the lease follows the issues being stored by the worker
+    that holds it, until the lease is released. A review whose lease is lost (e.g. it could not renew the lease before
+    it expired) is stopped, as another worker may have started reviewing the document.
+    """
+
+    def __init__(self, issues_repository: IssuesRepository, leases_repository: Optional[LeasesRepository] = None) -> None:
+        self.issues_repository = issues_repository
+        self.leases_repository = leases_repository
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._runs: Dict[str, ReviewRun] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+
+    def review(
+        self, doc_id: str, start_review: Callable[[], AsyncGenerator[List[Issue], None]]
+    ) -> AsyncGenerator[List[Issue], None]:
+        """
+        Streams the issues of a review of the document, starting the review only if one is not already running.
+
+        Args:
+            doc_id (str): The ID of the document.
+            start_review (Callable): Starts a review of the document, returning a stream of issues.
+
+        Returns:
+            Generator: Stream of issues for the document
+        """
+        run = self._runs.get(doc_id)
+        if run is None:
+            # Register the run before anything is awaited, so concurrent requests in this worker attach to it
+            run = self._runs[doc_id] = ReviewRun()
+            task = asyncio.create_task(self._drive(doc_id, run, start_review))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            logging.info(f"Review of document {doc_id} already in progress. Attaching to it...")
+
+        return run.subscribe()
+
+
+    async def is_reviewing(self, doc_id: str) -> bool:
+        """
+        Checks whether the document is being reviewed, by this worker or by the worker holding its lease.
+
+        Args:
+            doc_id (str): The ID of the document.
+        """
+        if doc_id in self._runs:
+            return True
+        return self.leases_repository is not None and await self.leases_repository.is_held(self._lease_id(doc_id))
+
+
+    async def close(self) -> None:
+        """Stops the reviews in progress, releasing their leases."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+    async def _drive(
+        self, doc_id: str, run: ReviewRun, start_review: Callable[[], AsyncGenerator[List[Issue], None]]
+    ) -> None:
+        # Runs independently of the requests, so the review completes (and is stored) even if they disconnect
+        try:
+            if self.leases_repository is None:
+                async for issues in start_review():
+                    await run.publish(issues)
+            elif await self.leases_repository.acquire(self._lease_id(doc_id), self.owner):
+                await self._review_with_lease(doc_id, run, start_review)
+            else:
+                logging.info(f"Review of document {doc_id} in progress on another worker. Following its issues...")
+                await self._follow(doc_id, run)
+            await run.finish()
+        except asyncio.CancelledError:
+            await run.finish(RuntimeError(f"Review of document {doc_id} was stopped."))
+            raise
+        except Exception as e:
+            await run.finish(e)
+        finally:
+            self._runs.pop(doc_id, None)
+
+
+    async def _review_with_lease(
+        self, doc_id: str, run: ReviewRun, start_review: Callable[[], AsyncGenerator[List[Issue], None]]
+    ) -> None:
+        lease_id = self._lease_id(doc_id)
+        review = asyncio.create_task(self._publish_review(doc_id, run, start_review))
+        heartbeat = asyncio.create_task(self._renew_lease(lease_id, review))
+        try:
+            await review
+        except asyncio.CancelledError:
+            # The heartbeat only finishes once the lease is lost, after cancelling the review
+            if not heartbeat.done() or heartbeat.cancelled():
+                raise
+            raise RuntimeError(f"Review of document {doc_id} was stopped after its lease was lost.")
+        finally:
+            heartbeat.cancel()
+            try:
+                await self.leases_repository.release(lease_id, self.owner)
+            except Exception as e:
+                logging.warning(f"Unable to release lease {lease_id}, it will expire instead: {e}")
+
+
+    async def _publish_review(
+        self, doc_id: str, run: ReviewRun, start_review: Callable[[], AsyncGenerator[List[Issue], None]]
+    ) -> None:
+        # Another worker may have completed a review between the caller finding no stored issues and the lease
+        stored_issues = await self.issues_repository.get_issues(doc_id)
+        if stored_issues:
+            await run.publish(stored_issues)
+            return
+
+        async for issues in start_review():
+            await run.publish(issues)
+
+
+    async def _renew_lease(self, lease_id: str, review: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(settings.review_lease_ttl_seconds / 3)
+            try:
+                if not await self.leases_repository.renew(lease_id, self.owner):
+                    # The lease expired, and may now be held by another worker reviewing the document
+                    logging.warning(f"Lease {lease_id} was lost. Stopping the review...")
+                    review.cancel()
+                    return
+            except Exception as e:
+                logging.warning(f"Unable to renew lease {lease_id}: {e}")
+
+
+    async def _follow(self, doc_id: str, run: ReviewRun) -> None:
+        """
+        Publishes the issues stored by the review on another worker as they appear, until it releases its lease.
+
+        Each poll only reads the issues of the latest review event seen and the events after it, rather than every
+        issue of the document. The latest event is read again, as its issues may be stored in several batches.
+        """
+        last_seq, last_seq_issue_ids = 0, set()
+        while True:
+            # Check the lease before reading, so the last read happens after the review has stored all its issues
+            lease_held = await self.leases_repository.is_held(self._lease_id(doc_id))
+            issues = await self.issues_repository.get_issues_after(doc_id, last_seq - 1)
+            new_issues = [issue for issue in issues if issue.id not in last_seq_issue_ids]
+            if new_issues:
+                await run.publish(new_issues)
+            if issues:
+                last_seq = issues[-1].review_seq
+                last_seq_issue_ids = {issue.id for issue in issues if issue.review_seq == last_seq}
+
+            if not lease_held:
+                return
+            await asyncio.sleep(settings.review_follow_interval_seconds)
+
+
+    @staticmethod
+    def _lease_id(doc_id: str) -> str:
+        return f"review:{doc_id}"
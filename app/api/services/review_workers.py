@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable, List
+from common.logger import get_logger
+from common.models import ReviewJob
+from config.config import settings
+from database.job_queue import ReviewJobQueue
+
+logging = get_logger(__name__)
+
+
+class ReviewWorkerPool:
+    """
+    Runs queued review jobs in the background, independently of the requests that queued them.
+
+    Each of the `workers` tasks claims one job at a time, so at most that many reviews run at once and the rest wait
+    in the queue. A job that fails is retried with exponential backoff, up to `review_job_max_attempts` attempts.
+    A job whose claim is lost (its heartbeats stalled and another worker claimed it) is stopped.
+    """
+
+    def __init__(
+        self,
+        job_queue: ReviewJobQueue,
+        run_job: Callable[[ReviewJob], Awaitable[None]],
+        workers: int = settings.review_workers
+    ) -> None:
+        self.job_queue = job_queue
+        self.run_job = run_job
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+
+
+    def start(self) -> None:
+        """Starts the worker tasks."""
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logging.info(f"Started {self.workers} review workers.")
+
+
+    async def close(self) -> None:
+        """
+        Stops the worker tasks. Jobs that were running are claimed again (by this or another process) once their
+        heartbeats time out.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await self.job_queue.claim()
+            except Exception as e:
+                logging.error(f"Unable to claim a review job: {e}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(settings.review_queue_poll_interval_seconds)
+            else:
+                await self._run(job)
+
+
+    async def _run(self, job: ReviewJob) -> None:
+        logging.info(f"Running review job for document {job.doc_id} (attempt {job.attempts}).")
+        run = asyncio.create_task(self.run_job(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job, run))
+        try:
+            await run
+            if await self.job_queue.complete(job):
+                logging.info(f"Review job for document {job.doc_id} complete.")
+        except asyncio.CancelledError:
+            # The heartbeat only finishes once the claim is lost, after cancelling the review
+            if not heartbeat.done() or heartbeat.cancelled():
+                raise
+            logging.warning(f"Review job for document {job.doc_id} was claimed by another worker. Stopped running it.")
+        except Exception as e:
+            if job.attempts < settings.review_job_max_attempts:
+                delay = settings.review_job_retry_delay_seconds * 2 ** (job.attempts - 1)
+                logging.warning(f"Review job for document {job.doc_id} failed, retrying in {delay}s: {e}")
+                await self.job_queue.retry(job, delay, str(e))
+            else:
+                logging.error(f"Review job for document {job.doc_id} failed after {job.attempts} attempts: {e}")
+                await self.job_queue.fail(job, str(e))
+        finally:
+            heartbeat.cancel()
+
+
+    async def _heartbeat(self, job: ReviewJob, run: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(settings.review_job_visibility_timeout_seconds / 3)
+            try:
+                if not await self.job_queue.heartbeat(job):
+                    # Another worker has claimed the job since, and will run the review again
+                    run.cancel()
+                    return
+            except Exception as e:
+                logging.warning(f"Unable to send heartbeat for review job of document {job.doc_id}: {e}")
@@ -0,0 +1,49 @@
+from typing import AsyncGenerator, AsyncIterable, Optional
+from pydantic import BaseModel
+
+
+class ServerSentEvent(BaseModel):
+    event: str = "message"
+    data: str = ""
+    id: Optional[str] = None
+
+
+async def parse_sse_events(lines: AsyncIterable[str]) -> AsyncGenerator[ServerSentEvent, None]:
+    """
+    Parses a text/event-stream incrementally, yielding each event as soon as its terminating blank line arrives.
+
+    See https://html.spec.whatwg.org/multipage/server-sent-events.html#event-stream-interpretation
+
+    Args:
+        lines: The lines of the response body, without line endings.
+
+    Returns:
+        Generator: Stream of events with data.
+    """
+    event, data, event_id = None, [], None
+
+    async for line in lines:
+        if not line:
+            # A blank line dispatches the event, if it has any data
+            if data:
+                yield ServerSentEvent(event=event or "message", data="\n".join(data), id=event_id)
+            event, data = None, []
+            continue
+
+        if line.startswith(":"):
+            # Comment, e.g. a keep-alive
+            continue
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+        elif field == "id" and "\0" not in value:
+            event_id = value
+
+    if data:
+        yield ServerSentEvent(event=event or "message", data="\n".join(data), id=event_id)
@@ -52,6 +52,13 @@ export function IssueCard({ docId, issue, selected, onSelect, onUpdate }: IssueC
   const [feedbackSubmitted, setFeedbackSubmitted] = useState<boolean>(false);
   const [error, setError] = useState<string>();
 
+  /**
+   * Precondition header so the update is rejected if someone else changed the issue since it was loaded.
+   */
+  function ifMatch(): Record<string, string> | undefined {
+    return issue.etag ? { 'If-Match': issue.etag } : undefined;
+  }
+
   /**
    * Accepts an issue and posts any modified fields.
    */
@@ -71,7 +78,8 @@ export function IssueCard({ docId, issue, selected, onSelect, onUpdate }: IssueC
       const response = await callApi(
         `${docId}/issues/${issue.id}/accept`,
         'PATCH',
-        Object.keys(modifiedFields).length ? modifiedFields : undefined
+        Object.keys(modifiedFields).length ? modifiedFields : undefined,
+        ifMatch()
       )
       // Update issue state
       const updatedIssue = (await response.json()) as Issue;
@@ -95,7 +103,7 @@ export function IssueCard({ docId, issue, selected, onSelect, onUpdate }: IssueC
   async function handleDismiss() {
     try {
       setDismissing(true);
-      const response = await callApi(`${docId}/issues/${issue.id}/dismiss`, 'PATCH');
+      const response = await callApi(`${docId}/issues/${issue.id}/dismiss`, 'PATCH', undefined, ifMatch());
       const updatedIssue = (await response.json()) as Issue;
       if (onUpdate) {
         onUpdate(updatedIssue);
@@ -59,13 +59,14 @@ async function getErrorMessage(response: Response): Promise<string> {
   return message
 }
 
-export async function callApi(path: string, method = 'GET', body?: object) {
+export async function callApi(path: string, method = 'GET', body?: object, headers?: Record<string, string>) {
   const token = await getAccessToken()
 
   const response = await fetch(apiBaseUrl + path, {
     headers: {
       Authorization: `Bearer ${token}`,
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      ...headers
     },
     method,
     body: body ? JSON.stringify(body) : null
@@ -91,13 +92,16 @@ export async function streamApi(
   maxRetries = 3
 ) {
   let retries = 0
+  let lastEventId: string | undefined
 
   async function startStream() {
     const token = await getAccessToken()
 
     fetchEventSource(apiBaseUrl + path, {
       headers: {
-        Authorization: `Bearer ${token}`
+        Authorization: `Bearer ${token}`,
+        // When reconnecting, resume after the last event received so only the missed events are sent again
+        ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {})
       },
       signal: abortControllerRef.signal,
       async onopen(response) {
@@ -118,22 +122,31 @@ export async function streamApi(
       onmessage(msg) {
         console.log('Message:', msg)
         messageHandler(msg)
+        if (msg.id) {
+          lastEventId = msg.id
+        }
       },
       onclose() {
         console.log('Stream closed')
       },
       onerror(err) {
         console.error('Stream error', err)
-        // If the error is retriable, attempt to retry
-        if (err instanceof RetriableError && retries < maxRetries) {
+        // If the error is retriable or the connection dropped (fetch raises a TypeError), attempt to retry
+        if ((err instanceof RetriableError || err instanceof TypeError) && retries < maxRetries) {
           retries++
           console.log(`Retrying stream... (${retries}/${maxRetries})`)
           startStream()
+          // Stop this stream, so it is not also retried by fetchEventSource
+          throw new AbortedError()
         } else {
           throw err
         }
       }
-    }).catch(fatalErrorHandler)
+    }).catch((err) => {
+      if (!(err instanceof AbortedError)) {
+        fatalErrorHandler(err)
+      }
+    })
   }
 
   startStream()
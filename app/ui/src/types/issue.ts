@@ -17,6 +17,7 @@ export interface Issue {
   resolved_at_UTC: string
   modified_fields: ModifiedFields
   dismissal_feedback: DismissalFeedback
+  etag?: string
 }
 
 export enum IssueStatus {
@@ -0,0 +1,80 @@
+from typing import Generator, Iterable
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally parses the items of an array property of a JSON object that arrives in fragments, e.g. the
+    `issues` of a streamed LLM response, so each item can be used as soon as its closing brace arrives.
+
+    Only the array under `key` in the top-level object is parsed, and its items are returned as JSON text, to be
+    validated by the caller. The rest of the document is scanned for structure but not validated.
+    """
+
+    def __init__(self, key: str = "issues") -> None:
+        self.key = key
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string: list[str] = []
+        self.last_string = ""
+        self.current_key = None
+        self.array_depth = None
+        self.item: list[str] = []
+
+    def feed(self, fragment: str) -> list[str]:
+        """
+        Parse the next fragment of the document.
+
+        Args:
+            fragment (str): The next characters of the document.
+
+        Returns:
+            The JSON text of each array item completed by the fragment.
+        """
+        items = []
+        for char in fragment:
+            if self.item:
+                self.item.append(char)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = "".join(self.string)
+                    self.string = []
+                elif self.depth == 1:
+                    # Keys of the top-level object
+                    self.string.append(char)
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char == ":" and self.depth == 1:
+                self.current_key = self.last_string
+            elif char in "{[":
+                if self.depth == self.array_depth and not self.item:
+                    self.item = [char]
+                self.depth += 1
+                if char == "[" and self.depth == 2 and self.current_key == self.key:
+                    self.array_depth = self.depth
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == self.array_depth and self.item:
+                    items.append("".join(self.item))
+                    self.item = []
+                elif self.array_depth is not None and self.depth < self.array_depth:
+                    self.array_depth = None
+                    self.current_key = None
+            elif char == "," and self.depth == 1:
+                self.current_key = None
+        return items
+
+
+def parse_array_items(fragments: Iterable[str], key: str = "issues") -> Generator[str, None, None]:
+    """Yields the JSON text of each item of the array under `key`, as soon as the fragment completing it arrives."""
+    parser = JsonArrayStreamParser(key)
+    for fragment in fragments:
+        yield from parser.feed(fragment)
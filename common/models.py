@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 from typing import Optional
 
@@ -55,8 +55,23 @@ class BaseIssue(BaseModel):
     suggested_fix: str
 
 
+class PreviousIssue(BaseModel):
+    id: str
+    text: str
+    location: Location
+
+
+class CarriedOverIssue(BaseModel):
+    id: str
+    location: Location
+
+
 class FlowOutputChunk(BaseModel):
     issues: list[BaseIssue]
+    carried_over: list[CarriedOverIssue] = []
+    # Review progress: the number of flow runs (text chunk and agent pairs) finished so far, out of the total
+    chunks_done: Optional[int] = None
+    chunks_total: Optional[int] = None
 
 
 class IssueStatusEnum(str, Enum):
@@ -74,6 +89,18 @@ class DismissalFeedbackModel(BaseModel):
     reason: Optional[str] = None
 
 
+class IssueActionEnum(str, Enum):
+    accept = 'accept'
+    dismiss = 'dismiss'
+
+
+class BatchIssueActionModel(BaseModel):
+    action: IssueActionEnum
+    issue_ids: list[str] = Field(min_length=1, max_length=1000)
+    modified_fields: Optional[ModifiedFieldsModel] = None
+    dismissal_feedback: Optional[DismissalFeedbackModel] = None
+
+
 class Issue(BaseModel):
     id: str
     doc_id: str
@@ -89,6 +116,58 @@ class Issue(BaseModel):
     resolved_at_UTC: Optional[str] = None
     modified_fields: Optional[ModifiedFieldsModel] = None
     dismissal_feedback: Optional[DismissalFeedbackModel] = None
+    # Sequence number of the review event the issue was sent in, used as the event id to resume a review stream
+    review_seq: Optional[int] = None
+    # Version of the stored item, for optimistic concurrency on updates (read from the Cosmos DB `_etag` property,
+    # and always sent to clients as `etag`)
+    etag: Optional[str] = Field(default=None, validation_alias="_etag")
+
+    class Config:
+        use_enum_values = True
+        populate_by_name = True
+
+
+class BatchIssueActionResult(BaseModel):
+    # The issues that were updated, and the IDs of the issues in batches that failed and were left unchanged
+    issues: list[Issue]
+    failed_issue_ids: list[str] = []
+
+
+class ReviewStatusEnum(str, Enum):
+    in_progress = 'in_progress'
+    complete = 'complete'
+    failed = 'failed'
+
+class ReviewProgress(BaseModel):
+    doc_id: str
+    status: ReviewStatusEnum
+    chunks_done: int = 0
+    chunks_total: Optional[int] = None
+    last_event_id: int = 0
+    updated_at_UTC: str
+
+    class Config:
+        use_enum_values = True
+
+class ReviewJobStatusEnum(str, Enum):
+    queued = 'queued'
+    running = 'running'
+    complete = 'complete'
+    failed = 'failed'
+
+class ReviewJob(BaseModel):
+    doc_id: str
+    user_oid: str
+    time_stamp: str
+    previous_doc_id: Optional[str] = None
+    status: ReviewJobStatusEnum = ReviewJobStatusEnum.queued
+    attempts: int = 0
+    # Unix times: when the job can next be claimed, and when its worker last reported it was still running
+    available_at: float = 0.0
+    heartbeat_at: Optional[float] = None
+    # Set each time the job is claimed, so a worker can only update the job while it still holds the claim
+    claim_id: Optional[str] = None
+    error: Optional[str] = None
 
     class Config:
         use_enum_values = True
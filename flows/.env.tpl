@@ -8,3 +8,12 @@ IDENTITY_RESOURCE_ID="${IDENTITY_RESOURCE_ID}"
 
 DOCUMENT_INTELLIGENCE_ENDPOINT="${DOCUMENT_INTELLIGENCE_ENDPOINT}"
 AZURE_OPENAI_ENDPOINT="${AZURE_OPENAI_ENDPOINT}"
+
+# Optional: cache Document Intelligence results on local disk or in a blob container
+# DOCUMENT_CACHE_DIR=".cache/document_cache"
+# DOCUMENT_CACHE_CONTAINER_URL=""
+
+# Optional: chunk size, as a token budget (0 splits the text into chunks of `pagination` paragraphs instead) and an
+# optional cap on the paragraphs of a chunk (0 for no cap)
+# CHUNK_MAX_TOKENS=2000
+# CHUNK_MAX_PARAGRAPHS=0
@@ -3,6 +3,9 @@ import string
 import random
 
 from common.models import AllSingleShotIssues
+from multishot import get_issue_key
+from near_duplicates import NEAR_DUPLICATE_THRESHOLD, find_near_duplicates
+from rate_limiter import estimate_tokens
 
 def generate_random_string(length=6):  
     letters = string.ascii_letters  # Contains both lowercase and uppercase letters  
@@ -10,7 +13,7 @@ def generate_random_string(length=6):
 
 # Concat all singleshot reviewer output.  
 @tool  
-def aggregate_single_shots(unparsed_shots: list) -> str:  
+def aggregate_single_shots(unparsed_shots: list) -> AllSingleShotIssues:  
     shots = [AllSingleShotIssues.parse_raw(shot_json) for shot_json in unparsed_shots]
 
     # Combine the "issues" arrays  
@@ -23,7 +26,7 @@ def aggregate_single_shots(unparsed_shots: list) -> str:
 
     for i, shot in enumerate(shots):
         for issue in shot.issues:  
-            issue_key = (issue.type, issue.location.source_sentence)  
+            issue_key = get_issue_key(issue)
             if issue_key not in seen:  
                 seen.add(issue_key)  
                 combined_issues.append(issue)  
@@ -32,12 +35,20 @@ def aggregate_single_shots(unparsed_shots: list) -> str:
     total_issues_after = len(combined_issues)  
     print(f"Total number of issues after removing duplicates: {total_issues_after}")  
 
+    # Collapse issues that flag the same problem in slightly different words, keeping the first shot's issue
+    if NEAR_DUPLICATE_THRESHOLD > 0 and len(combined_issues) > 1:
+        clusters = find_near_duplicates(combined_issues)
+        near_duplicates = [combined_issues[i] for cluster in clusters for i in cluster[1:]]
+        combined_issues = [combined_issues[cluster[0]] for cluster in clusters]
+        saved_tokens = estimate_tokens(*(issue.model_dump_json() for issue in near_duplicates))
+        print(
+            f"Total number of issues after merging near-duplicates: {len(combined_issues)} "
+            f"(about {int(saved_tokens)} fewer consolidator prompt tokens)"
+        )
+
     # Add comment ID to each issue
     for issue in combined_issues:
         issue.comment_id = generate_random_string()
 
-    # Create a new JSON object with the combined "issues" array  
-    combined_issues = AllSingleShotIssues(issues=combined_issues)  
-
-    # Convert the dictionary back to a JSON string  
-    return combined_issues.model_dump_json() 
+    # Pass the combined issues on as an object; the merge node uses it as is, and the consolidator as JSON
+    return AllSingleShotIssues(issues=combined_issues)
@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Generator, Optional, Union
+import importlib.util
+import logging
+import threading
+import time
+
+from openai import AzureOpenAI
+from pydantic import BaseModel
+from promptflow.core import tool
+from promptflow.connections import AzureOpenAIConnection
+from promptflow.contracts.types import FilePath
+from typed_llm.tools.typed_llm import API_VERSION
+
+from llm_cache import get_response_cache, make_cache_key
+from multishot import run_adaptive_multishot
+from rate_limiter import (
+    AOAI_COMPLETION_TOKENS_ESTIMATE,
+    AOAI_MAX_RETRIES,
+    RETRY_STATUS_CODES,
+    backoff_delay,
+    estimate_tokens,
+    get_rate_limiter,
+    get_retry_after,
+    get_status_code,
+)
+
+_clients: dict[tuple, AzureOpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(connection: AzureOpenAIConnection) -> AzureOpenAI:
+    """
+    Returns the client of a connection, shared by every call in this process so its HTTP connections are reused.
+
+    The client doesn't retry (`max_retries=0`): a throttled call raises straight away, so the rate limiter sees every
+    429 and its `Retry-After`, and is the only layer retrying calls.
+    """
+    key = (connection.api_base, connection.api_key)
+    with _clients_lock:
+        if key not in _clients:
+            if connection.api_key:
+                credentials = dict(api_key=connection.api_key)
+            else:
+                credentials = dict(azure_ad_token_provider=connection.get_token)
+            _clients[key] = AzureOpenAI(
+                **credentials, azure_endpoint=connection.api_base, api_version=API_VERSION, max_retries=0
+            )
+        return _clients[key]
+
+
+def get_messages(request: dict) -> list[dict[str, str]]:
+    messages = [
+        {"role": role, "content": request[f"{role}_prompt"]}
+        for role in ("system", "user", "assistant") if request[f"{role}_prompt"]
+    ]
+    if not messages:
+        raise ValueError("At least one of system_prompt, user_prompt, or assistant_prompt must be provided.")
+    return messages
+
+
+def load_response_type(module_path: FilePath, response_type: str) -> type:
+    spec = importlib.util.spec_from_file_location(Path(module_path).stem, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, response_type)
+
+
+def parse_typed_llm(connection: AzureOpenAIConnection, module_path: FilePath, **request) -> list[str]:
+    """
+    Requests one structured response, like a single request of the typed_llm package tool.
+
+    typed_llm is not called itself, as it builds a client with the SDK's default retries (and wraps it in promptflow's
+    own retries), which would absorb throttled calls before the rate limiter could see them.
+    """
+    completion = get_client(connection).beta.chat.completions.parse(
+        model=request["deployment_name"],
+        messages=get_messages(request),
+        temperature=request["temperature"],
+        response_format=load_response_type(module_path, request["response_type"]),
+    )
+    if completion.choices[0].message.refusal:
+        raise ValueError(f"Completion refused: {completion.choices[0].message.refusal}")
+    return [completion.choices[0].message.content]
+
+
+def rate_limited_typed_llm(
+    connection: AzureOpenAIConnection, module_path: FilePath, adaptive: bool = False, **request
+) -> list[str]:
+    """
+    Calls the LLM through the rate limiter of the deployment.
+
+    Each of the `number_of_requests` shots is a separate call, so each one is limited, and retried if throttled,
+    on its own rather than repeating the shots that succeeded. With `adaptive`, the shots are requested in waves
+    and stop once they stop finding new issues (see `multishot.py`).
+    """
+    limiter = get_rate_limiter(request["deployment_name"])
+    prompt_tokens = estimate_tokens(request["system_prompt"], request["user_prompt"], request["assistant_prompt"])
+    shot_tokens = prompt_tokens + AOAI_COMPLETION_TOKENS_ESTIMATE
+
+    def estimate_used_tokens(responses: list[str]) -> float:
+        return prompt_tokens + estimate_tokens(*responses)
+
+    def request_shot(_=None) -> list[str]:
+        return limiter.call(
+            lambda: parse_typed_llm(connection, module_path, **request),
+            tokens=shot_tokens,
+            estimate_used_tokens=estimate_used_tokens,
+        )
+
+    if adaptive:
+        responses = run_adaptive_multishot(
+            request_shot, request["number_of_requests"], shot_tokens, estimate_used_tokens
+        )
+    else:
+        with ThreadPoolExecutor(max_workers=request["number_of_requests"]) as pool:
+            shots = pool.map(request_shot, range(request["number_of_requests"]))
+            responses = [response for shot in shots for response in shot]
+
+    logging.info(f"LLM rate limiter stats for {request['deployment_name']}: {limiter.stats()}")
+    return responses
+
+
+def stream_rate_limited_typed_llm(
+    connection: AzureOpenAIConnection, module_path: FilePath, **request
+) -> Generator[str, None, None]:
+    """
+    Streams one structured response, as fragments of its JSON text, through the rate limiter of the deployment.
+
+    A call that fails before anything was streamed is retried like `RateLimiter.call` does; once fragments have been
+    passed on, the error is raised instead, as the caller can't take them back.
+    """
+    limiter = get_rate_limiter(request["deployment_name"])
+    prompt_tokens = estimate_tokens(request["system_prompt"], request["user_prompt"], request["assistant_prompt"])
+    shot_tokens = prompt_tokens + AOAI_COMPLETION_TOKENS_ESTIMATE
+    messages = get_messages(request)
+    client = get_client(connection)
+
+    for attempt in range(AOAI_MAX_RETRIES + 1):
+        limiter.acquire(shot_tokens)
+        started_at = time.monotonic()
+        fragments = []
+        try:
+            with client.beta.chat.completions.stream(
+                model=request["deployment_name"],
+                messages=messages,
+                temperature=request["temperature"],
+                response_format=load_response_type(module_path, request["response_type"]),
+            ) as stream:
+                for event in stream:
+                    if event.type == "content.delta":
+                        fragments.append(event.delta)
+                        yield event.delta
+                    elif event.type == "refusal.done":
+                        raise ValueError(f"Completion refused: {event.refusal}")
+        except GeneratorExit:
+            limiter.release(started_at)
+            raise
+        except Exception as e:
+            status_code = get_status_code(e)
+            retry_after = get_retry_after(e)
+            limiter.release(started_at, throttled=status_code == 429, retry_after=retry_after)
+            if fragments or status_code not in RETRY_STATUS_CODES or attempt == AOAI_MAX_RETRIES:
+                raise
+
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            logging.warning(f"LLM call failed with status {status_code}, retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            continue
+
+        limiter.release(started_at, token_correction=prompt_tokens + estimate_tokens(*fragments) - shot_tokens)
+        return
+
+
+def stream_cached_typed_llm(
+    connection: AzureOpenAIConnection, module_path: FilePath, **request
+) -> Generator[str, None, None]:
+    """Streams one structured response, from the response cache if it holds one, caching it once complete."""
+    cache = get_response_cache()
+    # Same key as the responses of cached_typed_llm, so streamed and complete responses share the cache
+    cache_key = make_cache_key(response_models=Path(module_path).read_text(), adaptive=False, **request)
+    responses = cache.get(cache_key) if cache else None
+    if responses is not None:
+        yield responses[0]
+        return
+
+    fragments = []
+    for fragment in stream_rate_limited_typed_llm(connection, module_path, **request):
+        fragments.append(fragment)
+        yield fragment
+
+    if cache:
+        cache.set(cache_key, ["".join(fragments)])
+        logging.info(f"LLM response cache stats: {cache.stats()}")
+
+
+# Same inputs as the typed_llm package tool (plus `adaptive` and `stream`), so the nodes in flow.dag.yaml can switch
+# between the two. With `stream`, the single response is returned as a generator of fragments of its JSON text.
+@tool
+def cached_typed_llm(
+    connection: AzureOpenAIConnection,
+    deployment_name: str,
+    module_path: FilePath,
+    response_type: str,
+    temperature: float = 1,
+    system_prompt: Optional[str] = None,
+    user_prompt: Optional[Union[str, BaseModel]] = None,
+    assistant_prompt: Optional[str] = None,
+    number_of_requests: int = 1,
+    adaptive: bool = False,
+    stream: bool = False,
+) -> Union[list[str], Generator[str, None, None]]:
+    # Python nodes pass models (e.g. the aggregated issues) as objects, which are sent to the LLM as JSON
+    if isinstance(user_prompt, BaseModel):
+        user_prompt = user_prompt.model_dump_json()
+
+    request = dict(
+        deployment_name=deployment_name,
+        response_type=response_type,
+        temperature=temperature,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        assistant_prompt=assistant_prompt,
+        number_of_requests=number_of_requests,
+    )
+
+    if stream:
+        if number_of_requests != 1:
+            raise ValueError("Only a single request can be streamed.")
+        return stream_cached_typed_llm(connection, module_path, **request)
+
+    cache = get_response_cache()
+    if cache is None:
+        return rate_limited_typed_llm(connection, module_path, adaptive, **request)
+
+    # The response models are part of the key, so changing the schema invalidates old responses
+    cache_key = make_cache_key(response_models=Path(module_path).read_text(), adaptive=adaptive, **request)
+
+    responses = cache.get(cache_key)
+    if responses is None:
+        responses = rate_limited_typed_llm(connection, module_path, adaptive, **request)
+        cache.set(cache_key, responses)
+
+    logging.info(f"LLM response cache stats: {cache.stats()}")
+    return responses
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+
+LLM_CACHE_BACKEND = os.environ.get("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite")
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1000))
+
+
+class ResponseCache(ABC):
+    """
+    Cache of LLM responses with a time-to-live and hit/miss counters.
+
+    Backends implement the raw storage of (key, responses, created_at) entries.
+    """
+
+    def __init__(self, ttl_seconds: int = LLM_CACHE_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[list[str]]:
+        entry = self._read(key)
+        expired = entry is not None and time.time() - entry[1] > self.ttl_seconds
+        if expired:
+            self._delete(key)
+
+        with self._lock:
+            if entry is None or expired:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, responses: list[str]) -> None:
+        self._write(key, responses, time.time())
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    @abstractmethod
+    def _read(self, key: str) -> Optional[tuple[list[str], float]]:
+        ...
+
+    @abstractmethod
+    def _write(self, key: str, responses: list[str], created_at: float) -> None:
+        ...
+
+    @abstractmethod
+    def _delete(self, key: str) -> None:
+        ...
+
+
+class InMemoryCache(ResponseCache):
+    """
+    Keeps entries in a dictionary for the lifetime of the process, evicting the least recently used entries beyond
+    `max_entries` and dropping expired entries on write, so a long-running flow server does not grow without bound.
+    """
+
+    def __init__(self, ttl_seconds: int = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES) -> None:
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        # Ordered from least to most recently used
+        self._entries: OrderedDict[str, tuple[list[str], float]] = OrderedDict()
+        self._entries_lock = threading.Lock()
+
+    def _read(self, key: str) -> Optional[tuple[list[str], float]]:
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _write(self, key: str, responses: list[str], created_at: float) -> None:
+        with self._entries_lock:
+            self._entries[key] = (responses, created_at)
+            self._entries.move_to_end(key)
+            expired = [
+                expired_key for expired_key, (_, entry_created_at) in self._entries.items()
+                if entry_created_at < created_at - self.ttl_seconds
+            ]
+            for expired_key in expired:
+                del self._entries[expired_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key: str) -> None:
+        with self._entries_lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteCache(ResponseCache):
+    """Persists entries in a SQLite database on disk, so they survive restarts."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS) -> None:
+        super().__init__(ttl_seconds)
+        self._db_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._db_lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, responses TEXT, created_at REAL)"
+            )
+
+    def _read(self, key: str) -> Optional[tuple[list[str], float]]:
+        with self._db_lock:
+            row = self._connection.execute(
+                "SELECT responses, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, key: str, responses: list[str], created_at: float) -> None:
+        with self._db_lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, responses, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(responses), created_at),
+            )
+            # Drop expired entries so the database does not grow without bound
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (created_at - self.ttl_seconds,)
+            )
+
+    def _delete(self, key: str) -> None:
+        with self._db_lock, self._connection:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+def make_cache_key(**request) -> str:
+    """Builds a cache key by hashing every parameter that can change the LLM response."""
+    serialized = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns the configured response cache backend, or None if caching is disabled."""
+    if LLM_CACHE_BACKEND == "memory":
+        return InMemoryCache()
+    if LLM_CACHE_BACKEND == "sqlite":
+        return SQLiteCache()
+    if LLM_CACHE_BACKEND != "none":
+        logging.warning(f"Unknown LLM cache backend '{LLM_CACHE_BACKEND}'. LLM response caching is disabled.")
+    return None
@@ -1,26 +1,69 @@
-from promptflow import tool  
-
-from common.models import AllSingleShotIssues, AllConsolidatorIssues, CombinedIssue, AllCombinedIssues, IssueType
-  
-# The inputs section will change based on the arguments of the tool function, after you save the code  
-# Adding type to arguments and return value will help the system show the types properly  
-# Please update the function name/signature per need  
-@tool  
-def merge_singleshot_fields_with_consolidator(agg_outputs: str, consolidator_outputs: list) -> str:
-    # Validate and load the JSON strings into Python dictionaries  
+from promptflow import tool
+from collections import defaultdict
+from typing import Generator, Iterator, Union
+
+from common.json_stream import parse_array_items
+from common.models import AllSingleShotIssues, AllConsolidatorIssues, CombinedIssue, AllCombinedIssues, ConsolidatorIssue, SingleShotIssue, IssueType
+
+
+def index_issues(issues: list[SingleShotIssue]) -> dict[str, list[SingleShotIssue]]:
+    """Indexes single shot issues by comment_id, to join each consolidator issue to its issue in constant time."""
+    index = defaultdict(list)
+    for issue in issues:
+        index[issue.comment_id].append(issue)
+    return index
+
+
+def merge_issue(left_issue: ConsolidatorIssue, right_index: dict[str, list[SingleShotIssue]]) -> list[CombinedIssue]:
+    combined_issues = []
+    # Merge the data based on the comment_id
+    for right_issue in right_index.get(left_issue.comment_id, []):
+        # Both issues have been validated already, so the combined issue is built without validating them again
+        combined_issue = CombinedIssue.model_construct(**dict(left_issue, **dict(right_issue)))
+        # Drop the combined issue if suggested_action from consolidator agent is "REMOVE"
+        # Usually consolidator agent will suggest "REMOVE" action for issues with low score
+        if combined_issue.suggested_action != "REMOVE":
+            combined_issues.append(combined_issue)
+    return combined_issues
+
+
+def stream_merged_issues(
+    consolidator_fragments: Iterator[str], right_index: dict[str, list[SingleShotIssue]]
+) -> Generator[str, None, None]:
+    """
+    Merges each consolidator issue as soon as it has been streamed, yielding fragments of the JSON text of
+    `AllCombinedIssues`, so the flow output can be parsed in the same way as it is streamed.
+    """
+    separator = ""
+    yield '{"issues":['
+    for item in parse_array_items(consolidator_fragments, "issues"):
+        for combined_issue in merge_issue(ConsolidatorIssue.model_validate_json(item), right_index):
+            yield separator + combined_issue.model_dump_json()
+            separator = ","
+    yield "]}"
+
+
+# The inputs section will change based on the arguments of the tool function, after you save the code
+# Adding type to arguments and return value will help the system show the types properly
+# Please update the function name/signature per need
+@tool
+def merge_singleshot_fields_with_consolidator(
+    agg_outputs: Union[AllSingleShotIssues, str], consolidator_outputs: Union[list, Iterator[str]]
+) -> Union[str, Generator[str, None, None]]:
+    # The aggregate node passes its issues as objects, so they are only parsed if given as JSON
+    right_data = AllSingleShotIssues.model_validate_json(agg_outputs) if isinstance(agg_outputs, str) else agg_outputs
+    right_index = index_issues(right_data.issues)
+
+    # A streamed consolidator response is merged as it arrives
+    if not isinstance(consolidator_outputs, list):
+        return stream_merged_issues(consolidator_outputs, right_index)
+
+    # Validate and load the JSON strings into Python dictionaries
     assert len(consolidator_outputs) == 1
-    left_data = AllConsolidatorIssues.parse_raw(consolidator_outputs[0])
-    right_data = AllSingleShotIssues.parse_raw(agg_outputs)
-    
+    left_data = AllConsolidatorIssues.model_validate_json(consolidator_outputs[0])
+
     combined_issues = []
-    # Merge the data based on the comment_id  
-    for left_issue in left_data.issues:  
-        for right_issue in right_data.issues:  
-            if left_issue.comment_id == right_issue.comment_id:
-                combined_issue = CombinedIssue(**dict(left_issue, **dict(right_issue)))
-                # Drop the combined issue if suggested_action from consolidator agent is "REMOVE"
-                # Usually consolidator agent will suggest "REMOVE" action for issues with low score
-                if combined_issue.suggested_action != "REMOVE":
-                    combined_issues.append(combined_issue)
-
-    return AllCombinedIssues(issues=combined_issues).model_dump_json()
\ No newline at end of file
+    for left_issue in left_data.issues:
+        combined_issues.extend(merge_issue(left_issue, right_index))
+
+    return AllCombinedIssues(issues=combined_issues).model_dump_json()
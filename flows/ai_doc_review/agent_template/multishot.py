@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable
+
+from common.models import AllSingleShotIssues, SingleShotIssue
+
+# Shots requested at once; the first wave always runs, later waves only while they keep finding new issues
+MULTISHOT_WAVE_SIZE = int(os.environ.get("MULTISHOT_WAVE_SIZE", 2))
+# Stop once a wave finds fewer new unique issues per shot than this
+MULTISHOT_MIN_NEW_ISSUES_PER_SHOT = float(os.environ.get("MULTISHOT_MIN_NEW_ISSUES_PER_SHOT", 0.5))
+# Estimated tokens (prompts and completions) the shots of one chunk may use, 0 for no limit
+MULTISHOT_TOKEN_BUDGET = int(os.environ.get("MULTISHOT_TOKEN_BUDGET", 0))
+
+
+def get_issue_key(issue: SingleShotIssue) -> Hashable:
+    """Issues with the same key are duplicates found by different shots."""
+    return (issue.type, issue.location.source_sentence)
+
+
+class MultishotStats:
+    """Counts the shots run and skipped by adaptive multishot in this process."""
+
+    def __init__(self) -> None:
+        self.chunks = 0
+        self.shots = 0
+        self.skipped_shots = 0
+        self.skipped_tokens = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, shots: int, skipped_shots: int, skipped_tokens: float) -> None:
+        with self._lock:
+            self.chunks += 1
+            self.shots += shots
+            self.skipped_shots += skipped_shots
+            self.skipped_tokens += skipped_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chunks": self.chunks,
+                "shots": self.shots,
+                "skipped_shots": self.skipped_shots,
+                "skipped_tokens": int(self.skipped_tokens),
+            }
+
+
+multishot_stats = MultishotStats()
+
+
+def run_adaptive_multishot(
+    request_shot: Callable[[], list[str]],
+    max_shots: int,
+    shot_tokens: float,
+    estimate_used_tokens: Callable[[list[str]], float] = lambda _: 0,
+    wave_size: int = MULTISHOT_WAVE_SIZE,
+    min_new_issues_per_shot: float = MULTISHOT_MIN_NEW_ISSUES_PER_SHOT,
+    token_budget: int = MULTISHOT_TOKEN_BUDGET,
+) -> list[str]:
+    """
+    Requests up to `max_shots` single shot reviews in waves, stopping once more shots stop finding new issues.
+
+    The first shot sets the baseline; every other shot counts the issues it finds that no earlier shot found (by
+    `get_issue_key`, the key used to deduplicate them in `aggregate.py`). After each wave, no more shots are requested
+    if the wave found fewer than `min_new_issues_per_shot` new issues per counted shot, e.g. when two shots find
+    nothing on a clean paragraph, or when the next wave would go over the token budget.
+
+    Args:
+        request_shot: Requests one shot, returning its responses.
+        max_shots: The maximum number of shots.
+        shot_tokens: The estimated tokens of a shot, used for the budget until the shot has run.
+        estimate_used_tokens: Estimates the tokens a shot used from its responses.
+        wave_size: The number of shots requested at once.
+        min_new_issues_per_shot: The marginal yield below which no more shots are requested.
+        token_budget: The estimated tokens all the shots may use, or 0 for no limit.
+
+    Returns:
+        The responses of the shots that were run, in the order the shots were requested.
+    """
+    responses: list[str] = []
+    seen: set = set()
+    shots = 0
+    used_tokens = 0.0
+    stop_reason = "max shots"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(wave_size, max_shots))) as pool:
+        while shots < max_shots:
+            size = min(wave_size, max_shots - shots)
+            if token_budget:
+                # The first shot always runs, so there is a review even if the budget is smaller than one shot
+                affordable = int((token_budget - used_tokens) // shot_tokens)
+                size = min(size, affordable if shots else max(1, affordable))
+                if size <= 0:
+                    stop_reason = "token budget"
+                    break
+
+            new_issues, counted_shots = 0, 0
+            for shot in pool.map(lambda _: request_shot(), range(size)):
+                used_tokens += estimate_used_tokens(shot) or shot_tokens
+                keys = {get_issue_key(issue) for response in shot for issue in parse_issues(response)}
+                if shots:
+                    new_issues += len(keys - seen)
+                    counted_shots += 1
+                seen |= keys
+                shots += 1
+                responses.extend(shot)
+
+            if counted_shots and new_issues / counted_shots < min_new_issues_per_shot and shots < max_shots:
+                stop_reason = f"{new_issues / counted_shots:.2f} new issues per shot"
+                break
+
+    skipped_shots = max_shots - shots
+    skipped_tokens = skipped_shots * (used_tokens / shots if shots else shot_tokens)
+    multishot_stats.record(shots, skipped_shots, skipped_tokens)
+    logging.info(
+        f"Adaptive multishot ran {shots} of {max_shots} shots ({stop_reason}), found {len(seen)} unique issues, "
+        f"saved about {int(skipped_tokens)} tokens. Totals: {multishot_stats.stats()}"
+    )
+    return responses
+
+
+def parse_issues(response: str) -> list[SingleShotIssue]:
+    try:
+        return AllSingleShotIssues.model_validate_json(response).issues
+    except ValueError as e:
+        # Counted as a shot that found nothing new; the aggregate node reports the invalid response
+        logging.warning(f"Unable to parse single shot response: {e}")
+        return []
@@ -0,0 +1,87 @@
+import os
+import re
+from collections import defaultdict
+
+from common.models import SingleShotIssue
+
+# Share of the shorter source sentence's character n-grams that the other must also contain for two issues with
+# matching text to be duplicates; 0 disables near-duplicate merging
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", 0.8))
+SHINGLE_SIZE = 3
+
+
+def normalize(text: str) -> str:
+    """Lower-cases text and reduces punctuation and whitespace to single spaces."""
+    return " ".join(re.sub(r"[\W_]+", " ", text.lower()).split())
+
+
+def get_shingles(text: str) -> set[str]:
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def containment(shingles: set[str], other_shingles: set[str]) -> float:
+    return len(shingles & other_shingles) / min(len(shingles), len(other_shingles))
+
+
+def texts_match(text: str, other_text: str) -> bool:
+    """
+    Issue texts match when they are the same words, or the shorter is part of the longer and has at least half its
+    words (e.g. a word and the two-word phrase around it, but not a word and a whole clause).
+    """
+    if text == other_text:
+        return True
+    shorter, longer = sorted((text, other_text), key=lambda words: len(words.split()))
+    if not shorter:
+        return False
+    return f" {shorter} " in f" {longer} " and 2 * len(shorter.split()) >= len(longer.split())
+
+
+def find_near_duplicates(
+    issues: list[SingleShotIssue], threshold: float = NEAR_DUPLICATE_THRESHOLD
+) -> list[list[int]]:
+    """
+    Clusters issues that flag the same problem with slightly different source sentences or texts, as different
+    shots do (e.g. one quotes the whole paragraph and another just the sentence, or one flags a word and another
+    the phrase around it).
+
+    An issue is a duplicate of an earlier issue of the same type in the same paragraph when:
+    - their normalised texts match (see `texts_match`),
+    - the shorter text appears exactly once in the longer source sentence, so both point at the same place (a word
+      repeated in the paragraph could be a different issue in another sentence), and
+    - most of the character n-grams of the shorter source sentence are in the other.
+
+    Each issue is compared with the first issue of each cluster of its paragraph, and joins the first cluster it
+    matches, so clusters do not grow by chaining issues that only match each other.
+
+    Args:
+        issues: The issues.
+        threshold: The share of the shorter sentence's n-grams the other sentence must contain.
+
+    Returns:
+        The clusters of duplicate issues, as lists of issue indices in order, including single issue clusters.
+    """
+    texts = [normalize(issue.text) for issue in issues]
+    sentences = [normalize(issue.location.source_sentence) for issue in issues]
+    shingles = [get_shingles(sentence) for sentence in sentences]
+
+    def is_duplicate(i: int, j: int) -> bool:
+        if not texts_match(texts[i], texts[j]) or containment(shingles[i], shingles[j]) < threshold:
+            return False
+        shorter_text = min(texts[i], texts[j], key=len)
+        longer_sentence = max(sentences[i], sentences[j], key=len)
+        return f" {longer_sentence} ".count(f" {shorter_text} ") == 1
+
+    clusters = []
+    paragraph_clusters = defaultdict(list)
+    for i, issue in enumerate(issues):
+        candidates = paragraph_clusters[(issue.type, issue.location.para_index)]
+        cluster = next((cluster for cluster in candidates if is_duplicate(i, cluster[0])), None)
+        if cluster is None:
+            cluster = [i]
+            candidates.append(cluster)
+            clusters.append(cluster)
+        else:
+            cluster.append(i)
+    return clusters
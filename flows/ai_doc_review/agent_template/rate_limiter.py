@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Limits per deployment, e.g. {"gpt-4o": {"requests_per_minute": 300, "tokens_per_minute": 50000, "max_concurrency": 8}}
+# Deployments that are not listed use the defaults below. A per-minute limit of 0 means no limit.
+AOAI_RATE_LIMITS = json.loads(os.environ.get("AOAI_RATE_LIMITS", "{}"))
+AOAI_REQUESTS_PER_MINUTE = int(os.environ.get("AOAI_REQUESTS_PER_MINUTE", 0))
+AOAI_TOKENS_PER_MINUTE = int(os.environ.get("AOAI_TOKENS_PER_MINUTE", 0))
+AOAI_MAX_CONCURRENCY = int(os.environ.get("AOAI_MAX_CONCURRENCY", 16))
+# Tokens reserved for each completion until the actual length is known
+AOAI_COMPLETION_TOKENS_ESTIMATE = int(os.environ.get("AOAI_COMPLETION_TOKENS_ESTIMATE", 1000))
+AOAI_MAX_RETRIES = int(os.environ.get("AOAI_MAX_RETRIES", 6))
+AOAI_BACKOFF_BASE_SECONDS = float(os.environ.get("AOAI_BACKOFF_BASE_SECONDS", 1))
+AOAI_BACKOFF_MAX_SECONDS = float(os.environ.get("AOAI_BACKOFF_MAX_SECONDS", 60))
+
+# Status codes worth retrying: rate limited, or a transient server error
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows up to `per_minute` units a minute, refilled continuously. A limit of 0 allows everything."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = per_minute
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Refills the bucket, and returns how long to wait until `amount` units are available (0 if they are)."""
+        if not self.capacity:
+            return 0.0
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+        # A request larger than the bucket waits for a full bucket rather than forever
+        deficit = min(amount, self.capacity) - self.available
+        return max(0.0, deficit * 60 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.available -= amount
+
+
+class RateLimiter:
+    """
+    Limits the calls to one Azure OpenAI deployment from this process, shared by every flow run.
+
+    Calls wait for a concurrency slot and for request and token budget (token buckets refilled per minute).
+    The concurrency limit adapts to the deployment (AIMD): it grows by one for every `limit` successful calls,
+    and halves when a call is rate limited, at which point new calls also wait for the `Retry-After` period.
+    The limit halves at most once per burst of throttled calls: only calls started after the last decrease count.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = AOAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = AOAI_TOKENS_PER_MINUTE,
+        max_concurrency: int = AOAI_MAX_CONCURRENCY,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.decreased_at = 0.0
+        self.calls = 0
+        self.throttled = 0
+        self.queue_seconds = 0.0
+        self.call_seconds = 0.0
+        self._changed = threading.Condition()
+
+    def acquire(self, tokens: float) -> None:
+        """Waits until a call using about `tokens` tokens can start, and reserves its budget and concurrency slot."""
+        with self._changed:
+            while True:
+                wait = max(
+                    self.blocked_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if wait <= 0 and self.in_flight < int(self.concurrency_limit):
+                    break
+                # Woken early when a call finishes; otherwise re-check once the budget has refilled
+                self._changed.wait(timeout=wait if wait > 0 else None)
+
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+
+    def release(
+        self,
+        started_at: float,
+        throttled: bool = False,
+        retry_after: Optional[float] = None,
+        token_correction: float = 0,
+    ) -> None:
+        """
+        Releases a concurrency slot, adapting the concurrency limit to the outcome of the call.
+
+        Args:
+            started_at: When the call started (`time.monotonic()`).
+            throttled: The call was rate limited (HTTP 429).
+            retry_after: How long the deployment asked callers to wait, in seconds.
+            token_correction: Tokens used beyond the estimate reserved by `acquire` (negative if fewer were used).
+        """
+        with self._changed:
+            self.in_flight -= 1
+            self.tokens.take(token_correction)
+            if throttled:
+                self.throttled += 1
+                if started_at >= self.decreased_at:
+                    self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                    self.decreased_at = time.monotonic()
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            else:
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            self._changed.notify_all()
+
+    def call(self, fn: Callable[[], T], tokens: float, estimate_used_tokens: Callable[[T], float] = lambda _: 0) -> T:
+        """
+        Calls `fn` within the limits, retrying rate limited calls and transient errors with jittered backoff.
+
+        Args:
+            fn: Makes the call.
+            tokens: The estimated number of tokens the call uses (prompt and completion).
+            estimate_used_tokens: Estimates the tokens actually used from the result, to correct the token budget.
+
+        Returns:
+            The result of `fn`.
+        """
+        for attempt in range(AOAI_MAX_RETRIES + 1):
+            queued_at = time.monotonic()
+            self.acquire(tokens)
+            started_at = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                status_code = get_status_code(e)
+                retry_after = get_retry_after(e)
+                self.release(started_at, throttled=status_code == 429, retry_after=retry_after)
+                self._record(started_at - queued_at, time.monotonic() - started_at)
+                if status_code not in RETRY_STATUS_CODES or attempt == AOAI_MAX_RETRIES:
+                    raise
+
+                delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                logging.warning(f"LLM call failed with status {status_code}, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+
+            used_tokens = estimate_used_tokens(result)
+            self.release(started_at, token_correction=used_tokens - tokens if used_tokens else 0)
+            self._record(started_at - queued_at, time.monotonic() - started_at)
+            return result
+
+    def stats(self) -> dict:
+        with self._changed:
+            return {
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "concurrency_limit": int(self.concurrency_limit),
+                "avg_queue_seconds": self.queue_seconds / self.calls if self.calls else 0.0,
+                "avg_call_seconds": self.call_seconds / self.calls if self.calls else 0.0,
+            }
+
+    def _record(self, queue_seconds: float, call_seconds: float) -> None:
+        with self._changed:
+            self.calls += 1
+            self.queue_seconds += queue_seconds
+            self.call_seconds += call_seconds
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """The HTTP status code of a failed OpenAI call (None for connection errors and other exceptions)."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None and getattr(error, "response", None) is not None:
+        status_code = getattr(error.response, "status_code", None)
+    return status_code
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """The number of seconds to wait given by the `Retry-After` headers of a failed call, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 1 / 1000), ("retry-after", 1)):
+        try:
+            value = headers.get(header)
+            if value is not None:
+                return float(value) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so retries from concurrent calls spread out instead of colliding."""
+    return random.uniform(0, min(AOAI_BACKOFF_MAX_SECONDS, AOAI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def estimate_tokens(*texts: Optional[str]) -> float:
+    """Estimates the number of tokens in some text (about 4 characters per token for English)."""
+    return sum(len(text) for text in texts if text) / 4
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(deployment_name: str) -> RateLimiter:
+    """Returns the rate limiter shared by every call to a deployment in this process."""
+    return RateLimiter(**AOAI_RATE_LIMITS.get(deployment_name, {}))
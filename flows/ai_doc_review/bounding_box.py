@@ -1,100 +1,273 @@
 from azure.ai.formrecognizer import AnalyzeResult, DocumentWord
-from shapely import Polygon, union_all
-from fitz import Rect
 from common.models import CombinedIssue
+from typing import Optional
+from bisect import bisect_right
 import logging
+import re
 
+import numpy as np
 
-def create_bounding_box(issue_words: list[DocumentWord], page_height: int) -> list[int]:
+
+DPI = 72
+
+
+def create_bounding_boxes(issues_words: list[list[DocumentWord]], page_heights: list[float]) -> list[list[float]]:
+    """
+    Creates bounding boxes for many issues at once.
+
+    Args:
+        issues_words: The Document Intelligence word objects for each issue's text spans.
+        page_heights: The height (in inches) of the page each issue is on.
+
+    Returns:
+        The list of bounding box quadpoint coords for each issue (in pixels), see `create_bounding_box`.
+    """
+    words = [word for issue_words in issues_words for word in issue_words]
+    if not words:
+        return [[] for _ in issues_words]
+
+    # Flatten every word polygon into one array of points, remembering where each word's points start
+    points = np.array([(point.x, point.y) for word in words for point in word.polygon], dtype=float)
+    word_starts = np.cumsum([0] + [len(word.polygon) for word in words[:-1]])
+
+    # Axis-aligned bounds of each word
+    word_min = np.minimum.reduceat(points, word_starts)
+    word_max = np.maximum.reduceat(points, word_starts)
+
+    # Merge word boxes into line boxes: a line ends at the last word of an issue, or where the next word has a lower
+    # x value than the end of this one (i.e. it starts a new line)
+    first_x = np.array([word.polygon[0].x for word in words])
+    end_x = np.array([word.polygon[2].x for word in words])
+    line_ends = np.zeros(len(words), dtype=bool)
+    line_ends[:-1] = first_x[1:] < end_x[:-1]
+    issue_ends = np.cumsum([len(issue_words) for issue_words in issues_words]) - 1
+    line_ends[issue_ends[issue_ends >= 0]] = True
+
+    line_starts = np.flatnonzero(np.concatenate(([True], line_ends[:-1])))
+    line_min = np.minimum.reduceat(word_min, line_starts) * DPI
+    line_max = np.maximum.reduceat(word_max, line_starts) * DPI
+
+    # Convert y origin from top to bottom of the (scaled) page
+    line_issues = np.repeat(np.arange(len(issues_words)), [len(issue_words) for issue_words in issues_words])[line_starts]
+    scaled_page_heights = np.asarray(page_heights, dtype=float)[line_issues] * DPI
+    top = scaled_page_heights - line_min[:, 1]
+    bottom = scaled_page_heights - line_max[:, 1]
+
+    # Quadpoints for each line: upper left, upper right, lower left, lower right
+    quads = np.stack(
+        [line_min[:, 0], top, line_max[:, 0], top, line_min[:, 0], bottom, line_max[:, 0], bottom], axis=1
+    ).tolist()
+
+    bounding_boxes = [[] for _ in issues_words]
+    for issue, quad in zip(line_issues.tolist(), quads):
+        bounding_boxes[issue] += [round(coord, 2) for coord in quad]
+    return bounding_boxes
+
+
+def create_bounding_box(issue_words: list[DocumentWord], page_height: float) -> list[float]:
     """
     Creates bounding box for the issue words.
 
     Args:
         issue_words: The list of Document Intelligence word objects for the issue text spans.
+        page_height: The height of the page (in inches).
 
     Returns:
         The list of bounding box quadpoint coords (minx, miny, maxx, maxy) for the issue words (in pixels),
         conforming to PDF quadpoints spec (n 8*n element specifying the coordinates of n quadrilaterals)
     """
-    dpi = 72
-    scaled_page_height = page_height * dpi
-    issue_boxes = []
-    quadpoints = []
+    return create_bounding_boxes([issue_words], [page_height])[0]
 
-    for i, word in enumerate(issue_words):
-        # Create a shapely polygon from each word's polygon points
-        issue_box = Polygon(word.polygon)
-        issue_boxes.append(issue_box)
 
-        # Merge word boxes into greater bounding box (if next word has a lower x value, it's on a new line so start a new merged box)
-        if i == len(issue_words) - 1 or issue_words[i + 1].polygon[0].x < word.polygon[2].x:
-            merged_box = union_all(issue_boxes).bounds
+class DocumentWordIndex:
+    """
+    Index of the words and paragraphs in a Document Intelligence result.
+
+    Build it once per AnalyzeResult and share it between issues, so that locating an issue is a binary search
+    instead of a scan over every word on the page.
+    """
 
-            # Scale the merged box from inches to pixels
-            scaled_box = [point * dpi for point in merged_box]
+    def __init__(self, di_result: AnalyzeResult) -> None:
+        # All words in the document, sorted by their character offset within `di_result.content`
+        words = sorted(
+            ((word.span.offset, page.page_number, word) for page in di_result.pages for word in page.words),
+            key=lambda entry: entry[0]
+        )
+        self.word_offsets: list[int] = [offset for offset, _, _ in words]
+        self.words: list[tuple[int, DocumentWord]] = [(page_number, word) for _, page_number, word in words]
 
-            # Convert y origin from top to bottom
-            scaled_box[1] = scaled_page_height - scaled_box[1]
-            scaled_box[3] = scaled_page_height - scaled_box[3]
+        # Paragraph index -> page number the paragraph starts on
+        self.paragraph_pages: list[int] = [
+            paragraph.bounding_regions[0].page_number for paragraph in di_result.paragraphs
+        ]
 
-            # Convert the scaled box to quadpoints
-            quad = Rect(scaled_box).quad
+    def find_words(self, start: int, end: int) -> list[tuple[int, DocumentWord]]:
+        """Returns the (page number, word) pairs for every word whose span overlaps the character range [start, end)."""
+        # Begin with the last word starting at or before `start`, as the range may start part way through a word
+        i = max(bisect_right(self.word_offsets, start) - 1, 0)
+        words = []
+        while i < len(self.words) and self.word_offsets[i] < end:
+            page_number, word = self.words[i]
+            if word.span.offset + word.span.length > start:
+                words.append((page_number, word))
+            i += 1
+        return words
 
-            quadpoints += [quad.ul.x, quad.ul.y, quad.ur.x, quad.ur.y, quad.ll.x, quad.ll.y, quad.lr.x, quad.lr.y]
-            issue_boxes = []
 
-    rounded_quadpoints = [round(coord, 2) for coord in quadpoints]
-    return rounded_quadpoints
+def _is_whole_words(content: str, start: int, end: int) -> bool:
+    """Checks the match does not start or end part way through a word (e.g. "in" within "dizziness")."""
+    return (start == 0 or not (content[start - 1].isalnum() and content[start].isalnum())) and (
+        end == len(content) or not (content[end - 1].isalnum() and content[end].isalnum())
+    )
 
 
-def add_bounding_box(di_result: AnalyzeResult, issue: CombinedIssue) -> CombinedIssue:
+def find_text(text: str, content: str, start: int = 0, end: Optional[int] = None) -> Optional[tuple[int, int]]:
     """
-    Adds bounding box to issue.
+    Finds text within content, ignoring differences in whitespace and preferring matches on word boundaries.
 
     Args:
-        pdf_document: The PDF document file stream.
-        issue: The issue object.
+        text: The text to find.
+        content: The content to search.
+        start: The offset to start searching from.
+        end: optional - the offset to stop searching at.
 
     Returns:
-        The issue object with bounding box.
+        The (start, end) character offsets of the first match, or None if the text is not found.
     """
-    page_num = di_result.paragraphs[issue.location.para_index].bounding_regions[0].page_number
-    para_offset = di_result.paragraphs[issue.location.para_index].spans[0].offset
-    page_words = di_result.pages[page_num - 1].words
+    end = len(content) if end is None else end
+    text = text.strip()
+    if not text:
+        return None
+
+    # Try an exact match first, which covers most issues and avoids compiling a pattern per issue
+    first_match = None
+    index = content.find(text, start, end)
+    while index != -1:
+        if _is_whole_words(content, index, index + len(text)):
+            return index, index + len(text)
+        first_match = first_match or (index, index + len(text))
+        index = content.find(text, index + 1, end)
+    if first_match:
+        return first_match
+
+    pattern = re.compile(r"\s+".join(re.escape(token) for token in text.split()))
+    for match in pattern.finditer(content, start, end):
+        if _is_whole_words(content, *match.span()):
+            return match.span()
+        first_match = first_match or match.span()
+    return first_match
 
-    # Add page num to the issue object
-    issue.location.page_num = page_num
 
-    # Get the index (offset) of the issue text within the paragraph so we can find the issue text in the analyze result
-    try:
-        text_index = issue.location.source_sentence.index(issue.text)
-    except ValueError:
-        logging.error(f"Unable to add bounding box to issue: '{issue.text}' not found in source sentence: '{issue.location.source_sentence}'.", str(issue))
-        return issue
+def locate_issue(di_result: AnalyzeResult, issue: CombinedIssue) -> Optional[tuple[int, int]]:
+    """
+    Locates the issue text within the document content.
+
+    The source sentence is found within the issue's paragraph first, and the issue text within the source sentence,
+    so repeated occurrences of the issue text in the paragraph resolve to the one the issue refers to.
 
-    # Get the index within the document word list of the first word in the source paragraph (using its span offset value)
+    Returns:
+        The (start, end) character offsets of the issue text within `di_result.content`, or None if not found.
+    """
     # https://learn.microsoft.com/en-us/azure/ai-services/document-intelligence/concept/analyze-document-response?view=doc-intel-4.0.0#spans
-    try:
-        para_first_word_index = next(i for i, word in enumerate(page_words) if word.span.offset == para_offset)
-    except Exception as e:
-        logging.error(f"Unable to add bounding box to issue '{issue.text}'. Could not find index of first word in source sentence; no matching word with paragraph offset ({para_offset}) in DI words list", str(issue))
-        return issue
+    spans = di_result.paragraphs[issue.location.para_index].spans
+    para_start = spans[0].offset
+    para_end = spans[-1].offset + spans[-1].length
 
-    # Then calculate how many words into the paragraph the issue text starts
-    num_of_words_to_issue_text = len(issue.location.source_sentence[0:text_index].split())
-    first_issue_word_index = para_first_word_index + num_of_words_to_issue_text
+    # The agents are given paragraphs with an index prefix (e.g. "[12]"), which may be copied into the source sentence
+    source_sentence = re.sub(r"^\[\d+\]", "", issue.location.source_sentence)
+    sentence_span = find_text(source_sentence, di_result.content, para_start, para_end)
+    if sentence_span:
+        text_span = find_text(issue.text, di_result.content, *sentence_span)
+        if text_span:
+            return text_span
 
-    # Get the issue word objects from the Document Intelligence page result
+    return find_text(issue.text, di_result.content, para_start, para_end)
+
+
+def find_issue_words(
+    di_result: AnalyzeResult, issue: CombinedIssue, word_index: DocumentWordIndex
+) -> Optional[tuple[int, list[DocumentWord]]]:
+    """
+    Finds the words that make up the issue text, and sets the issue's page number.
+
+    Returns:
+        The page number and words of the issue on the page it starts on, or None if the issue text was not found.
+    """
+    # Add page num to the issue object
+    issue.location.page_num = word_index.paragraph_pages[issue.location.para_index]
+
+    # Find the character offsets of the issue text within the document content
+    issue_span = locate_issue(di_result, issue)
+    if issue_span is None:
+        logging.error(f"Unable to add bounding box to issue: '{issue.text}' not found in paragraph {issue.location.para_index} or source sentence: '{issue.location.source_sentence}'. Issue: {issue}")
+        return None
+
+    # Get the issue word objects whose spans overlap the issue text
     # https://learn.microsoft.com/en-us/azure/ai-services/document-intelligence/concept/analyze-document-response?view=doc-intel-4.0.0#word
-    page_words = di_result.pages[page_num - 1].words
-    issue_text_word_count = len(issue.text.split())
-    issue_words = page_words[first_issue_word_index:first_issue_word_index+issue_text_word_count]
+    issue_words = word_index.find_words(*issue_span)
+    if not issue_words:
+        logging.error(f"Unable to add bounding box to issue '{issue.text}'. No words found in DI words list for offsets {issue_span}. Issue: {issue}")
+        return None
+
+    # Highlight the issue on the page it starts on
+    page_num = issue_words[0][0]
+    issue.location.page_num = page_num
+    return page_num, [word for word_page_num, word in issue_words if word_page_num == page_num]
+
 
-    # Then use the Polygon coordinates of each word to stitch together a bounding box
-    page_height = di_result.pages[page_num - 1].height
-    issue_box = create_bounding_box(issue_words, page_height)
+def add_bounding_boxes(
+    di_result: AnalyzeResult, issues: list[CombinedIssue], word_index: Optional[DocumentWordIndex] = None
+) -> list[CombinedIssue]:
+    """
+    Adds bounding boxes to issues in the same document.
 
-    # Add the bounding box to the issue object
-    issue.location.bounding_box = issue_box
+    Args:
+        di_result: The Document Intelligence result for the document.
+        issues: The issue objects.
+        word_index: optional - index of the document words. Pass a shared index when adding bounding boxes to
+            issues from many chunks of the same document; one is built for this call otherwise.
 
-    return issue
+    Returns:
+        The issue objects with bounding boxes. Issues that could not be located are returned without one.
+    """
+    if word_index is None:
+        word_index = DocumentWordIndex(di_result)
+
+    located_issues, issues_words, page_heights = [], [], []
+    for issue in issues:
+        try:
+            issue_words = find_issue_words(di_result, issue, word_index)
+        except Exception as e:
+            logging.exception(e)
+            logging.error(f"Unable to add bounding box to issue. Unexpected error occurred. Issue: {issue}")
+            continue
+
+        if issue_words is not None:
+            page_num, words = issue_words
+            located_issues.append(issue)
+            issues_words.append(words)
+            page_heights.append(di_result.pages[page_num - 1].height)
+
+    # Then use the Polygon coordinates of each word to stitch together the bounding boxes, for all issues at once
+    for issue, issue_box in zip(located_issues, create_bounding_boxes(issues_words, page_heights)):
+        issue.location.bounding_box = issue_box
+
+    return issues
+
+
+def add_bounding_box(
+    di_result: AnalyzeResult, issue: CombinedIssue, word_index: Optional[DocumentWordIndex] = None
+) -> CombinedIssue:
+    """
+    Adds bounding box to issue.
+
+    Args:
+        di_result: The Document Intelligence result for the document.
+        issue: The issue object.
+        word_index: optional - index of the document words. Pass a shared index when adding bounding boxes to
+            many issues in the same document; one is built for this call otherwise.
+
+    Returns:
+        The issue object with bounding box.
+    """
+    return add_bounding_boxes(di_result, [issue], word_index)[0]
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from azure.ai.formrecognizer import AnalyzeResult
+from azure.core.credentials import TokenCredential
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity import DefaultAzureCredential
+from azure.storage.blob import BlobClient, ContainerClient
+
+
+DOCUMENT_CACHE_DIR = os.environ.get("DOCUMENT_CACHE_DIR")
+DOCUMENT_CACHE_CONTAINER_URL = os.environ.get("DOCUMENT_CACHE_CONTAINER_URL")
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get("DOCUMENT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+# How often a blob cache lists its container to evict entries, and refreshes the LRU clock of an entry that is read
+DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS = float(os.environ.get("DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS", 3600))
+DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS = float(os.environ.get("DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS", 3600))
+
+
+class AnalyzeResultCache(ABC):
+    """
+    Content-addressed cache of Document Intelligence results, with size-based LRU eviction.
+
+    Entries are stored as gzipped JSON (`AnalyzeResult.to_dict()`). Backends implement the raw byte storage.
+    """
+
+    def __init__(self, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[AnalyzeResult]:
+        data = self._read(key)
+        if data is None:
+            return None
+        return AnalyzeResult.from_dict(json.loads(gzip.decompress(data)))
+
+    def set(self, key: str, result: AnalyzeResult) -> None:
+        data = gzip.compress(json.dumps(result.to_dict()).encode("utf-8"))
+        self._write(key, data)
+        self._evict()
+
+    @abstractmethod
+    def _read(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def _write(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _evict(self) -> None:
+        ...
+
+
+class LocalDiskCache(AnalyzeResultCache):
+    """Stores entries as files in a local directory. File modification time is used as the LRU clock."""
+
+    def __init__(self, directory: str, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES) -> None:
+        super().__init__(max_bytes)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json.gz"
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used
+        path.touch()
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as temp_file:
+            temp_file.write(data)
+        os.replace(temp_file.name, self._path(key))
+
+    def _evict(self) -> None:
+        entries = [(path, path.stat()) for path in self.directory.glob("*.json.gz")]
+        total_bytes = sum(stat.st_size for _, stat in entries)
+
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= stat.st_size
+            logging.info(f"Evicted {path.name} from document cache.")
+
+
+class BlobCache(AnalyzeResultCache):
+    """
+    Stores entries as blobs in a storage container. Blob last modified time is used as the LRU clock.
+
+    To keep storage round trips off the hot path, a read only refreshes the clock of an entry last touched more than
+    `touch_interval` seconds ago, and eviction (which lists the whole container) runs at most once every
+    `evict_interval` seconds per process, so the cache can grow past `max_bytes` in between.
+    """
+
+    def __init__(
+        self,
+        container_url: str,
+        credential: TokenCredential,
+        max_bytes: int = DOCUMENT_CACHE_MAX_BYTES,
+        evict_interval: float = DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS,
+        touch_interval: float = DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS,
+    ) -> None:
+        super().__init__(max_bytes)
+        self.container_client = ContainerClient.from_container_url(container_url, credential=credential)
+        self.evict_interval = evict_interval
+        self.touch_interval = timedelta(seconds=touch_interval)
+        self._next_evict_at = 0.0
+        self._evict_lock = threading.Lock()
+
+    def _blob_name(self, key: str) -> str:
+        return f"{key}.json.gz"
+
+    def _read(self, key: str) -> Optional[bytes]:
+        blob_client = self.container_client.get_blob_client(self._blob_name(key))
+        try:
+            downloader = blob_client.download_blob()
+            data = downloader.readall()
+        except ResourceNotFoundError:
+            return None
+
+        # Mark the entry as recently used (updating metadata bumps the blob's last modified time)
+        now = datetime.now(timezone.utc)
+        if now - downloader.properties.last_modified >= self.touch_interval:
+            blob_client.set_blob_metadata({"last_accessed": now.isoformat()})
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        self.container_client.upload_blob(self._blob_name(key), data, overwrite=True)
+
+    def _evict(self) -> None:
+        with self._evict_lock:
+            if time.monotonic() < self._next_evict_at:
+                return
+            self._next_evict_at = time.monotonic() + self.evict_interval
+
+        blobs = list(self.container_client.list_blobs())
+        total_bytes = sum(blob.size for blob in blobs)
+
+        for blob in sorted(blobs, key=lambda blob: blob.last_modified):
+            if total_bytes <= self.max_bytes:
+                break
+            self.container_client.delete_blob(blob.name)
+            total_bytes -= blob.size
+            logging.info(f"Evicted {blob.name} from document cache.")
+
+
+def get_cache_key(document_url: str, model_id: str, credential: TokenCredential) -> str:
+    """
+    Builds a cache key for a document without downloading it.
+
+    Args:
+        document_url: The URL of the document blob.
+        model_id: The Document Intelligence model used to analyze the document.
+        credential: The credential used to read the blob properties.
+
+    Returns:
+        The content MD5 of the blob combined with the model id, falling back to the blob URL and ETag
+        when the blob has no stored content hash.
+    """
+    properties = BlobClient.from_blob_url(document_url, credential=credential).get_blob_properties()
+    content_md5 = properties.content_settings.content_md5
+    if content_md5:
+        identity = f"md5:{bytes(content_md5).hex()}"
+    else:
+        identity = f"etag:{document_url}:{properties.etag}"
+
+    return hashlib.sha256(f"{model_id}|{identity}".encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_document_cache() -> Optional[AnalyzeResultCache]:
+    """Returns the configured document cache backend, or None if caching is disabled."""
+    if DOCUMENT_CACHE_CONTAINER_URL:
+        return BlobCache(DOCUMENT_CACHE_CONTAINER_URL, DefaultAzureCredential())
+    if DOCUMENT_CACHE_DIR:
+        return LocalDiskCache(DOCUMENT_CACHE_DIR)
+    return None
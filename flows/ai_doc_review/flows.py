@@ -39,7 +39,9 @@ def create_flow(agent_prompt_path, consolidator_prompt_path, guidelines_prompt_p
             "nodes.guidelines_prompt.source.path": str(guidelines_prompt_path),
             "nodes.llm_multishot.inputs.module_path": str(MODELS_MODULE_PATH),
             "nodes.consolidator.inputs.module_path": str(MODELS_MODULE_PATH),
-        }
+        },
+        # Return the agent output as a generator, so issues can be used as soon as the consolidator streams them
+        streaming=True,
     )
     return flow
 
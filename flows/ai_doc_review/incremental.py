@@ -0,0 +1,80 @@
+import hashlib
+import logging
+from difflib import SequenceMatcher
+from typing import Tuple
+
+from azure.ai.formrecognizer import AnalyzeResult
+
+from bounding_box import add_bounding_boxes
+from common.models import CarriedOverIssue, PreviousIssue
+from text import analyze_document
+
+
+def hash_paragraph(content: str) -> str:
+    """Hashes paragraph content, ignoring differences in whitespace."""
+    return hashlib.sha256(" ".join(content.split()).encode("utf-8")).hexdigest()
+
+
+def match_paragraphs(previous_result: AnalyzeResult, current_result: AnalyzeResult) -> dict[int, int]:
+    """
+    Matches unchanged paragraphs between two versions of a document.
+
+    Args:
+        previous_result: The Document Intelligence result for the previous version.
+        current_result: The Document Intelligence result for the current version.
+
+    Returns:
+        Mapping of paragraph index in the previous version to paragraph index in the current version,
+        for every paragraph whose content did not change.
+    """
+    previous_hashes = [hash_paragraph(paragraph.content) for paragraph in previous_result.paragraphs]
+    current_hashes = [hash_paragraph(paragraph.content) for paragraph in current_result.paragraphs]
+
+    # Match in document order, so a repeated paragraph (e.g. a recurring heading) maps to its counterpart in sequence
+    matcher = SequenceMatcher(None, previous_hashes, current_hashes, autojunk=False)
+    return {
+        previous_index + offset: current_index + offset
+        for previous_index, current_index, size in matcher.get_matching_blocks()
+        for offset in range(size)
+    }
+
+
+def plan_incremental_review(
+    di_result: AnalyzeResult, previous_pdf_name: str, previous_issues: list[dict]
+) -> Tuple[list[CarriedOverIssue], set[int]]:
+    """
+    Diffs a document against its previous version to work out what needs reviewing.
+
+    Args:
+        di_result: The Document Intelligence result for the current version.
+        previous_pdf_name: The filename of the previous version of the document.
+        previous_issues: The issues stored against the previous version.
+
+    Returns:
+        The previous issues found in unchanged paragraphs, relocated to the current version,
+        and the indices of the paragraphs that are new or changed and need to be reviewed.
+    """
+    previous_result = analyze_document(previous_pdf_name)
+    paragraph_map = match_paragraphs(previous_result, di_result)
+    changed_paragraphs = set(range(len(di_result.paragraphs))) - set(paragraph_map.values())
+
+    relocated_issues = []
+    for previous_issue in map(PreviousIssue.model_validate, previous_issues):
+        para_index = paragraph_map.get(previous_issue.location.para_index)
+        if para_index is None:
+            # The paragraph changed, so the issue will be raised again (if still relevant) by the review
+            continue
+
+        issue = previous_issue.model_copy(deep=True)
+        issue.location.para_index = para_index
+        issue.location.bounding_box = []
+        relocated_issues.append(issue)
+
+    add_bounding_boxes(di_result, relocated_issues)
+    carried_over = [CarriedOverIssue(id=issue.id, location=issue.location) for issue in relocated_issues]
+
+    logging.info(
+        f"Incremental review: {len(changed_paragraphs)} of {len(di_result.paragraphs)} paragraphs changed, "
+        f"carrying over {len(carried_over)} of {len(previous_issues)} issues."
+    )
+    return carried_over, changed_paragraphs
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Optional
+
+from azure.ai.formrecognizer import AnalyzeResult, DocumentParagraph
+
+from common.models import IssueType
+
+# Prefilter of each agent, by issue type; agents that are not listed review every paragraph
+PREFILTERS = json.loads(os.environ.get(
+    "PREFILTERS", json.dumps({IssueType.GrammarSpelling.value: "text", IssueType.DefinitiveLanguage.value: "definitive_terms"})
+))
+# Words and phrases that make a paragraph a candidate for the definitive language agent
+DEFINITIVE_TERMS = os.environ.get("PREFILTER_DEFINITIVE_TERMS", "|".join([
+    r"always", r"never", r"will", r"won't", r"must", r"shall", r"guarantee\w*", r"ensur\w+", r"assur\w+",
+    r"definite(ly)?", r"certain(ly)?", r"absolute(ly)?", r"undoubted(ly)?", r"undeniabl[ey]", r"prove[dn]",
+    r"best", r"unbeatable", r"unmatched", r"superior", r"perfect(ly)?", r"complete(ly)?", r"total(ly)?",
+    r"entirely", r"fully", r"permanent(ly)?", r"cure[ds]?", r"eliminat\w+", r"every(one|thing)?", r"nothing",
+    r"no one", r"risk-free", r"100 ?%", r"without (a |any )?(doubt|risk|fail)",
+]))
+
+# Document Intelligence roles of repeated page furniture, which no agent needs to review
+PAGE_FURNITURE_ROLES = {"pageHeader", "pageFooter", "pageNumber"}
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+REPEATED_WORD_PATTERN = re.compile(r"\b(\w+)\s+\1\b", re.IGNORECASE)
+
+
+class Prefilter:
+    """
+    Picks the paragraphs worth sending to an agent, so the LLM is not called on chunks that can't have issues.
+
+    Prefilters run locally and must be cheap and conservative: a paragraph they skip is never reviewed by the agent.
+    This base filter only skips page headers, footers and numbers, and paragraphs without any words (e.g. tables of
+    contents entries reduced to numbers, or lines of dots); subclasses narrow it down further with `is_candidate`.
+    """
+
+    def select(self, di_result: AnalyzeResult, paragraph_indices: Optional[set[int]] = None) -> set[int]:
+        """Returns the indices of the paragraphs to review, out of `paragraph_indices` (or all paragraphs)."""
+        return {
+            i for i, paragraph in enumerate(di_result.paragraphs)
+            if (paragraph_indices is None or i in paragraph_indices)
+            and paragraph.role not in PAGE_FURNITURE_ROLES
+            and WORD_PATTERN.search(paragraph.content)
+            and self.is_candidate(paragraph)
+        }
+
+    def is_candidate(self, paragraph: DocumentParagraph) -> bool:
+        return True
+
+
+class DefinitiveTermsPrefilter(Prefilter):
+    """Reviews paragraphs that use any of the definitive terms of `PREFILTER_DEFINITIVE_TERMS`."""
+
+    def __init__(self, terms: str = DEFINITIVE_TERMS) -> None:
+        self.pattern = re.compile(rf"(?<!\w)({terms})(?!\w)", re.IGNORECASE)
+
+    def is_candidate(self, paragraph: DocumentParagraph) -> bool:
+        return self.pattern.search(paragraph.content) is not None
+
+
+class SpellingPrefilter(Prefilter):
+    """
+    Reviews paragraphs with a word missing from the spell-check dictionary (`pyspellchecker`), or a repeated word.
+
+    This only catches spelling mistakes, not grammar mistakes made of correctly spelled words, so it is not enabled
+    by default. If the dictionary can't be loaded, every paragraph is reviewed.
+    """
+
+    def __init__(self) -> None:
+        try:
+            from spellchecker import SpellChecker
+
+            self.spell_checker = SpellChecker()
+        except Exception as e:
+            logging.warning(f"Unable to load spell-check dictionary, reviewing every paragraph for spelling: {e}")
+            self.spell_checker = None
+
+    def is_candidate(self, paragraph: DocumentParagraph) -> bool:
+        if self.spell_checker is None or REPEATED_WORD_PATTERN.search(paragraph.content):
+            return True
+        # Acronyms and other words with capitals after the first letter are rarely in the dictionary
+        words = [word for word in WORD_PATTERN.findall(paragraph.content) if word[1:].islower() or len(word) == 1]
+        return bool(self.spell_checker.unknown(words))
+
+
+PREFILTER_TYPES = {
+    "text": Prefilter,
+    "definitive_terms": DefinitiveTermsPrefilter,
+    "spelling": SpellingPrefilter,
+}
+
+
+@lru_cache(maxsize=None)
+def get_prefilter(issue_type: IssueType) -> Optional[Prefilter]:
+    """Returns the configured prefilter of an agent, or None if the agent reviews every paragraph."""
+    name = PREFILTERS.get(issue_type.value)
+    if name is None or name == "none":
+        return None
+    if name not in PREFILTER_TYPES:
+        logging.warning(f"Unknown prefilter '{name}' for {issue_type.value}. Reviewing every paragraph.")
+        return None
+    return PREFILTER_TYPES[name]()
+
+
+def prefilter_paragraphs(
+    di_result: AnalyzeResult, issue_types: list[IssueType], paragraph_indices: Optional[set[int]] = None
+) -> dict[IssueType, Optional[set[int]]]:
+    """
+    Picks the paragraphs each agent reviews with its prefilter, and logs how many paragraphs each one skips.
+
+    Args:
+        di_result: The Document Intelligence result.
+        issue_types: The agents.
+        paragraph_indices: The paragraphs to review, or None for all paragraphs.
+
+    Returns:
+        Mapping of each agent to the paragraphs it reviews (None for all paragraphs).
+    """
+    total = len(paragraph_indices) if paragraph_indices is not None else len(di_result.paragraphs)
+    agent_paragraphs = {}
+    for issue_type in issue_types:
+        prefilter = get_prefilter(issue_type)
+        if prefilter is None:
+            agent_paragraphs[issue_type] = paragraph_indices
+            continue
+
+        selected = prefilter.select(di_result, paragraph_indices)
+        agent_paragraphs[issue_type] = selected
+        skipped = total - len(selected)
+        logging.info(
+            f"Prefilter for {issue_type.value} skipped {skipped} of {total} paragraphs "
+            f"({skipped / total if total else 0:.0%})."
+        )
+    return agent_paragraphs
@@ -1,49 +1,167 @@
 from promptflow.core import tool
-from concurrent.futures import ThreadPoolExecutor as Pool
-from typing import Callable, Generator, Any
-from functools import partial
+from azure.ai.formrecognizer import AnalyzeResult
+from typing import Callable, Generator, Iterable, Optional, Union
 from typing import Tuple
-import logging
+from itertools import zip_longest
+from queue import Queue
+import json
+import threading
 
-from bounding_box import add_bounding_box
-from common.models import AllCombinedIssues, IssueType
-from text import analyze_document, get_text_chunks
-from flows import setup_flows
+from bounding_box import DocumentWordIndex, add_bounding_boxes
+from common.json_stream import parse_array_items
+from common.models import AllCombinedIssues, CombinedIssue, IssueType
+from text import TextChunk, analyze_document, get_text_chunks
+from flows import AGENT_PROMPTS, setup_flows
+from incremental import plan_incremental_review
+from prefilter import prefilter_paragraphs
+from scheduler import run_pipelined
 
 
-def run_flow(flow: Tuple[IssueType, Callable], text: str) -> Tuple[IssueType, Any]:
+_RUN_COMPLETE = object()
+_DONE = object()
+
+
+def read_issues(agent_output: Union[str, Iterable[str]]) -> Generator[CombinedIssue, None, None]:
+    """
+    Yields the issues of an agent flow run as they arrive. The agent output is the JSON text of `AllCombinedIssues`,
+    or a generator of fragments of it when the consolidator response is streamed.
+    """
+    fragments = [agent_output] if isinstance(agent_output, str) else agent_output
+    for item in parse_array_items(fragments, "issues"):
+        yield CombinedIssue.model_validate_json(item)
+
+
+def run_flow(flow: Tuple[IssueType, Callable], text_chunk: TextChunk) -> Tuple[IssueType, list[CombinedIssue]]:
     issue_type, flow_function = flow
-    return issue_type, flow_function(text=text)
+    agent_results = flow_function(text=text_chunk.text)
+    return issue_type, list(read_issues(agent_results["agent_output"]))
+
+
+def plan_flow_runs(
+    di_result: AnalyzeResult, pagination: int, paragraph_indices: Optional[set[int]] = None
+) -> list[Tuple[IssueType, TextChunk]]:
+    """
+    Plans a flow run for every agent and text chunk of the paragraphs its prefilter picks for review.
 
+    Each agent gets its own chunks, as the prefilters pick different paragraphs. The runs of the agents are
+    interleaved, so the start of the document is reviewed by every agent first.
+    """
+    agent_paragraphs = prefilter_paragraphs(di_result, list(AGENT_PROMPTS), paragraph_indices)
+    agent_runs = [
+        [
+            (issue_type, text_chunk) for text_chunk in get_text_chunks(
+                di_result, paragraphs_per_chunk=pagination, paragraph_indices=agent_paragraphs[issue_type]
+            )
+        ]
+        for issue_type in AGENT_PROMPTS
+    ]
+    return [flow_run for flow_runs in zip_longest(*agent_runs) for flow_run in flow_runs if flow_run is not None]
 
-def get_issues_from_text_chunks(pdf_name: str, pagination: int) -> Generator[Any, Any, Any]:
+
+def get_issues_from_text_chunks(
+    di_result: AnalyzeResult,
+    flow_runs: list[Tuple[IssueType, TextChunk]],
+    ordered: bool = False
+) -> Generator[Tuple[list[CombinedIssue], int], None, None]:
+    """
+    Runs the planned flow runs, yielding their issues along with the number of flow runs completed since the last
+    yield.
+
+    Unless `ordered` is set, issues are yielded as soon as the consolidator of a flow run streams them, rather than
+    once the whole run completes, so the first issues are not held back by the slowest consolidator call of a chunk.
+    Issues that arrive together are yielded together. With `ordered`, the issues of each run are yielded in the
+    order the runs were planned, once it completes.
+    """
     flows = setup_flows()
-    di_result = analyze_document(pdf_name)
-    with Pool() as pool:
-        for text_chunk in get_text_chunks(di_result, paragraphs_per_chunk=pagination):
-            agent_flow_results = pool.map(partial(run_flow, text=text_chunk), flows.items())
-
-            # Process batches of agent results
-            for issue_type, agent_results in agent_flow_results:
-                output = AllCombinedIssues.model_validate_json(agent_results["agent_output"])
-    
-                # Add type and bounding box to each issue
-                for issue in output.issues:
-                    issue.type = issue_type
-                    try:
-                        issue = add_bounding_box(di_result, issue)
-                    except Exception as e:
-                        logging.exception(e)
-                        logging.error(f"Unable to add bounding box to issue. Unexpected error occurred", str(issue))
-
-                yield output.issues
+    word_index = DocumentWordIndex(di_result)
+
+    def prepare(text_chunk: TextChunk, issue_type: IssueType, issues: list[CombinedIssue]) -> list[CombinedIssue]:
+        # Paragraphs repeated from the previous chunk as context are reviewed with that chunk, so drop their issues
+        context = set(text_chunk.context_indices)
+        issues = [issue for issue in issues if issue.location.para_index not in context]
+
+        # Add type to each issue
+        for issue in issues:
+            issue.type = issue_type
+        return issues
+
+    # Queue every planned (agent, text chunk) flow run in a bounded work queue
+    queued_runs = (((issue_type, flows[issue_type]), text_chunk) for issue_type, text_chunk in flow_runs)
+
+    if ordered:
+        for (_, text_chunk), (issue_type, issues) in run_pipelined(
+            lambda flow_run: run_flow(*flow_run), queued_runs, ordered=True
+        ):
+            issues = prepare(text_chunk, issue_type, issues)
+            add_bounding_boxes(di_result, issues, word_index)
+            yield issues, 1
+        return
+
+    # The flow runs hand over each issue as it arrives, while a separate thread keeps the work queue going
+    updates = Queue()
+    stopped = threading.Event()
+
+    def stream_flow(flow_run) -> None:
+        (issue_type, flow_function), text_chunk = flow_run
+        agent_results = flow_function(text=text_chunk.text)
+        for issue in read_issues(agent_results["agent_output"]):
+            if stopped.is_set():
+                return
+            updates.put((text_chunk, issue_type, issue))
+
+    def run_all() -> None:
+        try:
+            for _ in run_pipelined(stream_flow, queued_runs):
+                updates.put(_RUN_COMPLETE)
+                if stopped.is_set():
+                    break
+        except Exception as e:
+            updates.put(e)
+        updates.put(_DONE)
+
+    threading.Thread(target=run_all, daemon=True).start()
+    try:
+        done = False
+        while not done:
+            batch = [updates.get()]
+            while not updates.empty():
+                batch.append(updates.get_nowait())
+
+            issues, completed_runs = [], 0
+            for update in batch:
+                if update is _DONE:
+                    done = True
+                elif update is _RUN_COMPLETE:
+                    completed_runs += 1
+                elif isinstance(update, Exception):
+                    raise update
+                else:
+                    text_chunk, issue_type, issue = update
+                    issues.extend(prepare(text_chunk, issue_type, [issue]))
+
+            if issues or completed_runs:
+                add_bounding_boxes(di_result, issues, word_index)
+                yield issues, completed_runs
+    finally:
+        stopped.set()
 
 
 @tool
-def process(pdf_name: str) -> str:
+def process(pdf_name: str, previous_pdf_name: str = "", previous_issues: Optional[list] = None) -> str:
+    previous_issues = previous_issues or []
+    di_result = analyze_document(pdf_name)
+
+    # When a previous version is given, only review the paragraphs that changed
+    carried_over, paragraph_indices = [], None
+    if previous_pdf_name:
+        carried_over, paragraph_indices = plan_incremental_review(di_result, previous_pdf_name, previous_issues)
+
     all_issues = []
-    for issues in get_issues_from_text_chunks(pdf_name, pagination=64):
+    flow_runs = plan_flow_runs(di_result, pagination=64, paragraph_indices=paragraph_indices)
+    for issues, _ in get_issues_from_text_chunks(di_result, flow_runs, ordered=True):
         all_issues.extend(issues) 
 
     # Return all issues for this chunk of text
-    return AllCombinedIssues(issues=all_issues).model_dump_json()
\ No newline at end of file
+    output = AllCombinedIssues(issues=all_issues).model_dump()
+    output["carried_over"] = [issue.model_dump() for issue in carried_over]
+    return json.dumps(output)
\ No newline at end of file
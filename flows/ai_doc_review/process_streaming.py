@@ -1,8 +1,11 @@
 from promptflow.core import tool
-from typing import Callable, Generator, Any
+import json
+from typing import Callable, Generator, Any, Optional
 
-from common.models import AllCombinedIssues
-from process import get_issues_from_text_chunks
+from common.models import AllCombinedIssues, FlowOutputChunk
+from incremental import plan_incremental_review
+from process import get_issues_from_text_chunks, plan_flow_runs
+from text import analyze_document
 
 
 def run_flow(flow: Callable, text: str):
@@ -10,6 +13,30 @@ def run_flow(flow: Callable, text: str):
 
 
 @tool
-def process(pdf_name: str, pagination: int) -> Generator[Any, Any, Any]:
-    for issues in get_issues_from_text_chunks(pdf_name, pagination):
-        yield AllCombinedIssues(issues=issues).model_dump_json()
\ No newline at end of file
+def process(
+    pdf_name: str, pagination: int, previous_pdf_name: str = "", previous_issues: Optional[list] = None
+) -> Generator[Any, Any, Any]:
+    previous_issues = previous_issues or []
+    di_result = analyze_document(pdf_name)
+
+    # When a previous version is given, send back its issues in unchanged paragraphs first and only review the rest
+    carried_over, paragraph_indices = [], None
+    if previous_pdf_name:
+        carried_over, paragraph_indices = plan_incremental_review(di_result, previous_pdf_name, previous_issues)
+
+    # Report progress with every chunk, so the caller can tell how much of the review is done
+    flow_runs = plan_flow_runs(di_result, pagination, paragraph_indices)
+    chunks_total = len(flow_runs)
+    if carried_over:
+        yield FlowOutputChunk(
+            issues=[], carried_over=carried_over, chunks_done=0, chunks_total=chunks_total
+        ).model_dump_json()
+
+    # Issues are sent as soon as they arrive, and progress once each flow run completes
+    chunks_done = 0
+    for issues, completed_runs in get_issues_from_text_chunks(di_result, flow_runs):
+        chunks_done += completed_runs
+        output = AllCombinedIssues(issues=issues).model_dump(mode="json")
+        output["chunks_done"] = chunks_done
+        output["chunks_total"] = chunks_total
+        yield json.dumps(output)
@@ -0,0 +1,65 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Deque, Generator, Iterable, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+MAX_CONCURRENT_FLOWS = int(os.environ.get("MAX_CONCURRENT_FLOWS", 8))
+
+_DONE = object()
+
+
+def run_pipelined(
+    fn: Callable[[T], R],
+    tasks: Iterable[T],
+    max_concurrency: int = MAX_CONCURRENT_FLOWS,
+    ordered: bool = False,
+) -> Generator[Tuple[T, R], None, None]:
+    """
+    Runs a function over a stream of tasks using a bounded work queue.
+
+    Tasks are pulled lazily, and a new task is submitted as soon as a running one finishes, so a single slow call
+    never holds back the rest of the queue. At most `max_concurrency` calls run at once, with the same number
+    queued behind them.
+
+    Args:
+        fn: The function to run for each task.
+        tasks: The tasks to run.
+        max_concurrency: The maximum number of calls to run at the same time.
+        ordered: Yield results in task order rather than in completion order.
+
+    Returns:
+        Generator of (task, result) tuples, yielded as each call completes (or in task order if `ordered` is set).
+    """
+    task_iterator = iter(tasks)
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+    submitted: Deque[Tuple[T, Future]] = deque()
+
+    def fill_queue():
+        while len(submitted) < 2 * max_concurrency:
+            task = next(task_iterator, _DONE)
+            if task is _DONE:
+                return
+            submitted.append((task, pool.submit(fn, task)))
+
+    try:
+        fill_queue()
+        while submitted:
+            if ordered:
+                task, future = submitted.popleft()
+                result = future.result()
+                fill_queue()
+                yield task, result
+            else:
+                wait([future for _, future in submitted], return_when=FIRST_COMPLETED)
+                completed = [(task, future) for task, future in submitted if future.done()]
+                for item in completed:
+                    submitted.remove(item)
+                fill_queue()
+                for task, future in completed:
+                    yield task, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
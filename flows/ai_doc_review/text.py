@@ -1,37 +1,189 @@
+import logging
+import math
 import os
-from typing import Generator, Any
-from more_itertools import batched
+from functools import lru_cache
+from typing import Callable, Generator, Any, NamedTuple, Optional
 
 from azure.identity import DefaultAzureCredential
 from azure.ai.formrecognizer import DocumentAnalysisClient, AnalyzeResult
 
+from document_cache import get_cache_key, get_document_cache
+
 
 DOCUMENT_INTELLIGENCE_MODEL = "prebuilt-document"
 PARAGRAPHS_PER_CHUNK = 16
+# Chunks are packed with paragraphs up to this many tokens (0 packs a fixed number of paragraphs per chunk instead)
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", 2000))
+# Caps the paragraphs in a chunk packed up to the token budget (0 for no cap, so chunks are sized by tokens only)
+CHUNK_MAX_PARAGRAPHS = int(os.environ.get("CHUNK_MAX_PARAGRAPHS", 0))
+# Paragraphs repeated from the end of the previous chunk as context for the next one
+CHUNK_OVERLAP_PARAGRAPHS = int(os.environ.get("CHUNK_OVERLAP_PARAGRAPHS", 0))
+# A section heading starts a new chunk once the current chunk holds this fraction of the token budget
+CHUNK_HEADING_MIN_FILL = float(os.environ.get("CHUNK_HEADING_MIN_FILL", 0.5))
+CHUNK_TOKENIZER_ENCODING = os.environ.get("CHUNK_TOKENIZER_ENCODING", "o200k_base")
+HEADING_ROLES = {"title", "sectionHeading"}
 DOCUMENT_INTELLIGENCE_ENDPOINT = os.environ.get("DOCUMENT_INTELLIGENCE_ENDPOINT")
 STORAGE_URL_PREFIX = os.environ.get("STORAGE_URL_PREFIX")
 
 
 def analyze_document(pdf_name: str) -> AnalyzeResult:
     credential = DefaultAzureCredential()
+    pdf_url = f"{STORAGE_URL_PREFIX}/{pdf_name}"
+
+    # Reuse a previous analysis of the same document content if one is cached
+    cache = get_document_cache()
+    cache_key = None
+    if cache:
+        try:
+            cache_key = get_cache_key(pdf_url, DOCUMENT_INTELLIGENCE_MODEL, credential)
+            cached_result = cache.get(cache_key)
+            if cached_result:
+                logging.info(f"Using cached Document Intelligence result for {pdf_name}.")
+                return cached_result
+        except Exception as e:
+            logging.warning(f"Unable to read document cache for {pdf_name}: {e}")
+
     document_analysis_client = DocumentAnalysisClient(
         endpoint=DOCUMENT_INTELLIGENCE_ENDPOINT, credential=credential
     )
-
-    pdf_url = f"{STORAGE_URL_PREFIX}/{pdf_name}"
     poller = document_analysis_client.begin_analyze_document_from_url(
         model_id=DOCUMENT_INTELLIGENCE_MODEL, 
         document_url=pdf_url
     )
+    result = poller.result()
+
+    if cache and cache_key:
+        try:
+            cache.set(cache_key, result)
+        except Exception as e:
+            logging.warning(f"Unable to write document cache for {pdf_name}: {e}")
+
+    return result
+
+
+class TextChunk(NamedTuple):
+    text: str
+    paragraph_indices: list[int]
+    # Paragraphs repeated from the previous chunk as context, which are reviewed with that chunk
+    context_indices: list[int]
+
+
+class ChunkParagraph(NamedTuple):
+    index: int
+    line: str
+    tokens: int
+    is_heading: bool
+
+
+@lru_cache(maxsize=None)
+def get_token_counter() -> Callable[[str], int]:
+    """Returns a function that counts the tokens in some text, using a local tokenizer when one is available."""
+    try:
+        import tiktoken
 
-    return poller.result()
+        encoding = tiktoken.get_encoding(CHUNK_TOKENIZER_ENCODING)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        # E.g. tiktoken is not installed, or its encoding can't be downloaded: about 4 characters per token for English
+        logging.warning(f"Unable to load tokenizer {CHUNK_TOKENIZER_ENCODING}, estimating token counts instead: {e}")
+        return lambda text: math.ceil(len(text) / 4)
 
 
-def get_text_chunks(di_result: AnalyzeResult, paragraphs_per_chunk: int = PARAGRAPHS_PER_CHUNK) -> Generator[Any, Any, Any]:
+def pack_paragraphs(
+    paragraphs: list[ChunkParagraph],
+    max_tokens: int,
+    max_paragraphs: int,
+    overlap: int = 0
+) -> Generator[tuple[list[ChunkParagraph], list[ChunkParagraph]], None, None]:
+    """
+    Packs paragraphs into chunks of up to `max_tokens` tokens and `max_paragraphs` paragraphs.
+
+    A section heading starts a new chunk once the current chunk holds `CHUNK_HEADING_MIN_FILL` of the budget, and a
+    chunk never ends with a heading, so sections are kept together where possible. A paragraph larger than the budget
+    gets a chunk of its own. Up to `overlap` paragraphs from the end of a chunk are repeated as context at the start
+    of the next one, unless the next chunk starts a new section, taking at most half the budget.
+
+    Returns:
+        Generator of (context paragraphs, paragraphs) tuples, one for each chunk.
+    """
+    context: list[ChunkParagraph] = []
+    chunk: list[ChunkParagraph] = []
+    tokens = 0
+
+    for paragraph in paragraphs:
+        is_full = tokens + paragraph.tokens > max_tokens or len(chunk) >= max_paragraphs
+        starts_section = paragraph.is_heading and tokens >= max_tokens * CHUNK_HEADING_MIN_FILL
+        if chunk and (is_full or starts_section):
+            # Move a trailing heading to the next chunk, along with its section
+            carried = [chunk.pop()] if len(chunk) > 1 and chunk[-1].is_heading else []
+            yield context, chunk
+
+            context = [] if starts_section or carried else chunk[len(chunk) - min(overlap, len(chunk)):]
+            while context and sum(item.tokens for item in context) > max_tokens / 2:
+                context = context[1:]
+            chunk = carried
+            tokens = sum(item.tokens for item in context + chunk)
+
+        chunk.append(paragraph)
+        tokens += paragraph.tokens
+
+    if chunk:
+        yield context, chunk
+
+
+def get_text_chunks(
+    di_result: AnalyzeResult,
+    paragraphs_per_chunk: int = PARAGRAPHS_PER_CHUNK,
+    paragraph_indices: Optional[set[int]] = None,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap: int = CHUNK_OVERLAP_PARAGRAPHS,
+    max_paragraphs: int = CHUNK_MAX_PARAGRAPHS
+) -> Generator[TextChunk, Any, Any]:
+    """
+    Splits the paragraphs of a document into text chunks, each line holding a paragraph prefixed by its index.
+
+    Args:
+        di_result: The Document Intelligence result.
+        paragraphs_per_chunk: The number of paragraphs in a chunk when there is no token budget, or -1 for a single
+            chunk of the whole text without paragraph indices.
+        paragraph_indices: Restricts the chunks to a subset of paragraphs, keeping their original indices.
+        max_tokens: The token budget of a chunk, or 0 to split the text into chunks of `paragraphs_per_chunk`
+            paragraphs.
+        overlap: The number of paragraphs repeated from the end of the previous chunk as context.
+        max_paragraphs: The maximum number of paragraphs in a chunk packed up to the token budget, or 0 for no cap.
+
+    Returns:
+        Generator of text chunks.
+    """
+    paragraphs = [
+        (i, paragraph) for i, paragraph in enumerate(di_result.paragraphs)
+        if paragraph_indices is None or i in paragraph_indices
+    ]
+    if not paragraphs:
+        return
+
     if paragraphs_per_chunk == -1:
-        yield "\n".join([paragraph.content for paragraph in di_result.paragraphs])
+        yield TextChunk(
+            "\n".join([paragraph.content for _, paragraph in paragraphs]), [i for i, _ in paragraphs], []
+        )
+        return
+
+    count_tokens = get_token_counter() if max_tokens > 0 else lambda _: 0
+    chunk_paragraphs = []
+    for i, paragraph in paragraphs:
+        line = f"[{i}]{paragraph.content}"
+        # Count the newline joining the paragraph to the previous one too
+        chunk_paragraphs.append(ChunkParagraph(
+            i, line, count_tokens(line) + 1, max_tokens > 0 and paragraph.role in HEADING_ROLES
+        ))
+
+    if max_tokens > 0:
+        budget, paragraph_cap = max_tokens, max_paragraphs or math.inf
     else:
-        for item in map(
-            lambda batch: "\n".join(batch),
-            batched([f"[{i}]{paragraph.content}" for i, paragraph in enumerate(di_result.paragraphs)], paragraphs_per_chunk)):
-            yield item
\ No newline at end of file
+        budget, paragraph_cap = math.inf, paragraphs_per_chunk
+    for context, chunk in pack_paragraphs(chunk_paragraphs, budget, paragraph_cap, overlap):
+        yield TextChunk(
+            "\n".join(paragraph.line for paragraph in context + chunk),
+            [paragraph.index for paragraph in chunk],
+            [paragraph.index for paragraph in context],
+        )
@@ -0,0 +1,91 @@
+"""
+Benchmarks locating issue words in a Document Intelligence result.
+
+Compares the character-offset localisation in `bounding_box.py` with the previous approach of scanning the page
+for the paragraph's first word and counting whitespace-separated tokens, on a synthetic 1,000-page document.
+
+Usage (from the repository root, with the flow requirements installed):
+
+    python flows/benchmarks/bounding_box_benchmark.py [--pages 1000] [--issues 5000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[2]), str(Path(__file__).parents[1] / "ai_doc_review")]
+
+from bounding_box import DocumentWordIndex, locate_issue  # noqa: E402
+from synthetic import make_analyze_result, make_issues  # noqa: E402
+
+
+def locate_by_word_count(di_result, issue):
+    """The previous localisation: linear scan for the paragraph's first word, then count tokens before the issue."""
+    paragraph = di_result.paragraphs[issue.location.para_index]
+    page_words = di_result.pages[paragraph.bounding_regions[0].page_number - 1].words
+    try:
+        text_index = issue.location.source_sentence.index(issue.text)
+        para_first_word_index = next(i for i, word in enumerate(page_words) if word.span.offset == paragraph.spans[0].offset)
+    except (ValueError, StopIteration):
+        return []
+
+    first_issue_word_index = para_first_word_index + len(issue.location.source_sentence[0:text_index].split())
+    return page_words[first_issue_word_index:first_issue_word_index + len(issue.text.split())]
+
+
+def locate_by_offset(di_result, issue, word_index):
+    issue_span = locate_issue(di_result, issue)
+    if issue_span is None:
+        return []
+    return [word for _, word in word_index.find_words(*issue_span)]
+
+
+def is_correct(words, expected_span):
+    if not words:
+        return False
+    start = words[0].span.offset
+    end = words[-1].span.offset + words[-1].span.length
+    return start <= expected_span[0] and end >= expected_span[1] and all(
+        word.span.offset < expected_span[1] and word.span.offset + word.span.length > expected_span[0] for word in words
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--issues", type=int, default=5000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    di_result = make_analyze_result(pages=args.pages)
+    issues = make_issues(di_result, args.issues)
+    word_count = sum(len(page.words) for page in di_result.pages)
+    print(f"Synthetic document: {args.pages} pages, {len(di_result.paragraphs)} paragraphs, {word_count} words, "
+          f"{len(issues)} issues (built in {time.perf_counter() - start:.2f}s)")
+
+    start = time.perf_counter()
+    legacy_results = [locate_by_word_count(di_result, issue) for issue, _ in issues]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    word_index = DocumentWordIndex(di_result)
+    index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    offset_results = [locate_by_offset(di_result, issue, word_index) for issue, _ in issues]
+    offset_time = time.perf_counter() - start
+
+    for name, elapsed, results in [
+        ("word count (linear scan)", legacy_time, legacy_results),
+        ("character offsets (bisect)", offset_time, offset_results),
+    ]:
+        correct = sum(is_correct(words, expected) for words, (_, expected) in zip(results, issues))
+        print(f"{name:>28}: {elapsed * 1000:8.1f} ms total, {elapsed / len(issues) * 1e6:7.1f} us/issue, "
+              f"{correct / len(issues):6.1%} correct")
+    print(f"{'word index build':>28}: {index_time * 1000:8.1f} ms (once per document)")
+    ambiguous = sum(issue.location.source_sentence.count(issue.text) > 1 for issue, _ in issues)
+    print(f"{ambiguous / len(issues):.1%} of issues are ambiguous (the issue text occurs more than once in its source sentence)")
+
+
+if __name__ == "__main__":
+    main()
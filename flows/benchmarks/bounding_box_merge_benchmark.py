@@ -0,0 +1,90 @@
+"""
+Benchmarks merging issue word polygons into bounding box quadpoints.
+
+Compares the NumPy batch path in `bounding_box.py` with the previous path, which built a shapely `Polygon` per word
+and took the bounds of their union per line. Also checks both produce the same quadpoints.
+
+Usage (from the repository root, with the flow requirements installed, plus shapely and pymupdf for the comparison):
+
+    python flows/benchmarks/bounding_box_merge_benchmark.py [--pages 1000] [--issues 5000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[2]), str(Path(__file__).parents[1] / "ai_doc_review")]
+
+from bounding_box import DocumentWordIndex, create_bounding_box, create_bounding_boxes, find_issue_words  # noqa: E402
+from synthetic import make_analyze_result, make_issues  # noqa: E402
+
+try:
+    from fitz import Rect
+    from shapely import Polygon, union_all
+except ImportError:
+    Rect = None
+
+
+def create_bounding_box_shapely(issue_words, page_height):
+    """The previous implementation of `create_bounding_box`."""
+    dpi = 72
+    scaled_page_height = page_height * dpi
+    issue_boxes = []
+    quadpoints = []
+
+    for i, word in enumerate(issue_words):
+        issue_boxes.append(Polygon(word.polygon))
+        if i == len(issue_words) - 1 or issue_words[i + 1].polygon[0].x < word.polygon[2].x:
+            scaled_box = [point * dpi for point in union_all(issue_boxes).bounds]
+            scaled_box[1] = scaled_page_height - scaled_box[1]
+            scaled_box[3] = scaled_page_height - scaled_box[3]
+            quad = Rect(scaled_box).quad
+            quadpoints += [quad.ul.x, quad.ul.y, quad.ur.x, quad.ur.y, quad.ll.x, quad.ll.y, quad.lr.x, quad.lr.y]
+            issue_boxes = []
+
+    return [round(coord, 2) for coord in quadpoints]
+
+
+def timed(name, fn, count):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>32}: {elapsed * 1000:8.1f} ms total, {elapsed / count * 1e6:7.1f} us/issue")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--issues", type=int, default=5000)
+    args = parser.parse_args()
+
+    di_result = make_analyze_result(pages=args.pages)
+    word_index = DocumentWordIndex(di_result)
+    located = [find_issue_words(di_result, issue, word_index) for issue, _ in make_issues(di_result, args.issues)]
+    issues_words = [words for _, words in located]
+    page_heights = [di_result.pages[page_num - 1].height for page_num, _ in located]
+    word_count = sum(len(words) for words in issues_words)
+    print(f"{len(issues_words)} issues, {word_count} words, on a synthetic {args.pages}-page document")
+
+    if Rect is not None:
+        expected = timed("shapely (per issue)", lambda: [
+            create_bounding_box_shapely(words, height) for words, height in zip(issues_words, page_heights)
+        ], len(issues_words))
+    else:
+        expected = None
+        print("shapely and pymupdf are not installed, skipping the comparison with the previous implementation")
+
+    per_issue = timed("numpy (per issue)", lambda: [
+        create_bounding_box(words, height) for words, height in zip(issues_words, page_heights)
+    ], len(issues_words))
+    batched = timed("numpy (batch)", lambda: create_bounding_boxes(issues_words, page_heights), len(issues_words))
+
+    assert per_issue == batched, "Per issue and batch bounding boxes differ"
+    if expected is not None:
+        assert batched == expected, "NumPy and shapely bounding boxes differ"
+        print("Bounding boxes match the previous implementation")
+
+
+if __name__ == "__main__":
+    main()
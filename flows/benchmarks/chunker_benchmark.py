@@ -0,0 +1,76 @@
+"""
+Benchmarks splitting a document into text chunks for the agents.
+
+Compares the previous fixed number of paragraphs per chunk with packing paragraphs up to a token budget, on a
+synthetic document with paragraphs of varying length and regular section headings. Reports the number of chunks
+(each one is a flow run per agent), the spread of their sizes in tokens, how many chunks go over the budget, and how
+many sections are split across chunks.
+
+Usage (from the repository root, with the flow requirements installed):
+
+    python flows/benchmarks/chunker_benchmark.py [--pages 1000] [--paragraphs-per-chunk 100] [--max-tokens 2000]
+"""
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[2]), str(Path(__file__).parents[1] / "ai_doc_review")]
+
+from synthetic import make_analyze_result  # noqa: E402
+from text import HEADING_ROLES, get_text_chunks, get_token_counter  # noqa: E402
+
+
+def run(name, di_result, budget, paragraphs_per_chunk, max_tokens=0, overlap=0):
+    count_tokens = get_token_counter()
+    start = time.perf_counter()
+    chunks = list(get_text_chunks(di_result, paragraphs_per_chunk, max_tokens=max_tokens, overlap=overlap))
+    elapsed = time.perf_counter() - start
+
+    sizes = [count_tokens(chunk.text) for chunk in chunks]
+    headings = [i for i, paragraph in enumerate(di_result.paragraphs) if paragraph.role in HEADING_ROLES]
+    # A section is split when its heading is not at the start of a chunk and the chunk ends before the next section
+    chunk_of = {i: n for n, chunk in enumerate(chunks) for i in chunk.paragraph_indices}
+    next_headings = headings[1:] + [len(di_result.paragraphs)]
+    split_sections = sum(1 for heading, end in zip(headings, next_headings) if chunk_of[heading] != chunk_of[end - 1])
+
+    print(
+        f"{name:>22}: {len(chunks):5d} chunks, tokens min {min(sizes):5d} / mean {statistics.mean(sizes):7.1f} / "
+        f"max {max(sizes):5d} / stdev {statistics.pstdev(sizes):6.1f}, "
+        f"{sum(1 for size in sizes if size > budget):4d} over {budget} tokens, "
+        f"{split_sections:4d} of {len(headings)} sections split, {elapsed:5.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--paragraphs-per-chunk", type=int, default=100)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--overlap", type=int, default=2)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    di_result = make_analyze_result(
+        pages=args.pages, sentences_per_paragraph=1, max_sentences_per_paragraph=12, headings_every=12
+    )
+
+    count_tokens = get_token_counter()
+    budget, paragraphs_per_chunk = args.max_tokens, args.paragraphs_per_chunk
+    # Also the fixed number of paragraphs that gives about the same number of chunks as the token budget
+    document_tokens = sum(count_tokens(f"[{i}]{p.content}") + 1 for i, p in enumerate(di_result.paragraphs))
+    same_count = max(1, len(di_result.paragraphs) * budget // document_tokens)
+
+    run(f"{paragraphs_per_chunk} paragraphs", di_result, budget, paragraphs_per_chunk)
+    run(f"{same_count} paragraphs", di_result, budget, same_count)
+    run(f"{budget} tokens", di_result, budget, paragraphs_per_chunk, max_tokens=budget)
+    run(
+        f"{budget} tokens, overlap {args.overlap}", di_result, budget, paragraphs_per_chunk,
+        max_tokens=budget, overlap=args.overlap
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmarks joining the consolidator issues of a chunk to its aggregated single shot issues in the merge node.
+
+Compares the comment_id index in `merge.py`, which takes the aggregated issues as objects, with the previous merge,
+which parsed them back from the JSON text of the aggregate node and looked up each consolidator issue with a scan
+over all of them. Also checks both produce the same output.
+
+Usage (from the repository root, with the flow requirements installed):
+
+    python flows/benchmarks/issue_merge_benchmark.py [--issues 1000 2000 5000] [--repeat 3]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[2]), str(Path(__file__).parents[1] / "ai_doc_review" / "agent_template")]
+
+from common.models import (  # noqa: E402
+    AllCombinedIssues, AllConsolidatorIssues, AllSingleShotIssues, CombinedIssue, ConsolidatorIssue, SingleShotIssue
+)
+from merge import merge_singleshot_fields_with_consolidator  # noqa: E402
+from synthetic import make_analyze_result, make_issues  # noqa: E402
+
+
+def merge_nested_loop(agg_outputs, consolidator_outputs):
+    """The previous implementation of `merge_singleshot_fields_with_consolidator`."""
+    left_data = AllConsolidatorIssues.parse_raw(consolidator_outputs[0])
+    right_data = AllSingleShotIssues.parse_raw(agg_outputs)
+
+    combined_issues = []
+    for left_issue in left_data.issues:
+        for right_issue in right_data.issues:
+            if left_issue.comment_id == right_issue.comment_id:
+                combined_issue = CombinedIssue(**dict(left_issue, **dict(right_issue)))
+                if combined_issue.suggested_action != "REMOVE":
+                    combined_issues.append(combined_issue)
+
+    return AllCombinedIssues(issues=combined_issues).model_dump_json()
+
+
+def make_node_inputs(di_result, count):
+    """Builds the aggregated single shot issues and the consolidator response, with every third issue removed."""
+    single_shot_issues, consolidator_issues = [], []
+    for i, (issue, _) in enumerate(make_issues(di_result, count)):
+        single_shot_issues.append(SingleShotIssue(**dict(issue)))
+        consolidator_issues.append(ConsolidatorIssue(
+            comment_id=issue.comment_id, score=issue.score, suggested_action="REMOVE" if i % 3 == 0 else "KEEP",
+            reason_for_suggested_action=issue.reason_for_suggested_action,
+        ))
+    # The consolidator does not keep the order of the issues
+    consolidator_issues.reverse()
+    return AllSingleShotIssues(issues=single_shot_issues), [AllConsolidatorIssues(issues=consolidator_issues).model_dump_json()]
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--issues", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    di_result = make_analyze_result(pages=100)
+    for count in args.issues:
+        aggregated, consolidator_outputs = make_node_inputs(di_result, count)
+        # The previous aggregate node passed its issues on as JSON text
+        previous_time, previous = best_time(
+            lambda: merge_nested_loop(aggregated.model_dump_json(), consolidator_outputs), args.repeat
+        )
+        indexed_time, indexed = best_time(
+            lambda: merge_singleshot_fields_with_consolidator(aggregated, consolidator_outputs), args.repeat
+        )
+        assert previous == indexed, "Merged issues differ"
+        print(
+            f"{count:6d} issues: nested loop {previous_time * 1000:9.1f} ms, "
+            f"indexed {indexed_time * 1000:7.1f} ms ({previous_time / indexed_time:5.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmarks adaptive multishot against always requesting five shots per chunk.
+
+Each simulated chunk has a number of real issues (none for most chunks, as most paragraphs are clean), and each shot
+finds every real issue with some probability, plus the occasional spurious issue that no other shot repeats. Reports
+the shots requested and the share of the real issues found by at least one shot.
+
+Usage (from the repository root):
+
+    python flows/benchmarks/multishot_benchmark.py [--chunks 1000] [--clean 0.6] [--recall 0.7]
+"""
+import argparse
+import logging
+import random
+import sys
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[2]), str(Path(__file__).parents[1] / "ai_doc_review" / "agent_template")]
+
+from common.models import AllSingleShotIssues, IssueType, Location, SingleShotIssue  # noqa: E402
+from multishot import get_issue_key, run_adaptive_multishot  # noqa: E402
+
+SHOT_TOKENS = 3000
+
+
+def make_issue(sentence):
+    return SingleShotIssue(
+        type=IssueType.GrammarSpelling,
+        location=Location(source_sentence=sentence, page_num=1, bounding_box=[], para_index=0),
+        text=sentence, explanation="", suggested_fix="", comment_id="",
+    )
+
+
+def make_chunks(count, clean, rng):
+    chunks = []
+    for n in range(count):
+        issues = 0 if rng.random() < clean else rng.randint(1, 8)
+        chunks.append([make_issue(f"chunk {n} issue {i}") for i in range(issues)])
+    return chunks
+
+
+def make_shot(issues, recall, spurious, rng):
+    found = [issue for issue in issues if rng.random() < recall]
+    if rng.random() < spurious:
+        found.append(make_issue(f"spurious {rng.random()}"))
+    return [AllSingleShotIssues(issues=found).model_dump_json()]
+
+
+def run(name, chunks, request_shots, args):
+    rng = random.Random(1)
+    shots, found, total = 0, 0, 0
+    for issues in chunks:
+        responses = request_shots(lambda: make_shot(issues, args.recall, args.spurious, rng))
+        shots += len(responses)
+        keys = {
+            get_issue_key(issue)
+            for response in responses for issue in AllSingleShotIssues.model_validate_json(response).issues
+        }
+        found += len(keys & {get_issue_key(issue) for issue in issues})
+        total += len(issues)
+    print(f"{name:>10}: {shots:5d} shots ({shots * SHOT_TOKENS:9d} tokens), {found / total:6.1%} of real issues found")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--shots", type=int, default=5)
+    parser.add_argument("--clean", type=float, default=0.6)
+    parser.add_argument("--recall", type=float, default=0.7)
+    parser.add_argument("--spurious", type=float, default=0.1)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    chunks = make_chunks(args.chunks, args.clean, random.Random(0))
+    run(
+        f"{args.shots} shots", chunks,
+        lambda request_shot: [response for _ in range(args.shots) for response in request_shot()], args
+    )
+    run(
+        "adaptive", chunks,
+        lambda request_shot: run_adaptive_multishot(request_shot, args.shots, SHOT_TOKENS), args
+    )
+
+
+if __name__ == "__main__":
+    main()
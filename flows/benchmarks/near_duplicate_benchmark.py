@@ -0,0 +1,116 @@
+"""
+Benchmarks merging near-duplicate single shot issues before the consolidator call.
+
+Simulates the shots of a chunk flagging the same problems in slightly different words: each shot finds each real
+issue with some probability, and quotes either the whole paragraph or just the sentence as the source sentence,
+sometimes with different case or punctuation, and sometimes flags the words around the issue too. Reports the
+issues left after the exact deduplication of `aggregate.py` and after near-duplicate merging, against the number of
+real issues found, along with the estimated consolidator prompt tokens and the time taken.
+
+Also reports how many merged clusters mix different real issues, and how many of those are false merges: clusters
+whose real issues flag places in the document that do not overlap, so a genuine issue would be dropped before the
+consolidator. The synthetic documents use a small vocabulary, so some real issues flag the same words at the same
+place; merging those is expected.
+
+Usage (from the repository root, with the flow requirements installed):
+
+    python flows/benchmarks/near_duplicate_benchmark.py [--issues 300] [--shots 5]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[2]), str(Path(__file__).parents[1] / "ai_doc_review" / "agent_template")]
+
+from common.models import AllSingleShotIssues, SingleShotIssue  # noqa: E402
+from multishot import get_issue_key  # noqa: E402
+from near_duplicates import find_near_duplicates  # noqa: E402
+from rate_limiter import estimate_tokens  # noqa: E402
+from synthetic import make_analyze_result, make_issues  # noqa: E402
+
+
+def make_shot_issues(di_result, count, shots, recall, rng):
+    """
+    Builds the issues found by each shot, as variations of `count` real issues.
+
+    Returns:
+        The shot issues, and the (start, end) character offsets of each real issue by comment_id.
+    """
+    real_issues = make_issues(di_result, count)
+    shot_issues = []
+    for _ in range(shots):
+        for issue, _ in real_issues:
+            if rng.random() > recall:
+                continue
+            paragraph = di_result.paragraphs[issue.location.para_index].content
+            source_sentence = rng.choice([paragraph, issue.location.source_sentence])
+            if rng.random() < 0.3:
+                source_sentence = source_sentence.rstrip(".").capitalize()
+            text = issue.text
+            if rng.random() < 0.3 and f"{text} " in source_sentence:
+                # Also flag the next word
+                following = source_sentence.split(f"{text} ", 1)[1].split(" ", 1)[0]
+                text = f"{text} {following}"
+            location = issue.location.model_copy(update={"source_sentence": source_sentence})
+            shot_issues.append(SingleShotIssue(**{**dict(issue), "location": location, "text": text}))
+    return shot_issues, {issue.comment_id: span for issue, span in real_issues}
+
+
+def exact_dedup(issues):
+    seen, unique = set(), []
+    for issue in issues:
+        if get_issue_key(issue) not in seen:
+            seen.add(get_issue_key(issue))
+            unique.append(issue)
+    return unique
+
+
+def is_false_merge(cluster, spans):
+    """Whether a cluster holds a real issue whose place does not overlap the place of the issue that is kept."""
+    kept_start, kept_end = spans[cluster[0].comment_id]
+    return any(
+        not (start < kept_end and kept_start < end)
+        for start, end in (spans[issue.comment_id] for issue in cluster[1:])
+    )
+
+
+def prompt_tokens(issues):
+    return int(estimate_tokens(AllSingleShotIssues(issues=issues).model_dump_json()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--issues", type=int, default=300)
+    parser.add_argument("--shots", type=int, default=5)
+    parser.add_argument("--recall", type=float, default=0.8)
+    args = parser.parse_args()
+
+    di_result = make_analyze_result(pages=20)
+    shot_issues, spans = make_shot_issues(di_result, args.issues, args.shots, args.recall, random.Random(0))
+    unique = exact_dedup(shot_issues)
+
+    start = time.perf_counter()
+    clusters = [[unique[i] for i in cluster] for cluster in find_near_duplicates(unique)]
+    elapsed = time.perf_counter() - start
+    merged = [cluster[0] for cluster in clusters]
+
+    mixed = sum(1 for cluster in clusters if len({issue.comment_id for issue in cluster}) > 1)
+    false_merges = sum(1 for cluster in clusters if is_false_merge(cluster, spans))
+
+    print(f"{'real issues':>16}: {len({issue.comment_id for issue in unique}):6d} found")
+    print(f"{'all shots':>16}: {len(shot_issues):6d} issues")
+    print(f"{'exact dedup':>16}: {len(unique):6d} issues, {prompt_tokens(unique):7d} consolidator prompt tokens")
+    print(
+        f"{'near-duplicates':>16}: {len(merged):6d} issues, {prompt_tokens(merged):7d} consolidator prompt tokens, "
+        f"{elapsed * 1000:6.1f} ms"
+    )
+    print(
+        f"{'':>16}  {mixed} clusters mixing real issues, {false_merges} false merges "
+        f"({false_merges / len(merged):.1%} of the issues kept)"
+    )
+
+
+if __name__ == "__main__":
+    main()
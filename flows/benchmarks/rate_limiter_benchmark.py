@@ -0,0 +1,113 @@
+"""
+Benchmarks the Azure OpenAI rate limiter against a simulated deployment that throttles.
+
+The simulated deployment serves up to `--capacity` calls at once and answers any call beyond that with HTTP 429 and
+a `Retry-After` header. The calls are made from `--threads` threads, as the flow does when it fans out the shots of
+several chunks and agents at once. Without the limiter, each call is retried twice after `Retry-After` (the default
+of the OpenAI client) and then fails; with the limiter, calls wait for a slot and the concurrency limit adapts.
+
+Usage (from the repository root):
+
+    python flows/benchmarks/rate_limiter_benchmark.py [--calls 400] [--threads 40] [--capacity 8]
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path[:0] = [str(Path(__file__).parents[1] / "ai_doc_review" / "agent_template")]
+
+from rate_limiter import RateLimiter  # noqa: E402
+
+
+class Response:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after_ms):
+        super().__init__("Rate limit exceeded")
+        self.status_code = 429
+        self.response = Response(429, {"retry-after-ms": str(retry_after_ms)})
+
+
+class SimulatedDeployment:
+    def __init__(self, capacity, latency, retry_after_ms):
+        self.capacity = capacity
+        self.latency = latency
+        self.retry_after_ms = retry_after_ms
+        self.in_flight = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.throttled += 1
+                raise RateLimitError(self.retry_after_ms)
+            self.in_flight += 1
+        try:
+            time.sleep(self.latency)
+            return ["{}"]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def call_with_client_retries(deployment, retries=2):
+    """The previous behaviour: the OpenAI client's own retries after `Retry-After`."""
+    for attempt in range(retries + 1):
+        try:
+            return deployment.call()
+        except RateLimitError as e:
+            if attempt == retries:
+                raise
+            time.sleep(float(e.response.headers["retry-after-ms"]) / 1000)
+
+
+def run(name, call, calls, threads, deployment):
+    failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(call) for _ in range(calls)]
+        for future in futures:
+            try:
+                future.result()
+            except RateLimitError:
+                failed += 1
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>16}: {calls - failed:4d} succeeded, {failed:4d} failed, {deployment.throttled:5d} throttled responses, "
+        f"{elapsed:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--retry-after-ms", type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    def make_deployment():
+        return SimulatedDeployment(args.capacity, args.latency, args.retry_after_ms)
+
+    deployment = make_deployment()
+    run("client retries", lambda: call_with_client_retries(deployment), args.calls, args.threads, deployment)
+
+    deployment = make_deployment()
+    limiter = RateLimiter(max_concurrency=args.threads)
+    run("rate limiter", lambda: limiter.call(deployment.call, tokens=1), args.calls, args.threads, deployment)
+    print(f"{'':>16}  {limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Builds synthetic Document Intelligence results and issues for benchmarking the flow post-processing code.
+"""
+import random
+from typing import Optional
+
+from azure.ai.formrecognizer import (
+    AnalyzeResult,
+    BoundingRegion,
+    DocumentPage,
+    DocumentParagraph,
+    DocumentSpan,
+    DocumentWord,
+    Point,
+)
+
+from common.models import CombinedIssue, IssueType
+
+VOCABULARY = [
+    "the", "patient", "should", "consult", "their", "doctor", "before", "taking", "this", "medicine,",
+    "treatment", "will", "always", "guarantee", "results", "in", "most", "cases", "and", "side-effects",
+    "may", "include", "headache", "nausea", "or", "dizziness", "recieve", "dose", "daily", "(see", "section", "4.2)",
+]
+
+PAGE_WIDTH = 8.5
+PAGE_HEIGHT = 11
+LINE_HEIGHT = 0.2
+WORD_SPACING = 0.05
+CHARACTER_WIDTH = 0.07
+
+
+def make_analyze_result(
+    pages: int = 1000,
+    paragraphs_per_page: int = 8,
+    sentences_per_paragraph: int = 3,
+    seed: int = 0,
+    max_sentences_per_paragraph: Optional[int] = None,
+    headings_every: int = 0,
+) -> AnalyzeResult:
+    """
+    Builds an AnalyzeResult with consistent content, word spans, word polygons and paragraphs.
+
+    Paragraphs have between `sentences_per_paragraph` and `max_sentences_per_paragraph` sentences if the latter is
+    given, and every `headings_every`-th paragraph is a one sentence section heading if it is not 0.
+    """
+    rng = random.Random(seed)
+    content = []
+    offset = 0
+    document_pages = []
+    paragraphs = []
+
+    for page_number in range(1, pages + 1):
+        words = []
+        y = 1.0
+        for _ in range(paragraphs_per_page):
+            paragraph_offset = offset
+            x = 1.0
+            tokens = []
+            is_heading = headings_every and len(paragraphs) % headings_every == 0
+            sentences = sentences_per_paragraph
+            if is_heading:
+                sentences = 1
+            elif max_sentences_per_paragraph:
+                sentences = rng.randint(sentences_per_paragraph, max_sentences_per_paragraph)
+            for _ in range(sentences):
+                sentence = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 14))]
+                sentence[-1] += "."
+                for token in sentence:
+                    width = len(token) * CHARACTER_WIDTH
+                    if x + width > PAGE_WIDTH - 1.0:
+                        x = 1.0
+                        y += LINE_HEIGHT * 1.5
+                    words.append(DocumentWord(
+                        content=token,
+                        polygon=[Point(x=x, y=y), Point(x=x + width, y=y), Point(x=x + width, y=y + LINE_HEIGHT), Point(x=x, y=y + LINE_HEIGHT)],
+                        span=DocumentSpan(offset=offset, length=len(token)),
+                        confidence=1.0,
+                    ))
+                    tokens.append(token)
+                    offset += len(token) + 1
+                    x += width + WORD_SPACING
+
+            paragraph_content = " ".join(tokens)
+            content.append(paragraph_content)
+            paragraphs.append(DocumentParagraph(
+                content=paragraph_content,
+                spans=[DocumentSpan(offset=paragraph_offset, length=len(paragraph_content))],
+                bounding_regions=[BoundingRegion(page_number=page_number, polygon=[])],
+                role="sectionHeading" if is_heading else None,
+            ))
+            y += LINE_HEIGHT * 3
+
+        document_pages.append(DocumentPage(
+            page_number=page_number, width=PAGE_WIDTH, height=PAGE_HEIGHT, unit="inch", angle=0, words=words, lines=[], spans=[]
+        ))
+
+    return AnalyzeResult(content=" ".join(content), pages=document_pages, paragraphs=paragraphs)
+
+
+def make_issues(di_result: AnalyzeResult, count: int, seed: int = 0) -> list[tuple[CombinedIssue, tuple[int, int]]]:
+    """
+    Builds issues pointing at random word sequences in the document.
+
+    Half of the issues quote the whole paragraph as the source sentence and half quote only the sentence
+    containing the issue, like the agents do.
+
+    Returns:
+        List of (issue, expected (start, end) character offsets of the issue text in the document content).
+    """
+    rng = random.Random(seed)
+    issues = []
+    for i in range(count):
+        para_index = rng.randrange(len(di_result.paragraphs))
+        paragraph = di_result.paragraphs[para_index]
+        sentences = [sentence + "." for sentence in paragraph.content.split(". ") if sentence]
+        sentences[-1] = sentences[-1][:-1]
+
+        sentence_index = rng.randrange(len(sentences))
+        sentence_words = sentences[sentence_index].split()
+        first_word = rng.randrange(len(sentence_words))
+        text = " ".join(sentence_words[first_word:first_word + rng.randint(1, 3)])
+
+        sentence_start = paragraph.spans[0].offset + sum(len(sentence) + 1 for sentence in sentences[:sentence_index])
+        text_start = sentence_start + len(" ".join(sentence_words[:first_word])) + (1 if first_word else 0)
+        source_sentence = paragraph.content if i % 2 == 0 else sentences[sentence_index]
+
+        issue = CombinedIssue(
+            type=IssueType.GrammarSpelling,
+            location={"source_sentence": source_sentence, "page_num": 0, "bounding_box": [], "para_index": para_index},
+            text=text,
+            explanation="",
+            suggested_fix="",
+            comment_id=str(i),
+            score=5,
+            suggested_action="KEEP",
+            reason_for_suggested_action="",
+        )
+        issues.append((issue, (text_start, text_start + len(text))))
+    return issues
@@ -332,6 +332,7 @@ resource "azurerm_linux_web_app" "flow" {
     "DOCUMENT_INTELLIGENCE_ENDPOINT"           = "https://ais${var.name}${var.environment}.cognitiveservices.azure.com"
     "STORAGE_URL_PREFIX"                       = "${azurerm_storage_account.main.primary_blob_endpoint}/${azurerm_storage_container.documents.name}"
     "AZURE_OPENAI_ENDPOINT"                    = "https://ais${var.name}${var.environment}.openai.azure.com"
+    "DOCUMENT_CACHE_DIR"                       = "/home/data/document_cache"
     "AZURE_CLIENT_ID"                          = azurerm_user_assigned_identity.ai_compute.client_id
     "MICROSOFT_PROVIDER_AUTHENTICATION_SECRET" = azuread_application_password.flow_app.value
     "USER_AGENT"                               = "promptflow-appservice"
@@ -489,3 +490,27 @@ resource "azurerm_cosmosdb_sql_container" "issues" {
 
   partition_key_paths = ["/doc_id"]
 }
+
+# Leases held by an API worker while it reviews a document, so a document is only reviewed once at a time.
+# Leases expire (per item TTL) if the worker stops without releasing them.
+resource "azurerm_cosmosdb_sql_container" "leases" {
+  name                = "leases"
+  resource_group_name = azurerm_cosmosdb_sql_database.state.resource_group_name
+
+  account_name  = azurerm_cosmosdb_account.main.name
+  database_name = azurerm_cosmosdb_sql_database.state.name
+
+  partition_key_paths = ["/id"]
+  default_ttl         = -1
+}
+
+# Progress of the review of each document, so a client can resume a review stream after reconnecting.
+resource "azurerm_cosmosdb_sql_container" "reviews" {
+  name                = "reviews"
+  resource_group_name = azurerm_cosmosdb_sql_database.state.resource_group_name
+
+  account_name  = azurerm_cosmosdb_account.main.name
+  database_name = azurerm_cosmosdb_sql_database.state.name
+
+  partition_key_paths = ["/id"]
+}
@@ -0,0 +1,217 @@
+import pytest
+import asyncio
+import logging
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError
+from unittest.mock import AsyncMock, MagicMock, patch
+from database.db_client import CosmosDBClient
+
+
+@pytest.fixture(scope="function")
+def mock_container():
+    with patch('database.db_client.CosmosDBConfig') as mock_config:
+        container = MagicMock()
+        mock_config.return_value.get_client.return_value.get_database_client.return_value \
+            .get_container_client.return_value = container
+        yield container
+
+
+@pytest.mark.asyncio
+async def test_store_items_batches_per_partition(mock_container):
+    """ Checks items are upserted in transactional batches of up to 100 per partition key """
+
+    mock_container.execute_item_batch = AsyncMock()
+    items = [{"id": str(i), "doc_id": "a.pdf"} for i in range(250)] + [{"id": "x", "doc_id": "b.pdf"}]
+
+    await CosmosDBClient("issues").store_items(items, partition_key_field="doc_id")
+
+    batches = [
+        (call.kwargs["partition_key"], [operation[1][0]["id"] for operation in call.kwargs["batch_operations"]])
+        for call in mock_container.execute_item_batch.call_args_list
+    ]
+    assert [(partition_key, len(ids)) for partition_key, ids in batches] == [
+        ("a.pdf", 100), ("a.pdf", 100), ("a.pdf", 50), ("b.pdf", 1)
+    ]
+    assert sorted(id for _, ids in batches for id in ids) == sorted(item["id"] for item in items)
+    assert all(operation[0] == "upsert" for call in mock_container.execute_item_batch.call_args_list
+               for operation in call.kwargs["batch_operations"])
+
+
+@pytest.mark.asyncio
+async def test_store_items_bounds_concurrent_batches(mock_container):
+    """ Checks no more than the configured number of batches are in flight at once """
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def execute_item_batch(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    mock_container.execute_item_batch = execute_item_batch
+    items = [{"id": "1", "doc_id": f"{i}.pdf"} for i in range(20)]
+
+    with patch('database.db_client.settings.cosmos_max_concurrent_batches', 3):
+        await CosmosDBClient("issues").store_items(items, partition_key_field="doc_id")
+
+    assert max_in_flight == 3
+
+
+class QueryPagesMock:
+    """
+    Mimics the async query iterator, calling the response hook with a request charge for each page.
+
+    Like the aio container, the hook is also called once when the query is created, with the headers of the
+    previous request on the client.
+    """
+
+    def __init__(self, pages: list, response_hook, request_charge: float, previous_request_charge: float = 100.0):
+        self._pages = pages
+        self._response_hook = response_hook
+        self._request_charge = request_charge
+        self.continuation_token = None
+        self._response_hook({"x-ms-request-charge": str(previous_request_charge)}, self)
+
+    def by_page(self, continuation_token=None):
+        self._index = int(continuation_token or 0)
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._index >= len(self._pages):
+            raise StopAsyncIteration
+        page = self._pages[self._index]
+        self._index += 1
+        self.continuation_token = str(self._index) if self._index < len(self._pages) else None
+        self._response_hook({"x-ms-request-charge": str(self._request_charge)}, page)
+
+        async def items():
+            for item in page:
+                yield item
+        return items()
+
+
+@pytest.mark.asyncio
+async def test_query_partition_targets_partition_with_projection(mock_container):
+    """
+    Checks the query is scoped to the partition key, projects fields and sums the request charge of all pages,
+    without the charge of the previous request on the client
+    """
+
+    mock_container.query_items.side_effect = lambda **kwargs: QueryPagesMock(
+        [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]], kwargs["response_hook"], 2.5
+    )
+
+    page = await CosmosDBClient("issues").query_partition("a.pdf", filters={"status": "accepted"}, fields=["id"])
+
+    assert page.items == [{"id": "1"}, {"id": "2"}, {"id": "3"}]
+    assert page.continuation_token is None
+    assert page.request_charge == 5.0
+    query_kwargs = mock_container.query_items.call_args.kwargs
+    assert query_kwargs["query"] == "SELECT c.id FROM c WHERE c.status=@status"
+    assert query_kwargs["partition_key"] == "a.pdf"
+    assert "enable_cross_partition_query" not in query_kwargs
+
+
+@pytest.mark.asyncio
+async def test_query_partition_pages_with_continuation_token(mock_container):
+    """ Checks a page size returns one page at a time, with a continuation token for the next page """
+
+    mock_container.query_items.side_effect = lambda **kwargs: QueryPagesMock(
+        [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]], kwargs["response_hook"], 1.0
+    )
+    db_client = CosmosDBClient("issues")
+
+    first_page = await db_client.query_partition("a.pdf", page_size=2)
+    second_page = await db_client.query_partition("a.pdf", page_size=2, continuation_token=first_page.continuation_token)
+
+    assert first_page.items == [{"id": "1"}, {"id": "2"}]
+    assert first_page.continuation_token is not None
+    assert first_page.request_charge == 1.0
+    assert second_page.items == [{"id": "3"}]
+    assert second_page.continuation_token is None
+    assert mock_container.query_items.call_args.kwargs["max_item_count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_query_partition_filters_after_value_in_order(mock_container):
+    """ Checks a lower bound and sort order are added to the query """
+
+    mock_container.query_items.side_effect = lambda **kwargs: QueryPagesMock([[]], kwargs["response_hook"], 1.0)
+
+    await CosmosDBClient("issues").query_partition("a.pdf", greater_than={"review_seq": 3}, order_by="review_seq")
+
+    query_kwargs = mock_container.query_items.call_args.kwargs
+    assert query_kwargs["query"] == "SELECT * FROM c WHERE c.review_seq>@min_review_seq ORDER BY c.review_seq"
+    assert query_kwargs["parameters"] == [{"name": "@min_review_seq", "value": 3}]
+
+
+@pytest.mark.asyncio
+async def test_patch_items_batches_patch_operations(mock_container):
+    """ Checks the same fields are patched on every item, in transactional batches of up to 100 """
+
+    mock_container.execute_item_batch = AsyncMock(
+        side_effect=lambda batch_operations, partition_key: [
+            {"resourceBody": {"id": operation[1][0]}} for operation in batch_operations
+        ]
+    )
+    item_ids = [str(i) for i in range(150)]
+
+    result = await CosmosDBClient("issues").patch_items("a.pdf", item_ids, {"status": "dismissed"})
+
+    assert [item["id"] for item in result.items] == item_ids
+    assert result.failed_ids == []
+    calls = mock_container.execute_item_batch.call_args_list
+    assert [len(call.kwargs["batch_operations"]) for call in calls] == [100, 50]
+    assert all(call.kwargs["partition_key"] == "a.pdf" for call in calls)
+    assert calls[0].kwargs["batch_operations"][0] == (
+        "patch", ("0", [{"op": "set", "path": "/status", "value": "dismissed"}])
+    )
+
+
+@pytest.mark.asyncio
+async def test_patch_items_reports_failed_batches(mock_container):
+    """ Checks the items of batches that succeed are returned, with the IDs of the items in batches that failed """
+
+    async def execute_item_batch(batch_operations, partition_key):
+        if batch_operations[0][1][0] == "100":
+            raise CosmosBatchOperationError(
+                error_index=0, headers={}, status_code=404, message="Not found", operation_responses=[]
+            )
+        return [{"resourceBody": {"id": operation[1][0]}} for operation in batch_operations]
+
+    mock_container.execute_item_batch = execute_item_batch
+    item_ids = [str(i) for i in range(250)]
+
+    result = await CosmosDBClient("issues").patch_items("a.pdf", item_ids, {"status": "dismissed"})
+
+    assert [item["id"] for item in result.items] == item_ids[:100] + item_ids[200:]
+    assert result.failed_ids == item_ids[100:200]
+
+
+@pytest.mark.asyncio
+async def test_patch_items_raises_when_every_batch_fails(mock_container):
+    """ Checks the error is raised when no item could be updated """
+
+    mock_container.execute_item_batch = AsyncMock(side_effect=CosmosBatchOperationError(
+        error_index=0, headers={}, status_code=404, message="Not found", operation_responses=[]
+    ))
+
+    with pytest.raises(CosmosBatchOperationError):
+        await CosmosDBClient("issues").patch_items("a.pdf", ["1", "2"], {"status": "dismissed"})
+
+
+@pytest.mark.asyncio
+async def test_patch_item_modified_is_not_logged_as_error(mock_container, caplog):
+    """ Checks an ETag mismatch, which callers expect and handle, is raised without logging an error """
+
+    mock_container.patch_item = AsyncMock(side_effect=CosmosHttpResponseError(status_code=412, message="Modified"))
+
+    with pytest.raises(CosmosHttpResponseError):
+        await CosmosDBClient("issues").patch_item("1", "a.pdf", {"status": "accepted"}, etag="etag1")
+
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
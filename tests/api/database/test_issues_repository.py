@@ -0,0 +1,45 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from database.issues_repository import IssueModifiedError, IssuesRepository
+
+
+def stored_issue(**fields) -> dict:
+    return {
+        "id": "issue1",
+        "doc_id": "abc.pdf",
+        "text": "text",
+        "type": "Grammar & Spelling",
+        "status": "not_reviewed",
+        "suggested_fix": "fix",
+        "explanation": "explanation",
+        "review_initiated_by": "user",
+        "review_initiated_at_UTC": "2024-01-01T00:00:00",
+        "_etag": "etag2",
+        **fields
+    }
+
+
+@pytest.mark.asyncio
+async def test_update_issue_patches_with_etag():
+    """ Checks an update is a single patch, conditional on the ETag, and returns the new ETag """
+
+    db_client = MagicMock()
+    db_client.patch_item = AsyncMock(return_value=stored_issue(status="accepted"))
+
+    issue = await IssuesRepository(db_client).update_issue("abc.pdf", "issue1", {"status": "accepted"}, "etag1")
+
+    db_client.patch_item.assert_called_once_with("issue1", "abc.pdf", {"status": "accepted"}, "etag1")
+    assert issue.status == "accepted"
+    assert issue.etag == "etag2"
+
+
+@pytest.mark.asyncio
+async def test_update_issue_precondition_failed():
+    """ Checks a stale ETag is reported as an IssueModifiedError """
+
+    db_client = MagicMock()
+    db_client.patch_item = AsyncMock(side_effect=CosmosHttpResponseError(status_code=412, message="Precondition failed"))
+
+    with pytest.raises(IssueModifiedError):
+        await IssuesRepository(db_client).update_issue("abc.pdf", "issue1", {"status": "accepted"}, "etag1")
@@ -0,0 +1,121 @@
+import pytest
+import time
+from common.models import ReviewJob
+from database.job_queue import InMemoryJobQueue, QueueFullError, ReviewJobQueue, SQLiteJobQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    def make_queue(**kwargs):
+        if request.param == "memory":
+            return InMemoryJobQueue(**kwargs)
+        return SQLiteJobQueue(str(tmp_path / "jobs.sqlite"), **kwargs)
+    return make_queue
+
+
+def make_job(doc_id: str) -> ReviewJob:
+    return ReviewJob(doc_id=doc_id, user_oid="1234", time_stamp="2021-09-01")
+
+
+@pytest.mark.asyncio
+async def test_enqueue_allows_one_active_job_per_document(make_queue):
+    """ Checks a document with a queued or running job is not queued again, until its job finishes """
+
+    queue = make_queue()
+
+    assert await queue.enqueue(make_job("a.pdf"))
+    assert not await queue.enqueue(make_job("a.pdf"))
+    job = await queue.claim()
+    assert (job.doc_id, job.status, job.attempts) == ("a.pdf", "running", 1)
+    assert not await queue.enqueue(make_job("a.pdf"))
+
+    assert await queue.complete(job)
+    assert (await queue.get("a.pdf")).status == "complete"
+    assert await queue.enqueue(make_job("a.pdf"))
+
+
+@pytest.mark.asyncio
+async def test_claim_waits_for_retry_delay_and_reclaims_stalled_jobs(make_queue):
+    """
+    Checks a retried job is claimed after its delay, a running job without heartbeats is claimed again, and a job
+    that stalls on its last attempt is failed
+    """
+
+    queue = make_queue(visibility_timeout_seconds=0.1, max_attempts=3)
+    await queue.enqueue(make_job("a.pdf"))
+    job = await queue.claim()
+
+    await queue.retry(job, 0.1, "error")
+    assert await queue.claim() is None
+
+    time.sleep(0.2)
+    job = await queue.claim()
+    assert job.attempts == 2
+    assert await queue.claim() is None
+
+    time.sleep(0.2)
+    job = await queue.claim()
+    assert job.attempts == 3
+
+    time.sleep(0.2)
+    assert await queue.claim() is None
+    job = await queue.get("a.pdf")
+    assert (job.status, job.attempts) == ("failed", 3)
+
+
+@pytest.mark.asyncio
+async def test_stalled_worker_cannot_update_reclaimed_job(make_queue):
+    """ Checks a worker that lost its claim to another worker can no longer update the job """
+
+    queue = make_queue(visibility_timeout_seconds=0.1)
+    await queue.enqueue(make_job("a.pdf"))
+    stalled_job = await queue.claim()
+
+    time.sleep(0.2)
+    job = await queue.claim()
+    assert job.claim_id != stalled_job.claim_id
+
+    assert not await queue.heartbeat(stalled_job)
+    assert not await queue.complete(stalled_job)
+    assert not await queue.fail(stalled_job, "error")
+    assert (await queue.get("a.pdf")).status == "running"
+
+    assert await queue.heartbeat(job)
+    assert await queue.complete(job)
+    assert not await queue.retry(job, 0, "error")
+    assert (await queue.get("a.pdf")).status == "complete"
+
+
+@pytest.mark.asyncio
+async def test_enqueue_rejects_jobs_when_full(make_queue):
+    """ Checks the queue applies backpressure once the maximum number of jobs are waiting """
+
+    queue = make_queue(max_queued=2)
+    await queue.enqueue(make_job("a.pdf"))
+    await queue.enqueue(make_job("b.pdf"))
+
+    with pytest.raises(QueueFullError):
+        await queue.enqueue(make_job("c.pdf"))
+    assert await queue.stats() == {"queued": 2, "running": 0, "complete": 0, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_queue_keeps_jobs_across_restarts(tmp_path):
+    """ Checks jobs queued before a restart can be claimed by a new queue on the same database """
+
+    path = str(tmp_path / "jobs.sqlite")
+    await SQLiteJobQueue(path).enqueue(make_job("a.pdf"))
+
+    job = await SQLiteJobQueue(path).claim()
+    assert job.doc_id == "a.pdf"
+
+
+def test_backend_missing_a_method_fails_when_created():
+    """ Checks a backend that does not implement the storage fails when it is created, not when it is first used """
+
+    class IncompleteJobQueue(ReviewJobQueue):
+        async def enqueue(self, job: ReviewJob) -> bool:
+            return True
+
+    with pytest.raises(TypeError):
+        IncompleteJobQueue()
@@ -0,0 +1,58 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from database.leases_repository import LeasesRepository
+
+
+def make_db_client(lease: dict = None) -> MagicMock:
+    db_client = MagicMock()
+    db_client.retrieve_item_by_id = AsyncMock(return_value=lease)
+    db_client.replace_item = AsyncMock()
+    db_client.delete_item = AsyncMock()
+    return db_client
+
+
+@pytest.mark.asyncio
+async def test_renew_replaces_own_lease_if_unchanged():
+    """ Checks a lease is renewed with a replace conditional on the ETag of the lease that was read """
+
+    db_client = make_db_client({"id": "review:a.pdf", "owner": "worker1", "_etag": "etag1"})
+
+    assert await LeasesRepository(db_client).renew("review:a.pdf", "worker1")
+
+    item, etag = db_client.replace_item.call_args.args
+    assert (item["id"], item["owner"], etag) == ("review:a.pdf", "worker1", "etag1")
+
+
+@pytest.mark.asyncio
+async def test_renew_and_release_leave_lease_of_another_owner():
+    """ Checks a holder whose lease expired and was acquired by another worker neither renews nor releases it """
+
+    db_client = make_db_client({"id": "review:a.pdf", "owner": "worker2", "_etag": "etag2"})
+    leases_repository = LeasesRepository(db_client)
+
+    assert not await leases_repository.renew("review:a.pdf", "worker1")
+    assert not await leases_repository.release("review:a.pdf", "worker1")
+    db_client.replace_item.assert_not_called()
+    db_client.delete_item.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_renew_lease_changed_since_read():
+    """ Checks a lease acquired by another worker between reading and replacing it is reported as lost """
+
+    db_client = make_db_client({"id": "review:a.pdf", "owner": "worker1", "_etag": "etag1"})
+    db_client.replace_item.side_effect = CosmosHttpResponseError(status_code=412, message="Precondition failed")
+
+    assert not await LeasesRepository(db_client).renew("review:a.pdf", "worker1")
+
+
+@pytest.mark.asyncio
+async def test_release_deletes_own_lease_if_unchanged():
+    """ Checks a lease is released with a delete conditional on the ETag of the lease that was read """
+
+    db_client = make_db_client({"id": "review:a.pdf", "owner": "worker1", "_etag": "etag1"})
+
+    assert await LeasesRepository(db_client).release("review:a.pdf", "worker1")
+
+    db_client.delete_item.assert_called_once_with("review:a.pdf", "review:a.pdf", "etag1")
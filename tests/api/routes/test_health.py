@@ -1,4 +1,26 @@
+import pytest
+from security.auth import validate_authenticated
 
 def test_health_check(test_api_client):
     response = test_api_client.get("/api/health")
     assert response.status_code == 204
+
+
+def test_pool_stats(test_api_client, dummy_user):
+    test_api_client.app.dependency_overrides[validate_authenticated] = lambda: dummy_user
+    response = test_api_client.get("/api/health/pools")
+    test_api_client.app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert set(response.json()) == {"flow", "cosmos"}
+
+
+@pytest.mark.parametrize("path", ["/api/health/pools", "/api/health/queue"])
+def test_usage_stats_require_authentication(test_api_client, path):
+    response = test_api_client.get(path)
+    assert response.status_code == 401
+
+
+def test_services_are_shared_between_requests(test_api_client):
+    services = test_api_client.app.state.services
+    assert services.aml_client is services.aml_client
+    assert services.aml_client.http_client is services.http_client
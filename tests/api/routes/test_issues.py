@@ -0,0 +1,137 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from common.models import BatchIssueActionResult, Issue
+from database.issues_repository import IssueModifiedError
+from dependencies import get_issues_service
+from security.auth import validate_authenticated
+
+
+def stored_issue(**fields) -> Issue:
+    return Issue(**{
+        "id": "issue1",
+        "doc_id": "abc.pdf",
+        "text": "text",
+        "type": "Grammar & Spelling",
+        "status": "accepted",
+        "suggested_fix": "fix",
+        "explanation": "explanation",
+        "review_initiated_by": "user",
+        "review_initiated_at_UTC": "2024-01-01T00:00:00",
+        "_etag": "etag2",
+        **fields
+    })
+
+
+@pytest.fixture(scope="function")
+def issues_service(test_api_client, dummy_user):
+    service = AsyncMock()
+    test_api_client.app.dependency_overrides[get_issues_service] = lambda: service
+    test_api_client.app.dependency_overrides[validate_authenticated] = lambda: dummy_user
+    yield service
+    test_api_client.app.dependency_overrides.clear()
+
+
+def test_accept_issue_returns_etag(test_api_client, issues_service):
+    """ Checks the ETag of the updated issue is sent as `etag`, so it can be sent back as If-Match """
+
+    issues_service.accept_issue.return_value = stored_issue()
+
+    response = test_api_client.patch("/api/v1/review/abc.pdf/issues/issue1/accept", headers={"If-Match": "etag1"})
+
+    assert response.status_code == 200
+    assert response.json()["etag"] == "etag2"
+    assert "_etag" not in response.json()
+    assert issues_service.accept_issue.call_args.args[-1] == "etag1"
+
+
+def test_dismiss_issue_etag_round_trips(test_api_client, issues_service):
+    """ Checks the ETag from one update is the If-Match of the next """
+
+    issues_service.dismiss_issue.return_value = stored_issue(status="dismissed")
+    first = test_api_client.patch("/api/v1/review/abc.pdf/issues/issue1/dismiss")
+
+    issues_service.dismiss_issue.return_value = stored_issue(status="dismissed", _etag="etag3")
+    second = test_api_client.patch(
+        "/api/v1/review/abc.pdf/issues/issue1/dismiss", headers={"If-Match": first.json()["etag"]}
+    )
+
+    assert issues_service.dismiss_issue.call_args.args[-1] == "etag2"
+    assert second.json()["etag"] == "etag3"
+
+
+def test_accept_issue_modified_since_read(test_api_client, issues_service):
+    """ Checks an issue changed since its ETag was read is rejected with 412 """
+
+    issues_service.accept_issue.side_effect = IssueModifiedError("Issue issue1 has been modified since it was retrieved.")
+
+    response = test_api_client.patch("/api/v1/review/abc.pdf/issues/issue1/accept", headers={"If-Match": "etag1"})
+
+    assert response.status_code == 412
+
+
+def test_update_issues_reports_failed_issue_ids(test_api_client, issues_service):
+    """ Checks the batch route returns the updated issues and the IDs of the issues that could not be updated """
+
+    issues_service.update_issues.return_value = BatchIssueActionResult(
+        issues=[stored_issue(status="dismissed")], failed_issue_ids=["issue2"]
+    )
+
+    response = test_api_client.patch(
+        "/api/v1/review/abc.pdf/issues:batch", json={"action": "dismiss", "issue_ids": ["issue1", "issue2"]}
+    )
+
+    assert response.status_code == 200
+    assert [issue["id"] for issue in response.json()["issues"]] == ["issue1"]
+    assert response.json()["failed_issue_ids"] == ["issue2"]
+    doc_id, issue_ids, action = issues_service.update_issues.call_args.args[:3]
+    assert (doc_id, issue_ids, action) == ("abc.pdf", ["issue1", "issue2"], "dismiss")
+
+
+def test_update_issues_not_found(test_api_client, issues_service):
+    """ Checks a batch where no issue could be found is rejected with 400 """
+
+    issues_service.update_issues.side_effect = ValueError("One or more issues not found on document abc.pdf.")
+
+    response = test_api_client.patch(
+        "/api/v1/review/abc.pdf/issues:batch", json={"action": "accept", "issue_ids": ["issue1"]}
+    )
+
+    assert response.status_code == 400
+
+
+def test_get_issues_resumes_review_after_sequence_event_id(test_api_client, issues_service):
+    """ Checks a review event id resumes the review after that event """
+
+    async def resumed_review(*args):
+        yield [stored_issue(review_seq=4)]
+
+    issues_service.resume_review = MagicMock(side_effect=resumed_review)
+
+    response = test_api_client.get("/api/v1/review/abc.pdf/issues", headers={"Last-Event-ID": "seq:3"})
+
+    assert issues_service.resume_review.call_args.args[-1] == 3
+    assert "id: seq:4\n" in response.text
+
+
+def test_get_issues_resumes_stored_pages_after_numeric_continuation(test_api_client, issues_service):
+    """ Checks a stored issues event id is read as a continuation token, even when the token is all digits """
+
+    async def stored_pages(*args):
+        yield [stored_issue(id="issue2")], "456"
+        yield [stored_issue(id="issue3")], None
+
+    issues_service.get_issues_pages = MagicMock(side_effect=stored_pages)
+
+    response = test_api_client.get("/api/v1/review/abc.pdf/issues", headers={"Last-Event-ID": "page:123"})
+
+    assert issues_service.get_issues_pages.call_args.args[-1] == "123"
+    issues_service.resume_review.assert_not_called()
+    assert "id: page:456\n" in response.text
+
+
+def test_get_issues_unknown_event_id(test_api_client, issues_service):
+    """ Checks an event id that was never sent is rejected with 400 """
+
+    response = test_api_client.get("/api/v1/review/abc.pdf/issues", headers={"Last-Event-ID": "123"})
+
+    assert response.status_code == 400
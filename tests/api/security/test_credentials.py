@@ -0,0 +1,65 @@
+import pytest
+import time
+from unittest.mock import MagicMock
+from azure.core.credentials import AccessToken
+from security.credentials import AsyncCachedTokenCredential, CachedTokenCredential
+
+
+def credential_returning(*lifetimes: int) -> MagicMock:
+    credential = MagicMock()
+    credential.get_token.side_effect = [
+        AccessToken(f"token{i}", int(time.time()) + lifetime) for i, lifetime in enumerate(lifetimes)
+    ]
+    return credential
+
+
+def test_get_token_is_cached_per_scope():
+    """ Checks the wrapped credential is only called once per scope while the token is fresh """
+
+    credential = credential_returning(3600, 3600)
+    cached_credential = CachedTokenCredential(credential, refresh_margin_seconds=300)
+
+    assert cached_credential.get_token("scope-a").token == "token0"
+    assert cached_credential.get_token("scope-a").token == "token0"
+    assert cached_credential.get_token("scope-b").token == "token1"
+    assert credential.get_token.call_count == 2
+
+
+def test_get_token_refreshes_in_background_before_expiry():
+    """ Checks a token due for refresh is still returned, while its replacement is fetched in the background """
+
+    credential = credential_returning(120, 3600)
+    cached_credential = CachedTokenCredential(credential, refresh_margin_seconds=300)
+
+    assert cached_credential.get_token("scope").token == "token0"
+    assert cached_credential.get_token("scope").token == "token0"
+
+    # Wait for the refreshed token to be cached (the mock counts the call before the token is stored)
+    for _ in range(100):
+        if [token.token for token in cached_credential._tokens.values()] == ["token1"]:
+            break
+        time.sleep(0.01)
+    assert cached_credential.get_token("scope").token == "token1"
+    assert credential.get_token.call_count == 2
+
+
+def test_get_token_fetches_expired_token():
+    """ Checks a token about to expire is not returned """
+
+    credential = credential_returning(10, 3600)
+    cached_credential = CachedTokenCredential(credential, refresh_margin_seconds=300)
+
+    assert cached_credential.get_token("scope").token == "token0"
+    assert cached_credential.get_token("scope").token == "token1"
+
+
+@pytest.mark.asyncio
+async def test_async_get_token_uses_cache():
+    """ Checks the async adapter shares the cache of the wrapped credential """
+
+    credential = credential_returning(3600)
+    async_credential = AsyncCachedTokenCredential(CachedTokenCredential(credential))
+
+    assert (await async_credential.get_token("scope")).token == "token0"
+    assert (await async_credential.get_token("scope")).token == "token0"
+    assert credential.get_token.call_count == 1
@@ -0,0 +1,47 @@
+import pytest
+import httpx
+import json
+from unittest.mock import AsyncMock, MagicMock
+from fastapi import HTTPException
+from services.aml_client import AMLClient
+
+
+def aml_client_for(handler) -> AMLClient:
+    credential = MagicMock()
+    credential.get_token = AsyncMock(return_value=MagicMock(token="token"))
+    return AMLClient(credential, httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+@pytest.mark.asyncio
+async def test_call_aml_endpoint_streams_events():
+    """ Checks each streamed flow output is yielded, and non-streaming outputs and comments are skipped """
+
+    body = (
+        ": keep-alive\n\n"
+        f"data: {json.dumps({'flow_output_streaming': 'chunk1'})}\n\n"
+        f"data: {json.dumps({'flow_output': 'ignored'})}\n\n"
+        f"data: {json.dumps({'flow_output_streaming': 'chunk2'})}\n\n"
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["Authorization"] == "Bearer token"
+        assert json.loads(request.content)["pdf_name"] == "abc.pdf"
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=body.encode())
+
+    chunks = [chunk async for chunk in aml_client_for(handler).call_aml_endpoint("endpoint", "abc.pdf")]
+
+    assert chunks == ["chunk1", "chunk2"]
+
+
+@pytest.mark.asyncio
+async def test_call_aml_endpoint_raises_http_error():
+    """ Checks an error response from the flow is raised as an HTTPException with the same status code """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, text="Too many requests")
+
+    with pytest.raises(HTTPException) as exc_info:
+        [chunk async for chunk in aml_client_for(handler).call_aml_endpoint("endpoint", "abc.pdf")]
+
+    assert exc_info.value.status_code == 429
+    assert "Too many requests" in exc_info.value.detail
@@ -1,7 +1,8 @@
 import pytest
 import asyncio
-from common.models import IssueType
+from common.models import DismissalFeedbackModel, Issue, IssueActionEnum, IssueType, ReviewJob, ReviewProgress
 import json
+from unittest.mock import AsyncMock, patch
 from services.issues_service import IssuesService
 
 
@@ -40,6 +41,19 @@ async def test_get_issues_exception(mock_issues_repo, mock_aml_client):
         await issues_service.get_issues_data("abc.pdf")
         mock_issues_repo.get_issues.assert_called_once_with("abc.pdf")
 
+@pytest.mark.asyncio
+async def test_get_issues_pages_follows_continuation_tokens(mock_issues_repo, mock_aml_client):
+    """ Checks pages of issues are retrieved until there is no continuation token """
+
+    mock_issues_repo.get_issues_page.side_effect = [([], "token1"), ([], "token2"), ([], None)]
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client)
+    pages = [page async for page in issues_service.get_issues_pages("abc.pdf", 50, "token0")]
+
+    assert pages == [([], "token1"), ([], "token2"), ([], None)]
+    assert [call.args for call in mock_issues_repo.get_issues_page.call_args_list] == [
+        ("abc.pdf", 50, "token0"), ("abc.pdf", 50, "token1"), ("abc.pdf", 50, "token2")
+    ]
+
 @pytest.mark.asyncio
 async def test_initiate_review_valid_chunks(mock_issues_repo, mock_aml_client, dummy_user):
     """ Checks the initiate review method """
@@ -127,3 +141,269 @@ async def test_initiate_review_throws_exception_for_bad_chunk(mock_issues_repo,
 
     mock_aml_client.call_aml_endpoint.assert_called_once_with("", "abc.pdf")
     mock_issues_repo.add_issue.assert_not_called() # no database called in error scenario
+
+@pytest.mark.asyncio
+async def test_initiate_review_carries_over_issues_from_previous_version(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks that issues in unchanged paragraphs are copied from the previous version of the document """
+
+    previous_issue = Issue(
+        id="previous-issue",
+        doc_id="abc_v1.pdf",
+        text="issue1",
+        type=IssueType.GrammarSpelling,
+        status="accepted",
+        suggested_fix="fix1",
+        explanation="explanation1",
+        location={
+            "source_sentence": "sentence1",
+            "page_num": 1,
+            "bounding_box": [1.0, 2.0, 3.0, 4.0],
+            "para_index": 1
+        },
+        review_initiated_by="5678",
+        review_initiated_at_UTC="2021-08-01",
+        resolved_by="5678",
+    )
+    mock_issues_repo.get_issues.return_value = [previous_issue]
+    mock_aml_client.call_aml_endpoint.return_value = AMLStreamMock(
+        [
+            {
+                "issues": [],
+                "carried_over": [
+                    {
+                        "id": "previous-issue",
+                        "location": {
+                            "source_sentence": "sentence1",
+                            "page_num": 2,
+                            "bounding_box": [5.0, 6.0, 7.0, 8.0],
+                            "para_index": 4
+                        }
+                    }
+                ]
+            }
+        ]
+    )
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client)
+    issues = []
+    async for chunk in issues_service.initiate_review("abc_v2.pdf", dummy_user, "2021-09-01", "abc_v1.pdf"):
+        issues.extend(chunk)
+
+    assert len(issues) == 1
+    assert issues[0].id != previous_issue.id
+    assert issues[0].doc_id == "abc_v2.pdf"
+    assert issues[0].status == "accepted"
+    assert issues[0].location.para_index == 4
+    assert issues[0].location.page_num == 2
+
+    mock_issues_repo.get_issues.assert_called_once_with("abc_v1.pdf")
+    mock_aml_client.call_aml_endpoint.assert_called_once_with(
+        "",
+        "abc_v2.pdf",
+        previous_pdf_name="abc_v1.pdf",
+        previous_issues=[previous_issue.model_dump(include={"id", "text", "location"})]
+    )
+
+
+def make_issue(issue_id: str, review_seq: int) -> Issue:
+    return Issue(
+        id=issue_id,
+        doc_id="abc.pdf",
+        text="issue",
+        type=IssueType.GrammarSpelling,
+        status="not_reviewed",
+        suggested_fix="fix",
+        explanation="explanation",
+        review_initiated_by="1234",
+        review_initiated_at_UTC="2021-09-01",
+        review_seq=review_seq,
+    )
+
+
+@pytest.mark.asyncio
+async def test_initiate_review_numbers_chunks_and_records_progress(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks each chunk gets the next sequence number, and progress is stored after each chunk is stored """
+
+    issue = {
+        "type": "Grammar & Spelling",
+        "location": {"source_sentence": "sentence1", "page_num": 1, "bounding_box": [], "para_index": 1},
+        "text": "issue1",
+        "explanation": "explanation1",
+        "suggested_fix": "fix1",
+    }
+    mock_aml_client.call_aml_endpoint.return_value = AMLStreamMock([
+        {"issues": [issue], "chunks_done": 1, "chunks_total": 2},
+        {"issues": [issue, issue], "chunks_done": 2, "chunks_total": 2},
+    ])
+    stored_progress = []
+    reviews_repository = AsyncMock()
+    reviews_repository.store_progress.side_effect = lambda progress: stored_progress.append(progress.model_copy())
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, reviews_repository=reviews_repository)
+    chunks = [chunk async for chunk in issues_service.initiate_review("abc.pdf", dummy_user, "2021-09-01")]
+
+    assert [[issue.review_seq for issue in chunk] for chunk in chunks] == [[1], [2, 2]]
+    assert [(p.status, p.chunks_done, p.chunks_total, p.last_event_id) for p in stored_progress] == [
+        ("in_progress", 0, None, 0),
+        ("in_progress", 1, 2, 1),
+        ("in_progress", 2, 2, 2),
+        ("complete", 2, 2, 2),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_initiate_review_records_failed_progress(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks a review that fails is recorded as failed """
+
+    mock_aml_client.call_aml_endpoint.return_value = AMLStreamMock([{"bad": "chunk"}])
+    reviews_repository = AsyncMock()
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, reviews_repository=reviews_repository)
+    with pytest.raises(Exception):
+        async for _ in issues_service.initiate_review("abc.pdf", dummy_user, "2021-09-01"):
+            pass
+
+    assert reviews_repository.store_progress.call_args.args[0].status == "failed"
+
+
+@pytest.mark.asyncio
+async def test_resume_review_sends_missed_chunks_of_complete_review(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks resuming a complete review sends only the stored issues after the last event, one chunk per event """
+
+    mock_issues_repo.get_issues_after.return_value = [make_issue("a", 3), make_issue("b", 3), make_issue("c", 4)]
+    reviews_repository = AsyncMock()
+    reviews_repository.get_progress.return_value = ReviewProgress(
+        doc_id="abc.pdf", status="complete", chunks_done=4, chunks_total=4, last_event_id=4, updated_at_UTC="now"
+    )
+    review_coordinator = AsyncMock()
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, review_coordinator, reviews_repository)
+    chunks = [chunk async for chunk in issues_service.resume_review("abc.pdf", dummy_user, "2021-09-01", 2)]
+
+    assert [[issue.id for issue in chunk] for chunk in chunks] == [["a", "b"], ["c"]]
+    mock_issues_repo.get_issues_after.assert_called_once_with("abc.pdf", 2)
+    review_coordinator.review.assert_not_called()
+    mock_aml_client.call_aml_endpoint.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_resume_review_attaches_to_review_in_progress(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks resuming a review in progress attaches to it, skipping the chunks already sent """
+
+    mock_issues_repo.get_issues_after.return_value = [make_issue("c", 3)]
+    reviews_repository = AsyncMock()
+    reviews_repository.get_progress.return_value = ReviewProgress(
+        doc_id="abc.pdf", status="in_progress", chunks_done=3, last_event_id=3, updated_at_UTC="now"
+    )
+
+    async def running_review():
+        for chunk in [[make_issue("a", 1)], [make_issue("b", 2)], [make_issue("c", 3)], [make_issue("d", 4)]]:
+            yield chunk
+
+    review_coordinator = AsyncMock()
+    review_coordinator.review = lambda doc_id, start_review: running_review()
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, review_coordinator, reviews_repository)
+    chunks = [chunk async for chunk in issues_service.resume_review("abc.pdf", dummy_user, "2021-09-01", 2)]
+
+    assert [[issue.id for issue in chunk] for chunk in chunks] == [["c"], ["d"]]
+
+
+@pytest.mark.asyncio
+async def test_review_left_in_progress_by_crashed_worker_is_not_resumed(mock_issues_repo, mock_aml_client, dummy_user):
+    """
+    Checks a review recorded in progress that is no longer running (its worker crashed) is not attached to or started
+    again, and is recorded as failed
+    """
+
+    mock_issues_repo.get_issues_after.return_value = [make_issue("c", 3)]
+    reviews_repository = AsyncMock()
+    reviews_repository.get_progress.side_effect = lambda doc_id: ReviewProgress(
+        doc_id=doc_id, status="in_progress", chunks_done=3, last_event_id=3, updated_at_UTC="now"
+    )
+    review_coordinator = AsyncMock()
+    review_coordinator.is_reviewing.return_value = False
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, review_coordinator, reviews_repository)
+    assert not await issues_service.is_review_in_progress("abc.pdf")
+
+    chunks = []
+    with pytest.raises(RuntimeError, match="stopped before it completed"):
+        async for chunk in issues_service.resume_review("abc.pdf", dummy_user, "2021-09-01", 2):
+            chunks.append([issue.id for issue in chunk])
+
+    assert chunks == [["c"]]
+    review_coordinator.is_reviewing.assert_called_with("abc.pdf")
+    review_coordinator.review.assert_not_called()
+    mock_aml_client.call_aml_endpoint.assert_not_called()
+    assert reviews_repository.store_progress.call_args.args[0].status == "failed"
+
+
+@pytest.mark.asyncio
+async def test_review_document_queues_job_and_tails_stored_issues(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks a queued review is streamed from the stored issues until its job completes """
+
+    job = ReviewJob(doc_id="abc.pdf", user_oid="1234", time_stamp="2021-09-01", status="running")
+    job_queue = AsyncMock()
+    job_queue.enqueue.return_value = True
+    job_queue.get.side_effect = [job, job.model_copy(update={"status": "complete"})]
+    mock_issues_repo.get_issues_after.side_effect = [[make_issue("a", 1)], [make_issue("b", 2), make_issue("c", 3)]]
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, job_queue=job_queue)
+
+    with patch("services.issues_service.settings.review_follow_interval_seconds", 0):
+        stream = await issues_service.review_document("abc.pdf", dummy_user, "2021-09-01")
+        chunks = [chunk async for chunk in stream]
+
+    assert [[issue.id for issue in chunk] for chunk in chunks] == [["a"], ["b"], ["c"]]
+    assert [call.args for call in mock_issues_repo.get_issues_after.call_args_list] == [("abc.pdf", 0), ("abc.pdf", 1)]
+    assert job_queue.enqueue.call_args.args[0].user_oid == dummy_user.oid
+    mock_aml_client.call_aml_endpoint.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_review_job_starts_over_after_interrupted_attempt(mock_issues_repo, mock_aml_client):
+    """ Checks a retried job removes the issues of the interrupted attempt and numbers its events after them """
+
+    mock_issues_repo.get_issues.return_value = [make_issue("a", 1), make_issue("b", 2)]
+    mock_aml_client.call_aml_endpoint.return_value = AMLStreamMock([{"issues": []}])
+    reviews_repository = AsyncMock()
+    reviews_repository.get_progress.return_value = None
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client, reviews_repository=reviews_repository)
+    job = ReviewJob(doc_id="abc.pdf", user_oid="1234", time_stamp="2021-09-01", attempts=2)
+    await issues_service.run_review_job(job)
+
+    mock_issues_repo.delete_issues.assert_called_once_with("abc.pdf", ["a", "b"])
+    assert mock_issues_repo.store_issues.call_count == 1
+    assert reviews_repository.store_progress.call_args.args[0].last_event_id == 3
+
+
+@pytest.mark.asyncio
+async def test_accept_issue_updates_without_reading(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks accepting an issue is a single conditional update, without reading the issue first """
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client)
+    await issues_service.accept_issue("issue1", "abc.pdf", dummy_user, etag="etag1")
+
+    mock_issues_repo.get_issue.assert_not_called()
+    mock_issues_repo.store_issues.assert_not_called()
+    doc_id, issue_id, fields, etag = mock_issues_repo.update_issue.call_args.args
+    assert (doc_id, issue_id, etag) == ("abc.pdf", "issue1", "etag1")
+    assert fields["status"] == "accepted"
+    assert fields["resolved_by"] == dummy_user.oid
+
+
+@pytest.mark.asyncio
+async def test_update_issues_dismisses_in_one_call(mock_issues_repo, mock_aml_client, dummy_user):
+    """ Checks dismissing many issues is a single repository update with the dismissal fields """
+
+    issues_service = IssuesService(mock_issues_repo, mock_aml_client)
+    await issues_service.update_issues(
+        "abc.pdf", ["issue1", "issue2"], IssueActionEnum.dismiss, dummy_user,
+        dismissal_feedback=DismissalFeedbackModel(reason="not relevant")
+    )
+
+    doc_id, issue_ids, fields = mock_issues_repo.update_issues.call_args.args
+    assert (doc_id, issue_ids) == ("abc.pdf", ["issue1", "issue2"])
+    assert fields["status"] == "dismissed"
+    assert fields["dismissal_feedback"] == {"reason": "not relevant"}
@@ -0,0 +1,145 @@
+import pytest
+import asyncio
+from typing import Optional
+from unittest.mock import AsyncMock, MagicMock, patch
+from common.models import Issue, IssueStatusEnum, IssueType
+from services.review_coordinator import ReviewCoordinator
+
+
+def make_issue(issue_id: str, review_seq: Optional[int] = None) -> Issue:
+    return Issue(
+        id=issue_id,
+        doc_id="abc.pdf",
+        text="text",
+        type=IssueType.GrammarSpelling,
+        status=IssueStatusEnum.not_reviewed,
+        suggested_fix="fix",
+        explanation="explanation",
+        review_initiated_by="user",
+        review_initiated_at_UTC="2024-01-01T00:00:00",
+        review_seq=review_seq
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reviews_share_one_run(mock_issues_repo):
+    """ Checks a second review of the same document attaches to the first, replaying its chunks and tailing new ones """
+
+    first_chunk_sent = asyncio.Event()
+    release_second_chunk = asyncio.Event()
+    start_count = 0
+
+    async def start_review():
+        nonlocal start_count
+        start_count += 1
+        yield [make_issue("1")]
+        first_chunk_sent.set()
+        await release_second_chunk.wait()
+        yield [make_issue("2")]
+
+    coordinator = ReviewCoordinator(mock_issues_repo)
+    first_stream = coordinator.review("abc.pdf", start_review)
+    first_task = asyncio.create_task(anext(first_stream))
+    await first_chunk_sent.wait()
+
+    second_stream = coordinator.review("abc.pdf", start_review)
+    release_second_chunk.set()
+
+    first_issues = [(await first_task)[0].id] + [chunk[0].id async for chunk in first_stream]
+    second_issues = [chunk[0].id async for chunk in second_stream]
+
+    assert start_count == 1
+    assert first_issues == ["1", "2"]
+    assert second_issues == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_review_follows_other_worker_holding_lease(mock_issues_repo):
+    """ Checks a worker that cannot acquire the lease streams the issues stored by the other worker, without reviewing """
+
+    leases_repository = MagicMock()
+    leases_repository.acquire = AsyncMock(return_value=False)
+    leases_repository.is_held = AsyncMock(side_effect=[True, True, False])
+    # The second issue of event 1 is stored in a later batch than the first
+    mock_issues_repo.get_issues_after.side_effect = [
+        [make_issue("1", 1)],
+        [make_issue("1", 1), make_issue("2", 1), make_issue("3", 2)],
+        [make_issue("3", 2), make_issue("4", 3)],
+    ]
+    start_review = MagicMock()
+
+    coordinator = ReviewCoordinator(mock_issues_repo, leases_repository)
+    with patch('services.review_coordinator.settings.review_follow_interval_seconds', 0):
+        chunks = [[issue.id for issue in chunk] async for chunk in coordinator.review("abc.pdf", start_review)]
+
+    assert chunks == [["1"], ["2", "3"], ["4"]]
+    # Each poll only reads from the latest event seen
+    assert [call.args[1] for call in mock_issues_repo.get_issues_after.call_args_list] == [-1, 0, 1]
+    mock_issues_repo.get_issues.assert_not_called()
+    start_review.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_review_releases_lease_after_failure(mock_issues_repo):
+    """ Checks the error of a failed review reaches the stream, and the lease is released """
+
+    leases_repository = MagicMock()
+    leases_repository.acquire = AsyncMock(return_value=True)
+    leases_repository.release = AsyncMock()
+    mock_issues_repo.get_issues.return_value = []
+
+    async def start_review():
+        raise ValueError("Expected Test Error")
+        yield
+
+    coordinator = ReviewCoordinator(mock_issues_repo, leases_repository)
+    with pytest.raises(ValueError):
+        [chunk async for chunk in coordinator.review("abc.pdf", start_review)]
+
+    leases_repository.release.assert_called_once_with("review:abc.pdf", coordinator.owner)
+
+
+@pytest.mark.asyncio
+async def test_review_stops_after_losing_lease(mock_issues_repo):
+    """ Checks a review whose lease could not be renewed is stopped, as another worker may be reviewing the document """
+
+    leases_repository = MagicMock()
+    leases_repository.acquire = AsyncMock(return_value=True)
+    leases_repository.renew = AsyncMock(return_value=False)
+    leases_repository.release = AsyncMock(return_value=False)
+    mock_issues_repo.get_issues.return_value = []
+    stopped = asyncio.Event()
+
+    async def start_review():
+        yield [make_issue("1")]
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            stopped.set()
+            raise
+        yield [make_issue("2")]
+
+    coordinator = ReviewCoordinator(mock_issues_repo, leases_repository)
+    chunks = []
+    with patch('services.review_coordinator.settings.review_lease_ttl_seconds', 0.03):
+        with pytest.raises(RuntimeError, match="lease was lost"):
+            async for chunk in coordinator.review("abc.pdf", start_review):
+                chunks.append([issue.id for issue in chunk])
+
+    assert chunks == [["1"]]
+    assert stopped.is_set()
+
+
+@pytest.mark.asyncio
+async def test_is_reviewing_checks_local_runs_and_lease(mock_issues_repo):
+    """ Checks a document is being reviewed if it is reviewed on this worker, or another worker holds its lease """
+
+    leases_repository = MagicMock()
+    leases_repository.is_held = AsyncMock(return_value=False)
+    coordinator = ReviewCoordinator(mock_issues_repo, leases_repository)
+
+    assert not await coordinator.is_reviewing("abc.pdf")
+    leases_repository.is_held.assert_called_once_with("review:abc.pdf")
+
+    leases_repository.is_held.return_value = True
+    assert await coordinator.is_reviewing("abc.pdf")
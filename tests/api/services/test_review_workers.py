@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from common.models import ReviewJob
+from database.job_queue import InMemoryJobQueue
+from services.review_workers import ReviewWorkerPool
+
+
+@pytest.fixture(autouse=True)
+def fast_retries():
+    with patch("services.review_workers.settings") as mock_settings:
+        mock_settings.review_queue_poll_interval_seconds = 0.01
+        mock_settings.review_job_retry_delay_seconds = 0.01
+        mock_settings.review_job_visibility_timeout_seconds = 60
+        mock_settings.review_job_max_attempts = 2
+        yield mock_settings
+
+
+async def wait_for_status(queue: InMemoryJobQueue, doc_id: str, status: str) -> ReviewJob:
+    for _ in range(100):
+        job = await queue.get(doc_id)
+        if job.status == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job for {doc_id} did not reach status {status}")
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_failed_job():
+    """ Checks a job that fails is retried, and completes once it succeeds """
+
+    queue = InMemoryJobQueue()
+    attempts = []
+
+    async def run_job(job: ReviewJob):
+        attempts.append(job.attempts)
+        if job.attempts == 1:
+            raise RuntimeError("Flow endpoint unavailable")
+
+    pool = ReviewWorkerPool(queue, run_job, workers=2)
+    pool.start()
+    try:
+        await queue.enqueue(ReviewJob(doc_id="a.pdf", user_oid="1234", time_stamp="2021-09-01"))
+        await wait_for_status(queue, "a.pdf", "complete")
+    finally:
+        await pool.close()
+
+    assert attempts == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_worker_fails_job_after_max_attempts():
+    """ Checks a job that keeps failing is marked as failed with its error """
+
+    queue = InMemoryJobQueue()
+
+    async def run_job(job: ReviewJob):
+        raise RuntimeError("Bad document")
+
+    pool = ReviewWorkerPool(queue, run_job, workers=1)
+    pool.start()
+    try:
+        await queue.enqueue(ReviewJob(doc_id="a.pdf", user_oid="1234", time_stamp="2021-09-01"))
+        job = await wait_for_status(queue, "a.pdf", "failed")
+    finally:
+        await pool.close()
+
+    assert (job.attempts, job.error) == (2, "Bad document")
+
+
+@pytest.mark.asyncio
+async def test_worker_stops_job_after_losing_claim(fast_retries):
+    """ Checks a worker whose heartbeats stalled stops its review once another worker has claimed the job """
+
+    fast_retries.review_job_visibility_timeout_seconds = 0.03
+    queue = InMemoryJobQueue(visibility_timeout_seconds=60)
+    cancelled = asyncio.Event()
+
+    async def run_job(job: ReviewJob):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    await queue.enqueue(ReviewJob(doc_id="a.pdf", user_oid="1234", time_stamp="2021-09-01"))
+    stalled_job = await queue.claim()
+    pool = ReviewWorkerPool(queue, run_job, workers=0)
+    run = asyncio.create_task(pool._run(stalled_job))
+
+    # Another worker claims the job, as if the heartbeats had timed out
+    queue.visibility_timeout_seconds = 0
+    job = await queue.claim()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await run
+
+    stored = await queue.get("a.pdf")
+    assert (stored.status, stored.claim_id) == ("running", job.claim_id)
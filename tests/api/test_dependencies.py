@@ -0,0 +1,37 @@
+import pytest
+from azure.cosmos.aio import CosmosClient
+from dependencies import _connection_pool_stats
+from services.aml_client import create_http_client
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_stats_of_http_client():
+    """ Checks the httpx pool internals read for the stats are still where the installed httpx keeps them """
+
+    client = create_http_client()
+
+    assert _connection_pool_stats(client, 100) == {"active": 0, "idle": 0, "limit": 100}
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_stats_of_cosmos_client():
+    """ Checks the aiohttp pool internals read for the stats are still where the installed SDK keeps them """
+
+    client = CosmosClient("https://localhost:8081/", credential="a2V5")
+    assert _connection_pool_stats(client) == {}
+
+    # Opens the transport's aiohttp session without connecting to the account
+    await client.client_connection.pipeline_client.__aenter__()
+
+    assert _connection_pool_stats(client) == {"active": 0, "idle": 0, "limit": 100}
+    await client.close()
+
+
+def test_connection_pool_stats_fall_back_to_limit():
+    """ Checks only the configured limit is reported when the pool internals can't be found """
+
+    class Client:
+        pass
+
+    assert _connection_pool_stats(Client(), 100) == {"limit": 100}
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+import pytest
+
+# The flow nodes import promptflow, which is only installed with the flow requirements
+pytest.importorskip("promptflow")
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "flows" / "ai_doc_review" / "agent_template"))
@@ -0,0 +1,77 @@
+import json
+from typing import Generator
+from common.models import AllCombinedIssues, AllSingleShotIssues
+from merge import merge_singleshot_fields_with_consolidator
+
+
+def single_shot_issue(comment_id: str, text: str) -> dict:
+    return {
+        "type": "Grammar & Spelling",
+        "location": {"source_sentence": f"The {text}.", "page_num": 1, "bounding_box": [0, 0, 1, 1], "para_index": 0},
+        "text": text,
+        "explanation": "explanation",
+        "suggested_fix": "fix",
+        "comment_id": comment_id,
+    }
+
+
+def consolidator_issue(comment_id: str, suggested_action: str = "KEEP") -> dict:
+    return {
+        "comment_id": comment_id,
+        "score": 5,
+        "suggested_action": suggested_action,
+        "reason_for_suggested_action": "reason",
+    }
+
+
+AGG_OUTPUTS = AllSingleShotIssues.model_validate(
+    {"issues": [single_shot_issue("0", "teh"), single_shot_issue("1", "recieve"), single_shot_issue("2", "adress")]}
+)
+CONSOLIDATOR_OUTPUT = json.dumps(
+    {"issues": [consolidator_issue("0"), consolidator_issue("1", "REMOVE"), consolidator_issue("2")]}
+)
+
+
+def stream(text: str, size: int = 7) -> Generator[str, None, None]:
+    """Streams text in fragments, like a streamed consolidator response."""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def test_merge_streamed_consolidator_output():
+    """ Checks a streamed consolidator response is merged into fragments of the JSON text of AllCombinedIssues """
+
+    output = merge_singleshot_fields_with_consolidator(AGG_OUTPUTS.model_dump_json(), stream(CONSOLIDATOR_OUTPUT))
+
+    assert isinstance(output, Generator)
+    merged = AllCombinedIssues.model_validate_json("".join(output))
+    assert [(issue.comment_id, issue.text) for issue in merged.issues] == [("0", "teh"), ("2", "adress")]
+
+
+def test_merge_streamed_consolidator_output_is_lazy():
+    """ Checks each issue is emitted as soon as the consolidator has streamed it """
+
+    fragments = iter(stream(CONSOLIDATOR_OUTPUT))
+    output = merge_singleshot_fields_with_consolidator(AGG_OUTPUTS, fragments)
+
+    assert next(output) == '{"issues":['
+    assert json.loads(next(output))["comment_id"] == "0"
+    assert next(fragments, None) is not None
+
+
+def test_merge_consolidator_output():
+    """ Checks a complete consolidator response is merged into the JSON text of AllCombinedIssues """
+
+    output = merge_singleshot_fields_with_consolidator(AGG_OUTPUTS, [CONSOLIDATOR_OUTPUT])
+
+    merged = AllCombinedIssues.model_validate_json(output)
+    assert [issue.comment_id for issue in merged.issues] == ["0", "2"]
+
+
+def test_merge_agg_outputs_as_object_or_json():
+    """ Checks the aggregated issues are merged the same way whether passed as an object or as JSON text """
+
+    from_object = merge_singleshot_fields_with_consolidator(AGG_OUTPUTS, [CONSOLIDATOR_OUTPUT])
+    from_json = merge_singleshot_fields_with_consolidator(AGG_OUTPUTS.model_dump_json(), [CONSOLIDATOR_OUTPUT])
+
+    assert from_object == from_json